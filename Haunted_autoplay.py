@@ -0,0 +1,504 @@
+import sys
+import time
+
+import Haunted_house as house
+import Haunted_env as env_module
+
+# Expectimax autoplayer - a reference player for balance testing.
+# It plans over a small model of the rules built from the game's own data (the
+# compiled world tables and the encounter tables), so the odds it plans with are
+# the real ones: max over the player's choices, average over the dice. States are
+# tuples kept in a transposition table, and the search deepens one move at a time
+# until its time budget runs out. At the edge of the search a quick estimate
+# stands in for the rest of the game.
+# The model has the hauntings too - the sanity drain, the crucifix going cold, the
+# dark figure waking and both ghosts hunting the player, and the music box playing
+# again after it's wound - in the order GameState's timer heap runs them. Each
+# value is the chance of winning from there. Only the choice between moves that
+# are equally likely to win looks at a discounted score, which favours winning sooner.
+# The moves themselves are played through HauntedHouseEnv, so whole games run on
+# the real GameState. play_games() reports the real wins next to the chances.
+
+# Fields of a planning state, in tuple order. TURN is the turn count until the dark
+# figure wakes, and after that only counts round the sanity drain; MOVES is how
+# many turns until the ghosts next move (0 with none roaming); GHOSTS is a tuple of
+# (kind, room) in the order they woke; MUSIC is how many turns until the music box
+# plays (0 if it isn't wound) and TURNED how many times it's waiting in the Kids Bedroom
+ROOM, LIVES, SANITY, TURN, PROTECT, INVENTORY, TAKEN, RESTED, FLAGS, MOVES, GHOSTS, MUSIC, TURNED = range(13)
+FLAG_BOX, FLAG_TAPE = 1, 2
+
+ITEM_BITS = {item: 1 << i for i, item in enumerate(house.all_items)}
+BOSS_ITEMS = ("knife", "crucifix", "ancient book")
+DOOR_KEY = "rusty key"
+
+# The encounter each room action rolls on
+ACTION_ENCOUNTERS = {"search_kitchen": "cupboard", "search_wardrobe": "wardrobe", "meditate": "meditate"}
+
+WIN, LOSS = 1.0, 0.0
+
+# Each turn a win is put off knocks a little off its score. The score only breaks
+# ties between moves with the same chance of winning, so the player doesn't dawdle
+# when winning now and later are as likely
+TURN_DISCOUNT = 0.995
+TIE = 1e-9  # chances closer than this count as the same
+
+# Most states the transposition table holds before it's emptied and starts again
+TABLE_LIMIT = 500_000
+
+
+class Timeout(Exception):
+    pass
+
+
+class ExpectimaxPlayer:
+    def __init__(self, budget=0.02, max_depth=12):
+        self.budget = budget        # seconds to think about each move
+        self.max_depth = max_depth
+        self.table = {}             # state -> (depth searched, chance, score, best action)
+        self.nodes = 0
+        self.deadline = None
+        world = house.world
+
+        # What each encounter can do, with the real odds. Outcomes with the same
+        # effect are merged, so there are fewer branches to average over
+        self.encounters = {}
+        for name, table in house.encounter_tables.items():
+            if table.conditional:
+                raise ValueError(f"Encounter '{name}' has conditions, which the planner can't model")
+            total = sum(outcome["weight"] for outcome in table.outcomes)
+            odds = {}
+            for outcome in table.outcomes:
+                effect = tuple(outcome["effect"][:2])
+                odds[effect] = odds.get(effect, 0) + outcome["weight"] / total
+            self.encounters[name] = [(chance, effect) for effect, chance in odds.items()]
+
+        # Where every item comes from: a room to examine something in, or an encounter
+        self.item_rooms = {}
+        for obj_id, items in enumerate(world.object_items):
+            for item in items:
+                self.item_rooms[house.all_items[item]] = world.object_room[obj_id]
+        self.item_encounters = {}
+        for action, name in ACTION_ENCOUNTERS.items():
+            room_name = next(room for room, (_, code) in house.ROOM_ACTIONS.items() if code == action)
+            for chance, (effect, item) in self.encounters[name]:
+                if effect == "add_item":
+                    self.item_rooms[item] = world.room_ids[room_name]
+                    self.item_encounters[item] = name
+        self.searching = {}  # (items still to find, lives, protected, sanity in fifths) -> chance of finding them
+        self.basement = world.room_ids["Basement"]
+        self.lairs = {kind: world.room_ids[ghost["lair"]] for kind, ghost in house.GHOSTS.items()}
+        self.kids_bedroom = world.room_ids["Kids Bedroom"]
+
+        # Every move worth considering in each room, as (env action number, kind, argument).
+        # Looking at things that do nothing, the map/inventory/stats screens and the
+        # garden door only ever cost time or sanity, so they're left out. Things that
+        # hurt you when you look at them stay in, so the model knows what they cost
+        self.moves = []
+        for room_id, room in enumerate(house.all_rooms):
+            moves = []
+            for direction, _ in world.neighbors[room_id]:
+                moves.append((env_module.ACTIONS.index(("move", direction)), "move", direction))
+            for slot, obj_name in enumerate(room.objects):
+                obj_id = world.object_ids[room_id][obj_name]
+                does_something = (world.object_items[obj_id] or world.object_health[obj_id] is not None
+                                  or world.object_haunting[obj_id])
+                if does_something and not world.object_action[obj_id]:
+                    moves.append((env_module.ACTIONS.index(("examine", slot)), "examine", obj_id))
+            for _, code in world.main_menu[room_id]:
+                if code in ACTION_ENCOUNTERS or code in ("cassette_player", "use_crowbar", "use_key"):
+                    moves.append((env_module.ACTIONS.index(("action", code)), "action", code))
+            moves.append((env_module.ACTIONS.index(("action", "rest")), "action", "rest"))
+            self.moves.append(moves)
+
+    def state_of(self, game, rooms):
+        # The planning state for a real game
+        world = house.world
+        taken = 0
+        for obj_id, items in enumerate(world.object_items):
+            if items:
+                room = rooms[world.object_room[obj_id]]
+                if not room.objects[world.object_names[obj_id]]["items"]:
+                    taken |= 1 << obj_id
+        protect = 0
+        if game.crucifix_protect:
+            fades = [turn for turn, _, event, _, _ in game.timers if event == "crucifix_fades"]
+            protect = min(fades) - game.turn_count if fades else house.CRUCIFIX_TURNS
+        rested = 0
+        for name in game.used_life_bonus:
+            rested |= 1 << world.room_ids[name]
+        flags = (FLAG_BOX if game.locked_box_opened else 0) | (FLAG_TAPE if "tape_played" in game.notes_read else 0)
+        inventory = 0
+        for item in game.inventory:
+            inventory |= ITEM_BITS.get(item, 0)
+        due = {}
+        for turn, _, event, _, _ in game.timers:
+            due[event] = min(due.get(event, turn), turn)
+        moves = due["ghosts_move"] - game.turn_count if "ghosts_move" in due else 0
+        music = due["music_box"] - game.turn_count if "music_box" in due else 0
+        turned = sum(1 for event, _ in game.room_triggers.get("Kids Bedroom", ()) if event == "music_box_turned")
+        return (game.current_room.id, game.lives, game.sanity, self.turn_of(game.turn_count), protect,
+                inventory, taken, rested, flags, moves, tuple(zip(game.ghost_kinds, game.ghost_rooms)),
+                music, turned)
+
+    def turn_of(self, turn):
+        # A turn count as TURN holds it - past the dark figure waking, only where it
+        # is in the sanity drain's cycle matters
+        woken, every = house.DARK_FIGURE_TURN, house.SANITY_DRAIN_EVERY
+        return turn if turn <= woken + every else woken + 1 + (turn - woken - 1) % every
+
+    # The rules, on a list copy of a state. Each returns False once the game is lost
+    def lose_sanity(self, s, amount):
+        s[SANITY] -= amount
+        return s[SANITY] > 0
+
+    def gain_sanity(self, s, amount):
+        s[SANITY] = min(100, s[SANITY] + amount)
+        return True
+
+    def lose_life(self, s, amount):
+        if s[PROTECT]:
+            s[PROTECT] = 0
+            return self.gain_sanity(s, 15)
+        s[LIVES] -= amount
+        return self.lose_sanity(s, 15) and s[LIVES] > 0
+
+    def gain_life(self, s, amount):
+        bit = 1 << s[ROOM]
+        if not s[RESTED] & bit:
+            s[RESTED] |= bit
+            s[LIVES] = min(5, s[LIVES] + amount)
+            self.gain_sanity(s, 10)
+        return True
+
+    def add_item(self, s, item):
+        bit = ITEM_BITS[item]
+        if not s[INVENTORY] & bit:
+            s[INVENTORY] |= bit
+            self.gain_sanity(s, 5)
+            if item == "crucifix":
+                s[PROTECT] = house.CRUCIFIX_TURNS
+        return True
+
+    def has(self, s, item):
+        return bool(s[INVENTORY] & ITEM_BITS[item])
+
+    def spawn_ghost(self, s, kind):
+        s[GHOSTS] += ((kind, self.lairs[kind]),)
+        if not s[MOVES]:
+            s[MOVES] = house.GHOSTS_MOVE_EVERY
+
+    def useful_moves(self, state):
+        # The room's moves, less the ones that can't do anything any more
+        for move in self.moves[state[ROOM]]:
+            _, kind, arg = move
+            if kind == "examine" and state[TAKEN] >> arg & 1:
+                continue
+            if arg == "rest" and state[RESTED] >> state[ROOM] & 1:
+                continue  # resting twice isn't on the menu at all
+            if arg == "cassette_player" and (state[FLAGS] & FLAG_TAPE or not self.has(state, "cassette tape")):
+                continue
+            if arg == "use_crowbar" and (state[FLAGS] & FLAG_BOX or not self.has(state, "crowbar")):
+                continue
+            if arg == "use_key" and not self.has(state, DOOR_KEY):
+                continue
+            yield move
+
+    def outcomes(self, state, move):
+        # Every way a move can turn out: a list of (chance, next state), where a next
+        # state of WIN or LOSS means the game ended
+        _, kind, arg = move
+        s = list(state)
+        if kind == "move":
+            s[ROOM] = house.world.neighbors[s[ROOM]][[d for d, _ in house.world.neighbors[s[ROOM]]].index(arg)][1]
+            return [(1.0, self.end_turn(s))]
+        if kind == "examine":
+            world = house.world
+            haunting = world.object_haunting[arg]
+            if haunting:
+                event, delay = haunting
+                if event != "music_box":
+                    raise ValueError(f"Examining sets off '{event}', which the planner can't model")
+                if not s[MUSIC]:
+                    s[MUSIC] = delay
+            health = world.object_health[arg]
+            if health is not None:
+                s[LIVES] = max(0, min(5, s[LIVES] + health))
+                if s[LIVES] <= 0:
+                    return [(1.0, LOSS)]
+            if world.object_items[arg]:
+                s[TAKEN] |= 1 << arg
+            for item in world.object_items[arg]:
+                self.add_item(s, house.all_items[item])
+            return [(1.0, self.end_turn(s))]
+        if arg in ACTION_ENCOUNTERS:
+            results = []
+            for chance, (effect, amount) in self.encounters[ACTION_ENCOUNTERS[arg]]:
+                branch = list(state)
+                alive = getattr(self, effect)(branch, amount)
+                results.append((chance, self.end_turn(branch) if alive else LOSS))
+            return results
+        if arg == "rest":
+            self.gain_life(s, 1)
+        elif arg == "cassette_player":
+            if not self.has(s, "cassette tape"):
+                if not self.lose_sanity(s, 2):
+                    return [(1.0, LOSS)]
+            elif not s[FLAGS] & FLAG_TAPE:
+                s[FLAGS] |= FLAG_TAPE
+                self.gain_sanity(s, 20)
+        elif arg == "use_crowbar":
+            if not s[FLAGS] & FLAG_BOX:
+                if not self.has(s, "crowbar"):
+                    if not self.lose_sanity(s, 5):
+                        return [(1.0, LOSS)]
+                else:
+                    s[FLAGS] |= FLAG_BOX
+                    self.spawn_ghost(s, "whispering shade")
+                    self.gain_sanity(s, 5)  # Graeme's journal
+                    self.add_item(s, "old photograph")
+        elif arg == "use_key":
+            if not self.has(s, DOOR_KEY):
+                return [(1.0, self.end_turn(s) if self.lose_sanity(s, 3) else LOSS)]
+            return [(1.0, self.boss_fight(s))]
+        return [(1.0, self.end_turn(s))]
+
+    def boss_fight(self, s):
+        if all(self.has(s, item) for item in BOSS_ITEMS):
+            return WIN
+        if self.has(s, "knife") and self.has(s, "crucifix"):
+            self.lose_life(s, 2)
+            return WIN if s[LIVES] > 0 else LOSS
+        return LOSS
+
+    def end_turn(self, s):
+        # The end of the turn and the start of the next, as passive_sanity_drain has it:
+        # the music box waiting in the room you're in, then the timers that are due in
+        # the order they went into the heap - the crucifix going cold (set CRUCIFIX_TURNS
+        # ago), the dark figure waking (set at the start), the music box (6 turns ago),
+        # the sanity drain (5) and the ghosts moving (2)
+        if s[LIVES] <= 0 or s[SANITY] <= 0:
+            return LOSS
+        turn = self.turn_of(s[TURN] + 1)
+        s[TURN] = turn
+        if s[ROOM] == self.kids_bedroom and s[TURNED]:
+            alive = self.lose_sanity(s, 3 * s[TURNED])
+            s[TURNED] = 0
+            if not alive:
+                return LOSS
+        ghosts_move = False
+        if s[MOVES]:
+            s[MOVES] -= 1
+            if not s[MOVES]:
+                ghosts_move = True
+                s[MOVES] = house.GHOSTS_MOVE_EVERY
+        if s[PROTECT]:
+            s[PROTECT] -= 1
+        if turn == house.DARK_FIGURE_TURN:
+            self.spawn_ghost(s, "dark figure")
+        if s[MUSIC]:
+            s[MUSIC] -= 1
+            if not s[MUSIC]:
+                s[TURNED] += 1
+                if not self.lose_sanity(s, 5):
+                    return LOSS
+        if turn % house.SANITY_DRAIN_EVERY == 0 and not self.lose_sanity(s, 2):
+            return LOSS
+        if ghosts_move and not self.ghosts_move(s):
+            return LOSS
+        return tuple(s)
+
+    def ghosts_move(self, s):
+        # Every ghost steps towards the player; any that reach them strike and go home
+        step = house.world.next_step[s[ROOM]]
+        ghosts = [(kind, step[room]) for kind, room in s[GHOSTS]]
+        alive = True
+        for i, (kind, room) in enumerate(ghosts):
+            if room != s[ROOM]:
+                continue
+            ghosts[i] = (kind, self.lairs[kind])
+            effect, amount = house.GHOSTS[kind]["effect"][:2]
+            if not getattr(self, effect)(s, amount):
+                alive = False
+                break
+        s[GHOSTS] = tuple(ghosts)
+        return alive
+
+    def value(self, after, depth):
+        # (chance of winning, score) for a state reached this turn
+        if after == WIN or after == LOSS:
+            return after, after
+        chance, score, _ = self.search(after, depth)
+        return chance, TURN_DISCOUNT * score
+
+    def expect(self, state, move, depth):
+        # (chance of winning, score) for making a move, averaged over how it turns out
+        chance = score = 0.0
+        for odds, after in self.outcomes(state, move):
+            after_chance, after_score = self.value(after, depth - 1)
+            chance += odds * after_chance
+            score += odds * after_score
+        return chance, score
+
+    def estimate(self, state):
+        # (chance, score) for a state the search didn't get past. The chance is the
+        # chance of searching out the items only encounters give before the lives or
+        # sanity run out, with the sanity the walk to everything still needed drains.
+        # The score also counts the walk itself, so nearer is better
+        missing = [item for item in BOSS_ITEMS + (DOOR_KEY,) if not self.has(state, item)]
+
+        # Nearest-first walk round the rooms still to visit, then down to the basement
+        distance = house.world.distance
+        room, walk = state[ROOM], 0
+        targets = {self.item_rooms[item] for item in missing}
+        while targets:
+            nearest = min(targets, key=lambda target: distance[target][room])
+            walk += max(distance[nearest][room], 0)
+            room = nearest
+            targets.discard(nearest)
+        walk += max(distance[self.basement][room], 0)
+
+        wanted = frozenset(item for item in missing if item in self.item_encounters)
+        sanity = 5 * state[SANITY] - 2 * walk
+        chance = self.search_odds(wanted, state[LIVES], bool(state[PROTECT]), sanity) if sanity > 0 else 0.0
+        return chance, chance * (1 - 0.002 * walk)
+
+    def search_odds(self, wanted, lives, protected, sanity):
+        # Chance of finding every item in wanted by searching for them, picking the best
+        # encounter to try each time. Sanity is in fifths, so each try can pay the drain
+        # (2 sanity every SANITY_DRAIN_EVERY turns) as a whole number. Every outcome
+        # finds something, costs a life or the crucifix, or costs sanity, so this always
+        # gets to the end
+        if not wanted:
+            return 1.0
+        key = (wanted, lives, protected, sanity)
+        known = self.searching.get(key)
+        if known is not None:
+            return known
+        drain = 10 // house.SANITY_DRAIN_EVERY
+        best = 0.0
+        for name in {self.item_encounters[item] for item in wanted}:
+            chance = 0.0
+            for odds, (effect, amount) in self.encounters[name]:
+                after = (wanted, lives, protected, sanity - drain)
+                if effect == "lose_life":
+                    if protected:
+                        after = (wanted, lives, False, min(500, sanity + 75) - drain)
+                    else:
+                        after = (wanted, lives - amount, protected, sanity - 75 - drain)
+                elif effect == "lose_sanity":
+                    after = (wanted, lives, protected, sanity - 5 * amount - drain)
+                elif effect == "gain_sanity":
+                    continue  # not in the tables searched for items - it would never end
+                elif effect == "add_item" and amount in wanted:
+                    after = (wanted - {amount}, lives, protected or amount == "crucifix",
+                             min(500, sanity + 25) - drain)
+                if after[1] > 0 and after[3] > 0:
+                    chance += odds * self.search_odds(*after)
+            best = max(best, chance)
+        self.searching[key] = best
+        return best
+
+    def search(self, state, depth):
+        # Expectimax (chance of winning, score, best move) for a state, looking depth moves ahead
+        if state == WIN or state == LOSS:
+            return state, state, None
+        if depth == 0:
+            return self.estimate(state) + (None,)
+        known = self.table.get(state)
+        if known and known[0] >= depth:
+            return known[1:]
+        self.nodes += 1
+        if self.nodes & 255 == 0 and time.perf_counter() > self.deadline:
+            raise Timeout
+        best, best_score, best_move = -1.0, -1.0, None
+        for move in self.useful_moves(state):
+            chance, score = self.expect(state, move, depth)
+            if chance > best + TIE or (chance > best - TIE and score > best_score):
+                best, best_score, best_move = chance, score, move
+        self.table[state] = (depth, best, best_score, best_move)
+        return best, best_score, best_move
+
+    def choose(self, state):
+        # (env action number, its chance of winning, depth reached) for a state.
+        # Deepens one move at a time until the budget is spent; values from the
+        # shallower searches stay in the table and are used again
+        if len(self.table) > TABLE_LIMIT:
+            self.table.clear()
+        self.deadline = time.perf_counter() + self.budget
+        chance, _, move = self.search(state, 1)
+        reached = 1
+        for depth in range(2, self.max_depth + 1):
+            try:
+                chance, _, move = self.search(state, depth)
+                reached = depth
+            except Timeout:
+                break
+            if chance in (WIN, LOSS):
+                break  # the outcome is certain already
+        return move[0], chance, reached
+
+    def decisions(self, state):
+        # The chance of winning with each move on offer - for looking at a position.
+        # Deepens like choose, and gives the chances from the deepest search that finished in time
+        self.deadline = time.perf_counter() + self.budget * 10
+        results = []
+        for depth in range(1, self.max_depth + 1):
+            try:
+                results = [(env_module.ACTIONS[move[0]], self.expect(state, move, depth)[0])
+                           for move in self.useful_moves(state)]
+            except Timeout:
+                break
+        return sorted(results, key=lambda result: -result[1])
+
+
+def play_game(player, env, seed=None, max_turns=300, log=None):
+    # Play one whole game on the real rules. Returns (won, turns, opening chance, seconds per move)
+    env.reset(seed)
+    first = None
+    thinking = 0.0
+    moves = 0
+    while True:
+        state = player.state_of(env.game, env.rooms)
+        start = time.perf_counter()
+        action, chance, depth = player.choose(state)
+        thinking += time.perf_counter() - start
+        moves += 1
+        if first is None:
+            first = chance
+        if log:
+            log(f"turn {env.game.turn_count:3}  {house.world.room_names[state[ROOM]]:18} "
+                f"{str(env_module.ACTIONS[action]):32} win {chance:.3f}  depth {depth}")
+        _, _, terminated, truncated, info = env.step(action)
+        if terminated or truncated or moves >= max_turns:
+            return info["won"], env.game.turn_count, first, thinking / moves
+
+def play_games(games=50, seed=0, budget=0.02):
+    # Win rate over many games, next to the player's average opening chance of winning
+    player = ExpectimaxPlayer(budget)
+    env = env_module.HauntedHouseEnv()
+    results = [play_game(player, env, seed + game) for game in range(games)]
+    return {
+        "won": sum(won for won, _, _, _ in results) / games,
+        "expected": sum(first for _, _, first, _ in results) / games,
+        "turns": sum(turns for _, turns, _, _ in results) / games,
+        "ms per move": 1000 * sum(per_move for _, _, _, per_move in results) / games,
+    }
+
+
+if __name__ == "__main__":
+    player = ExpectimaxPlayer()
+    env = env_module.HauntedHouseEnv()
+    won, turns, _, per_move = play_game(player, env, seed=1, log=print)
+    print(f"\n{'Won' if won else 'Lost'} after {turns} turns, {per_move * 1000:.1f} ms per move\n")
+
+    env.reset(2)
+    state = player.state_of(env.game, env.rooms)
+    player.choose(state)
+    print("Opening moves:")
+    for action, chance in player.decisions(state):
+        print(f"  {str(action):32} win {chance:.3f}")
+
+    print("\nOver 50 games:")
+    for name, value in play_games().items():
+        print(f"  {name:12} {value:.3f}")
+    sys.exit(0)
@@ -0,0 +1,217 @@
+import sys
+import time
+import random
+
+import numpy as np
+
+import Haunted_house as house
+
+# Gym-style environment for training automated players.
+# Each environment has its own copy of the house, so nothing touches the
+# module-global rooms, and reset() puts the rooms back from a snapshot instead
+# of building them again. Actions are plain integers and observations are
+# small NumPy arrays. All game text is thrown away.
+
+# Every direction handle_movement_menu knows about
+DIRECTIONS = ["north", "south", "east", "west", "up", "down"]
+
+# Most objects any room has - examine actions pick an object by its slot in the room
+MAX_OBJECTS = max(len(room.objects) for room in house.all_rooms)
+
+def collect_action_codes(rooms):
+    # Every action code show_room_menu can offer, in the order they first appear.
+    # movement and examine are left out - they have their own actions below
+    codes = []
+    for room in rooms:
+        for _, code in house.show_room_menu(house.GameState(room)):
+            if code not in codes and code not in ("movement", "examine"):
+                codes.append(code)
+    return codes
+
+ACTION_CODES = collect_action_codes(house.all_rooms)
+
+# The whole action space - (kind, argument) for each action number
+ACTIONS = (
+    [("move", direction) for direction in DIRECTIONS]
+    + [("examine", slot) for slot in range(MAX_OBJECTS)]
+    + [("action", code) for code in ACTION_CODES]
+)
+
+# What each number in an observation means
+OBSERVATION_FIELDS = [
+    "room", "lives", "sanity", "turn_count", "inventory",
+    "visited", "rested", "notes_read", "flags"
+]
+
+# Bits in the "flags" field
+FLAG_CRUCIFIX, FLAG_BOX_OPENED, FLAG_BOSS_DEFEATED, FLAG_ESCAPED, FLAG_TAPE_PLAYED = (1 << i for i in range(5))
+
+ITEM_BITS = {item: 1 << i for i, item in enumerate(house.all_items)}
+HESITATION = "Hesitation. Every second counts. The house is watching."
+
+
+class HauntedHouseEnv:
+    def __init__(self, max_turns=500):
+        self.max_turns = max_turns
+        self.action_count = len(ACTIONS)
+        self.observation_size = len(OBSERVATION_FIELDS)
+
+        # Our own house, plus a snapshot of it to reset back to
+        self.rooms = house.clone_world(house.all_rooms)
+        self.start_room = self.rooms[0]
+        self.world_snapshot = house.snapshot_world(self.rooms)
+        self.room_ids = {room.name: i for i, room in enumerate(self.rooms)}
+        self.room_bits = {room.name: 1 << i for i, room in enumerate(self.rooms)}
+
+        # What each room offers never changes, so work it out once
+        self.object_names = [list(room.objects) for room in self.rooms]
+        self.room_codes = []
+        for room in self.rooms:
+            codes = {code for _, code in house.show_room_menu(house.GameState(room))}
+            codes.discard("rest")  # rest depends on the game, checked each turn
+            self.room_codes.append(codes)
+
+        self.rng = random.Random()
+        self.game = None
+        self.context = house.headless_context()
+        self.inventory_masks = {}
+        self.legal_cache = {}
+
+    def reset(self, seed=None):
+        # Start a new game. Returns (observation, info)
+        if seed is not None:
+            self.rng.seed(seed)
+        house.restore_world(self.world_snapshot)
+        self.game = house.GameState(self.start_room, rng=self.rng)
+        self.visited_mask = self.rested_mask = 0
+        self.visited_seen = self.rested_seen = 0
+        self.context.run(self.start_turn)
+        return self.observe(), {}
+
+    def start_turn(self):
+        # The start of every game_loop turn - mark the room visited and drain sanity
+        self.game.update_room_visit()
+        self.game.passive_sanity_drain()
+
+    def is_legal(self, action):
+        # Whether the action is on offer in the current room's menus
+        kind, arg = ACTIONS[action]
+        room = self.game.current_room
+        if kind == "move":
+            return arg in room.neighbors
+        if kind == "examine":
+            return arg < len(room.objects)
+        if arg == "rest":
+            return room.name not in self.game.used_life_bonus
+        return arg in self.room_codes[self.room_ids[room.name]]
+
+    def legal_actions(self):
+        # List of the action numbers that are legal right now. It only depends on
+        # the room and whether you've rested there, so each answer is kept
+        room = self.game.current_room
+        key = (room.name, room.name in self.game.used_life_bonus)
+        legal = self.legal_cache.get(key)
+        if legal is None:
+            legal = [action for action in range(self.action_count) if self.is_legal(action)]
+            self.legal_cache[key] = legal
+        return legal
+
+    def action_mask(self):
+        # Bool array of the actions that are legal right now
+        mask = np.zeros(self.action_count, dtype=bool)
+        mask[self.legal_actions()] = True
+        return mask
+
+    def step(self, action):
+        # Play one turn. Returns (observation, reward, terminated, truncated, info)
+        game = self.game
+        legal = self.is_legal(action)
+        won = self.context.run(self.play_turn, action, legal)
+        terminated = game.game_over or won
+        truncated = not terminated and game.turn_count >= self.max_turns
+        reward = 1.0 if won else (-1.0 if game.game_over else 0.0)
+        return self.observe(), reward, terminated, truncated, {"legal": legal, "won": won}
+
+    def play_turn(self, action, legal):
+        # The game_loop turn for one action, run inside our headless context
+        game = self.game
+        kind, arg = ACTIONS[action]
+        if not legal:
+            # Same as picking a letter that isn't on the menu
+            game.lose_sanity(2, HESITATION)
+        elif kind == "move":
+            house.move_player(game, arg)
+        elif kind == "examine":
+            room_id = self.room_ids[game.current_room.name]
+            house.use_object(game, self.object_names[room_id][arg])
+        else:
+            house.handle_action(game, arg, descend=True)
+
+        # Same checks as the end of a game_loop turn
+        if game.lives <= 0 or game.sanity <= 0:
+            game.game_over = True
+        won = game.escaped and game.boss_defeated
+        if not game.game_over and not won:
+            self.start_turn()
+        return won
+
+    def observe(self):
+        # Pack the game state into an int32 array laid out like OBSERVATION_FIELDS
+        game = self.game
+        flags = 0
+        if game.crucifix_protect:
+            flags |= FLAG_CRUCIFIX
+        if game.locked_box_opened:
+            flags |= FLAG_BOX_OPENED
+        if game.boss_defeated:
+            flags |= FLAG_BOSS_DEFEATED
+        if game.escaped:
+            flags |= FLAG_ESCAPED
+        if "tape_played" in game.notes_read:
+            flags |= FLAG_TAPE_PLAYED
+
+        # The bitmasks only get rebuilt when something has changed. The room sets
+        # only ever grow, so their size is enough to tell
+        inventory = tuple(game.inventory)
+        inventory_mask = self.inventory_masks.get(inventory)
+        if inventory_mask is None:
+            inventory_mask = sum(ITEM_BITS[item] for item in inventory)
+            self.inventory_masks[inventory] = inventory_mask
+        if len(game.room_visited) != self.visited_seen:
+            self.visited_seen = len(game.room_visited)
+            self.visited_mask = sum(self.room_bits[name] for name in game.room_visited)
+        if len(game.used_life_bonus) != self.rested_seen:
+            self.rested_seen = len(game.used_life_bonus)
+            self.rested_mask = sum(self.room_bits[name] for name in game.used_life_bonus)
+
+        return np.array([
+            self.room_ids[game.current_room.name],
+            game.lives,
+            game.sanity,
+            game.turn_count,
+            inventory_mask,
+            self.visited_mask,
+            self.rested_mask,
+            len(game.notes_read),
+            flags,
+        ], dtype=np.int32)
+
+
+def benchmark(steps=200_000, seed=0):
+    # Steps per second with a random player that only picks legal actions
+    env = HauntedHouseEnv()
+    env.reset(seed)
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    for _ in range(steps):
+        action = rng.choice(env.legal_actions())
+        _, _, terminated, truncated, _ = env.step(action)
+        if terminated or truncated:
+            env.reset()
+    return steps / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    print(f"{len(ACTIONS)} actions, {len(OBSERVATION_FIELDS)} observation fields")
+    print(f"{benchmark():,.0f} steps per second")
+    sys.exit(0)
@@ -1,10 +1,67 @@
 import time
 import random
+import os
 import sys
+import io
+import copy
+import json
+import mmap
+import zlib
+import shutil
+import math
+import heapq
+import queue
+import struct
+import textwrap
+import selectors
+import collections
+import contextlib
+import contextvars
+import re
+import threading
+import importlib.util
+try:
+    import termios
+    import tty
+except ImportError:
+    termios = None  # not on Windows - the keyboard stays in line mode
+
+# Where the game text goes. None means typed out to the terminal as normal,
+# otherwise it's a function that gets each line (used for headless runs)
+_output = contextvars.ContextVar("output", default=None)
+
+@contextlib.contextmanager
+def redirect_output(sink):
+    # Send every printed line to sink(text) instead of the terminal, and skip the pauses
+    token = _output.set(sink)
+    try:
+        yield
+    finally:
+        _output.reset(token)
+
+def discard_output(text):
+    # Sink that throws the text away - for simulations and automated players
+    pass
+
+def headless_context(sink=discard_output):
+    # A context where the output always goes to sink - context.run(func, ...) is
+    # much cheaper than entering redirect_output on every call
+    context = contextvars.copy_context()
+    context.run(_output.set, sink)
+    return context
+
+def pause(seconds):
+    # Dramatic pause, skipped when the output isn't going to a real player
+    if _output.get() is None:
+        time.sleep(seconds)
 
 # Print functions - slow for narrative, fast for UI
 def slow_print(text, delay=0.03):
     # slow print for atmospheric narrative text
+    sink = _output.get()
+    if sink is not None:
+        sink(text)
+        return
     for char in text:
         print(char, end='', flush=True)
         time.sleep(delay)
@@ -12,18 +69,286 @@ def slow_print(text, delay=0.03):
 
 def fast_print(text, delay=0.015):
     """Faster print for repeated deaths"""
+    sink = _output.get()
+    if sink is not None:
+        sink(text)
+        return
     for char in text:
         print(char, end='', flush=True)
         time.sleep(delay)
     print()
 
+def instant_print(text=""):
+    # No typing effect at all - for big blocks like the map
+    sink = _output.get()
+    if sink is not None:
+        sink(text)
+        return
+    print(text)
+
 def quick_print(text):
     # Quick print for UI elements and menus
+    sink = _output.get()
+    if sink is not None:
+        sink(text)
+        return
     for char in text:
         print(char, end='', flush=True)
         time.sleep(0.005)
     print()
 
+# Long text - notes, letters, journals - goes through a pipeline of generators:
+# text_lines splits it, wrap_lines fits the lines to the screen and paginate cuts
+# them into pages. Each step only does its work when the next one asks, so a note
+# the player stops reading is never wrapped or paged any further than they got
+NOTE_WIDTH = 75
+NOTE_PAGE_LINES = 20
+
+# What show_text hands a part-read NoteReader to - set by GameSession while it plays a line
+_pager = contextvars.ContextVar("pager", default=None)
+
+def text_lines(text):
+    start = 0
+    while start <= len(text):
+        end = text.find("\n", start)
+        if end < 0:
+            end = len(text)
+        yield text[start:end]
+        start = end + 1
+
+def wrap_lines(lines, width):
+    for line in lines:
+        if len(line) <= width:
+            yield line
+        else:
+            yield from textwrap.wrap(line, width)
+
+def paginate(lines, page_lines):
+    page = []
+    for line in lines:
+        page.append(line)
+        if len(page) == page_lines:
+            yield page
+            page = []
+    if page:
+        yield page
+
+def page_size():
+    # (width, lines) of a page - the terminal's size, or the defaults when the text goes elsewhere
+    if _output.get() is None:
+        columns, rows = shutil.get_terminal_size((NOTE_WIDTH + 1, NOTE_PAGE_LINES + 4))
+        return min(columns - 1, NOTE_WIDTH), max(rows - 4, 5)
+    return NOTE_WIDTH, NOTE_PAGE_LINES
+
+class NoteReader:
+    # A long text part way through being read. The next page is always worked out
+    # ahead, so there's never a "more" that turns out to be empty
+    def __init__(self, text, printer=slow_print):
+        width, lines = page_size()
+        self.pages = paginate(wrap_lines(text_lines(text), width), lines)
+        self.printer = printer
+        self.upcoming = next(self.pages, None)
+        self.held = []   # everything else printed while there are pages still to read
+        self.token = None
+
+    @property
+    def done(self):
+        return self.upcoming is None
+
+    def show_page(self):
+        for line in self.upcoming:
+            self.printer(line)
+        self.upcoming = next(self.pages, None)
+
+    def stop(self):
+        # Stop reading - the rest is never rendered
+        self.pages.close()
+        self.upcoming = None
+
+    def hold(self):
+        # Keep anything else that gets printed until the reading's over
+        self.token = _output.set(self.held.append)
+
+    def release(self):
+        if self.token:
+            _output.reset(self.token)
+            self.token = None
+
+def show_text(text, printer=slow_print):
+    # Show a long piece of text a page at a time. In a GameSession the player turns
+    # the pages, and the rest of the turn's output waits until they've finished
+    sink = _output.get()
+    if sink is discard_output:
+        return  # nobody's reading
+    reader = NoteReader(text, printer)
+    reader.show_page()
+    if reader.done:
+        return
+    pager = _pager.get()
+    if pager and pager(reader):
+        reader.hold()
+        return
+    while not reader.done:
+        reader.show_page()
+
+class StatusBar:
+    # The stats kept on the top line of the terminal instead of typed out every turn.
+    # The rest of the screen scrolls underneath it, and each turn only the characters
+    # that changed since last time are redrawn - a few bytes instead of a few lines
+    def __init__(self, stream=None):
+        self.stream = stream if stream else sys.stdout
+        self.line = ""
+        rows = shutil.get_terminal_size().lines
+        # Clear line 1 and keep it out of the scrolling region, then carry on at the bottom
+        self.stream.write(f"\x1b[1;1H\x1b[2K\x1b[2;{rows}r\x1b[{rows};1H")
+        self.stream.flush()
+
+    @staticmethod
+    def supported():
+        # Only for a real terminal - redirected and headless output gets plain text
+        return (_output.get() is None and sys.stdout.isatty()
+                and os.environ.get("TERM", "dumb") != "dumb")
+
+    def render(self, game):
+        hearts = "♥ " * game.lives + "♡ " * (game.max_lives - game.lives)
+        filled = int(game.sanity / 10)
+        bar = "█" * filled + "░" * (10 - filled)
+        return (f" Health: [{hearts}] ({game.lives}/{game.max_lives})   "
+                f"Sanity: [{bar}] ({game.sanity:3}/100)   "
+                f"Rooms explored: {game.survived_count}")
+
+    def update(self, game):
+        # Redraw whichever runs of characters are different from last time
+        new = self.render(game)
+        width = max(len(new), len(self.line))
+        new, old = new.ljust(width), self.line.ljust(width)
+        changes = []
+        i = 0
+        while i < width:
+            if new[i] == old[i]:
+                i += 1
+                continue
+            start = i
+            while i < width and new[i] != old[i]:
+                i += 1
+            changes.append(f"\x1b[1;{start + 1}H{new[start:i]}")
+        if changes:
+            # Save the cursor, draw, and put the cursor back where the game left it
+            self.stream.write("\x1b7" + "".join(changes) + "\x1b8")
+            self.stream.flush()
+        self.line = new.rstrip()
+
+    def close(self):
+        # Give the whole screen back to scrolling
+        self.stream.write("\x1b[r")
+        self.stream.flush()
+
+# The long notes, journals and letters live in Haunted_text.txt rather than in here.
+# That file is packed into Haunted_text.pack - every entry compressed on its own,
+# with an index of where each one starts - and the pack is memory-mapped, so an
+# entry is only read and decompressed when it's actually shown. The last few shown
+# are kept in memory. Objects hold a PACKED_MARK + key string in place of the text
+TEXT_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Haunted_text.txt")
+TEXT_PACK = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Haunted_text.pack")
+PACKED_MARK = "@text:"
+TEXT_CACHE_SIZE = 8
+PACK_HEADER = struct.Struct("<4sII")  # magic, entries, where the index starts
+PACK_ENTRY = struct.Struct("<HII")    # key length, block offset, block size
+PACK_MAGIC = b"HTX1"
+
+def packed(key):
+    # Stand-in for a text that's in the pack
+    return PACKED_MARK + key
+
+def read_text_source(path=TEXT_SOURCE):
+    # The entries in the text file, as (key, text). Lines starting with # before
+    # the first entry are comments
+    entries = []
+    key = None
+    lines = []
+    with open(path, encoding="utf-8") as source:
+        for line in source:
+            line = line.rstrip("\n")
+            if line.startswith("@@ "):
+                if key is not None:
+                    entries.append((key, "\n".join(lines)))
+                key, lines = line[3:].strip(), []
+            elif key is not None:
+                lines.append(line)
+    if key is not None:
+        entries.append((key, "\n".join(lines)))
+    return entries
+
+def build_text_pack(source=TEXT_SOURCE, target=TEXT_PACK):
+    # Compress every entry into its own block and write the blocks, then the index
+    entries = read_text_source(source)
+    blocks = bytearray()
+    index = bytearray()
+    for key, text in entries:
+        block = zlib.compress(text.encode("utf-8"), 9)
+        name = key.encode("utf-8")
+        index += PACK_ENTRY.pack(len(name), PACK_HEADER.size + len(blocks), len(block)) + name
+        blocks += block
+    temp_path = f"{target}.{os.getpid()}.tmp"  # server workers may all be rebuilding it at once
+    with open(temp_path, "wb") as pack:
+        pack.write(PACK_HEADER.pack(PACK_MAGIC, len(entries), PACK_HEADER.size + len(blocks)))
+        pack.write(blocks)
+        pack.write(index)
+    os.replace(temp_path, target)
+
+class TextPack:
+    def __init__(self, path=TEXT_PACK, cache_size=TEXT_CACHE_SIZE):
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, index_start = PACK_HEADER.unpack_from(self.data, 0)
+        if magic != PACK_MAGIC:
+            raise ValueError(f"{path} isn't a text pack")
+        # Only the index is read now - key -> (offset, size) of its block
+        self.blocks = {}
+        position = index_start
+        for _ in range(count):
+            length, offset, size = PACK_ENTRY.unpack_from(self.data, position)
+            position += PACK_ENTRY.size
+            key = self.data[position:position + length].decode("utf-8")
+            position += length
+            self.blocks[key] = (offset, size)
+        self.cache = collections.OrderedDict()
+        self.cache_size = cache_size
+
+    def get(self, key):
+        text = self.cache.get(key)
+        if text is not None:
+            self.cache.move_to_end(key)
+            return text
+        offset, size = self.blocks[key]
+        text = zlib.decompress(self.data[offset:offset + size]).decode("utf-8")
+        self.cache[key] = text
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return text
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+text_pack = None
+
+def open_text_pack():
+    # Open the pack, packing the text file again first if it's changed since
+    global text_pack
+    if text_pack is None:
+        if (not os.path.exists(TEXT_PACK)
+                or os.path.getmtime(TEXT_PACK) < os.path.getmtime(TEXT_SOURCE)):
+            build_text_pack()
+        text_pack = TextPack()
+    return text_pack
+
+def load_text(text):
+    # The real text for a description - looked up in the pack if it's packed
+    if text.startswith(PACKED_MARK):
+        return open_text_pack().get(text[len(PACKED_MARK):])
+    return text
+
 # Room class
 class Room:
     def __init__(self, name, description, items=None, neighbors=None, objects=None):
@@ -32,15 +357,101 @@ class Room:
         self.items = items if items else []
         self.neighbors = neighbors if neighbors else {}
         self.objects = objects if objects else {}
+        self.id = None  # its number in the compiled world tables
 
     def describe(self):
         slow_print(f"\nYou are in the {self.name}.")
         slow_print(self.description)
 
+# Timed hauntings - how often the house drains your sanity, and how long the crucifix lasts
+SANITY_DRAIN_EVERY = 5
+CRUCIFIX_TURNS = 30
+DARK_FIGURE_TURN = 40  # when the dark figure starts roaming the house
+GHOSTS_MOVE_EVERY = 2  # ghosts move every other turn, so you can outrun them
+GHOST_BUDGET = 256     # most ghosts that move in one go - any more take it in turns
+
+# Effects. lose_life, lose_sanity, gain_sanity and gain_life change the stats straight
+# away, so the rest of an action sees them, but the checks on them are left to an
+# EffectBatch and resolved once the action's done - one look at the sanity warnings,
+# one line of stats for everything that changed and one death, however many effects
+# there were. A GameSession collects each line the player types in one batch; outside
+# one, every effect is a batch of its own and is resolved as soon as it's over
+_effects = contextvars.ContextVar("effects", default=None)
+
+# What's said when an effect ends the game
+LOST_TO_MADNESS = ("\nThe whispers are too loud now. They're all you can hear.",
+                   "Your thoughts aren't your own anymore. The house has you.",
+                   "You collapse, and the darkness welcomes you home.")
+LOST_TO_WOUNDS = ("\nYour vision blurs. The floor rushes up to meet you.",
+                  "The last thing you hear is laughter. Or maybe crying.",
+                  "You can't tell anymore.")
+LOST_TO_TIME = ("\nToo long. You've been here too long.",
+                "The house has gotten inside your head.")
+
+class EffectBatch:
+    def __init__(self, game, status=None):
+        self.game = game
+        self.status = status  # StatusBar to show the stats on, instead of printing them
+        self.depth = 0
+        self.token = None
+        self.clear()
+
+    def clear(self):
+        self.health = False   # stats to show
+        self.sanity = False
+        self.shaken = False   # sanity was lost, so the warnings want looking at
+        self.calmed = False   # said "you take a breath" already
+        self.death = None     # the lines for whatever ended the game first
+
+    def __enter__(self):
+        if not self.depth:
+            self.token = _effects.set(self)
+        self.depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self.depth -= 1
+        if not self.depth:
+            _effects.reset(self.token)
+            self.resolve()
+
+    def died(self, lines):
+        if self.death is None:
+            self.death = lines
+
+    def resolve(self):
+        # Everything the effects so far have left to say, then start collecting afresh
+        game = self.game
+        if self.shaken and self.death is None:
+            if game.sanity <= 20 and game.sanity_warnings < 3:
+                slow_print("Your hands are shaking. Everything feels wrong.")
+                game.sanity_warnings += 1
+                self.sanity = True
+            elif game.sanity <= 40:
+                slow_print("The walls seem closer than before...")
+                self.sanity = True
+        if self.status and (self.health or self.sanity):
+            self.status.update(game)
+        elif self.health or self.sanity:
+            shown = [game.health_text()] if self.health else []
+            if self.sanity:
+                shown.append(game.sanity_text())
+            quick_print("   ".join(shown))
+        for line in self.death or ():
+            slow_print(line)
+        self.clear()
+
+def settle_effects():
+    # Resolve the open batch now, before the turn goes on to what has to come after it
+    batch = _effects.get()
+    if batch:
+        batch.resolve()
+
 # Game state
 class GameState:
-    def __init__(self, start_room):
+    def __init__(self, start_room, rng=None):
         self.current_room = start_room
+        self.rng = rng if rng else random.Random()  # dice for the random encounters
         self.inventory = []
         self.lives = 3
         self.max_lives = 5
@@ -58,18 +469,39 @@ class GameState:
         self.escaped = False
         self.boss_defeated = False
         self.locked_box_opened = False
-
-    def show_health(self):
-        # Display health as hearts
+        self.encounter_counts = {}
+        self.achievements = set()
+        # Hauntings waiting to happen. timers is a heap of [turn, order, event, args, every],
+        # so each turn only looks at the ones that are due. room_triggers holds the ones
+        # waiting for you to be in a room: room name -> [[event, args], ...]
+        self.timers = []
+        self.timer_order = 0
+        self.scheduled = {}  # event -> how many of its timers are in the heap, for is_scheduled
+        self.room_triggers = {}
+        self.schedule("sanity_drain", SANITY_DRAIN_EVERY, 2, every=SANITY_DRAIN_EVERY)
+        self.schedule("dark_figure_wakes", DARK_FIGURE_TURN)
+        # Things roaming the house - kind and room id, one entry per ghost in each list
+        self.ghost_kinds = []
+        self.ghost_rooms = []
+        self.ghost_cursor = 0  # where the next turn's moves start when there are too many to move at once
+
+    def health_text(self):
+        # Health as hearts
         hearts = "♥ " * self.lives + "♡ " * (self.max_lives - self.lives)
-        quick_print(f"Health: [{hearts}] ({self.lives}/{self.max_lives})")
+        return f"Health: [{hearts}] ({self.lives}/{self.max_lives})"
 
-    def show_sanity(self):
-        # Display sanity as progress bar
+    def sanity_text(self):
+        # Sanity as a progress bar
         filled = int(self.sanity / 10)
         empty = 10 - filled
         bar = "█" * filled + "░" * empty
-        quick_print(f"Sanity: [{bar}] ({self.sanity}/100)")
+        return f"Sanity: [{bar}] ({self.sanity}/100)"
+
+    def show_health(self):
+        quick_print(self.health_text())
+
+    def show_sanity(self):
+        quick_print(self.sanity_text())
 
     def show_stats(self):
         # Display all stats quickly
@@ -84,48 +516,74 @@ class GameState:
             self.survived_count = len(self.survived_rooms)
         self.room_visited.add(self.current_room.name)
 
+    def effects(self):
+        # The batch this game's effects go in - the one that's open, or a new one
+        batch = _effects.get()
+        if batch is None or batch.game is not self:
+            batch = EffectBatch(self)
+        return batch
+
     def lose_sanity(self, amount=5, cause=None):
-        # Decrease sanity with atmospheric feedback
-        self.sanity -= amount
-        if cause:
-            slow_print(cause)
-        
-        if self.sanity <= 0:
-            slow_print("\nThe whispers are too loud now. They're all you can hear.")
-            slow_print("Your thoughts aren't your own anymore. The house has you.")
-            slow_print("You collapse, and the darkness welcomes you home.")
-            self.game_over = True
-            return True
-        elif self.sanity <= 20 and self.sanity_warnings < 3:
-            slow_print(f"Your hands are shaking. Everything feels wrong.")
-            self.show_sanity()
-            self.sanity_warnings += 1
-        elif self.sanity <= 40:
-            slow_print(f"The walls seem closer than before...")
-            self.show_sanity()
-        
+        # Decrease sanity with atmospheric feedback - the warnings wait for the batch
+        with self.effects() as batch:
+            self.sanity -= amount
+            if cause:
+                slow_print(cause)
+            batch.shaken = True
+            if self.sanity <= 0:
+                self.game_over = True
+                batch.died(LOST_TO_MADNESS)
+                return True
         return False
 
     def gain_sanity(self, amount=10):
         # Increase sanity
-        old_sanity = self.sanity
-        self.sanity = min(100, self.sanity + amount)
-        gained = self.sanity - old_sanity
-        if gained > 0:
-            slow_print(f"You take a breath. The fog in your head clears a little.")
-            self.show_sanity()
+        with self.effects() as batch:
+            old_sanity = self.sanity
+            self.sanity = min(100, self.sanity + amount)
+            gained = self.sanity - old_sanity
+            if gained > 0:
+                if not batch.calmed:
+                    slow_print("You take a breath. The fog in your head clears a little.")
+                    batch.calmed = True
+                batch.sanity = True
 
     def passive_sanity_drain(self):
-        # Gradual sanity loss over time
+        # The start of a turn - time moves on and any hauntings that are due happen,
+        # including the gradual sanity drain. Returns True if they've ended the game
         self.turn_count += 1
-        if self.turn_count % 5 == 0:
-            self.sanity -= 2
-            if self.sanity <= 0:
-                slow_print("\nToo long. You've been here too long.")
-                slow_print("The house has gotten inside your head.")
-                self.game_over = True
-                return True
-        return False
+        triggers = self.room_triggers.pop(self.current_room.name, None)
+        if triggers:
+            for event, args in triggers:
+                HAUNTINGS[event](self, *args)
+        while self.timers and self.timers[0][0] <= self.turn_count and not self.game_over:
+            turn, _, event, args, every = heapq.heappop(self.timers)
+            self.unschedule(event)
+            if every:
+                self.schedule(event, turn + every - self.turn_count, *args, every=every)
+            HAUNTINGS[event](self, *args)
+        return self.game_over
+
+    def schedule(self, event, delay, *args, every=None):
+        # Have HAUNTINGS[event](game, *args) happen in so many turns' time,
+        # and then again every so many turns after that if every is given
+        self.timer_order += 1
+        heapq.heappush(self.timers, [self.turn_count + delay, self.timer_order, event, list(args), every])
+        self.scheduled[event] = self.scheduled.get(event, 0) + 1
+
+    def unschedule(self, event):
+        # One of the event's timers has left the heap
+        if self.scheduled[event] > 1:
+            self.scheduled[event] -= 1
+        else:
+            del self.scheduled[event]
+
+    def is_scheduled(self, event):
+        return event in self.scheduled
+
+    def when_in_room(self, room_name, event, *args):
+        # Have HAUNTINGS[event](game, *args) happen the next turn you're in that room
+        self.room_triggers[room_name] = self.room_triggers.get(room_name, []) + [[event, list(args)]]
 
     def lose_life(self, amount=1, cause=None):
         # Decrease health with consequences
@@ -133,26 +591,25 @@ class GameState:
         self.room_death_count[room_name] = self.room_death_count.get(room_name, 0) + 1
         printer = fast_print if self.room_death_count[room_name] > 1 else slow_print
 
-        if self.crucifix_protect:
-            slow_print("The crucifix grows warm in your pocket. Something backs away.")
-            slow_print("Whatever was reaching for you... it can't touch you. Not yet.")
-            self.crucifix_protect = False
-            self.gain_sanity(15)
-            return False
+        with self.effects() as batch:
+            if self.crucifix_protect:
+                slow_print("The crucifix grows warm in your pocket. Something backs away.")
+                slow_print("Whatever was reaching for you... it can't touch you. Not yet.")
+                self.crucifix_protect = False
+                self.gain_sanity(15)
+                return False
 
-        self.lives -= amount
-        self.lose_sanity(15)
-        
-        if cause:
-            printer(cause)
-        self.show_health()
-        
-        if self.lives <= 0:
-            slow_print("\nYour vision blurs. The floor rushes up to meet you.")
-            slow_print("The last thing you hear is laughter. Or maybe crying.")
-            slow_print("You can't tell anymore.")
-            self.game_over = True
-            return True
+            self.lives -= amount
+            self.lose_sanity(15)
+            
+            if cause:
+                printer(cause)
+            batch.health = True
+            
+            if self.lives <= 0:
+                self.game_over = True
+                batch.died(LOST_TO_WOUNDS)
+                return True
         return False
 
     def gain_life(self, amount=1):
@@ -163,10 +620,11 @@ class GameState:
             slow_print("The well has run dry.")
             return
         self.used_life_bonus.add(rn)
-        self.lives = min(self.max_lives, self.lives + amount)
-        self.gain_sanity(10)
-        slow_print(f"Something shifts. You feel stronger.")
-        self.show_health()
+        with self.effects() as batch:
+            self.lives = min(self.max_lives, self.lives + amount)
+            self.gain_sanity(10)
+            slow_print(f"Something shifts. You feel stronger.")
+            batch.health = True
 
     def add_item(self, item):
         # Add item to inventory
@@ -177,6 +635,7 @@ class GameState:
             if item == "crucifix":
                 self.crucifix_protect = True
                 slow_print("The crucifix feels warm. Protective. Like it's watching over you.")
+                self.schedule("crucifix_fades", CRUCIFIX_TURNS)
         else:
             slow_print(f"You already have the {item}.")
 
@@ -187,63 +646,123 @@ class GameState:
             slow_print(f"The {item} is gone.")
 
     def show_map(self):
-        # Display the estate map quickly
-        def mark(name): 
-            return "■" if name in self.room_visited else "□"
-        
-        print("\n" + "="*75)
-        print("                    CRAMPTON ESTATE - FLOOR PLAN")
-        print("="*75)
-        print()
-        print("                          ┏━━━━━━━━━━━━━┓")
-        print("                          ┃    ATTIC    ┃")
-        print(f"                          ┃      {mark('Attic')}      ┃")
-        print("                          ┗━━━━━━┬━━━━━━┛")
-        print("                                 │")
-        print("    ┏━━━━━━━━━━┓   ┏━━━━━━━━━━━━┻━━━━━━━━━━━┓   ┏━━━━━━━━━━┓")
-        print("    ┃KIDS BEDRM┃───┃   SECOND FLOOR HALL    ┃───┃MASTER BED┃")
-        print(f"    ┃    {mark('Kids Bedroom')}   ┃   ┃          {mark('Second Floor Hall')}         ┃   ┃    {mark('Master Bedroom')}   ┃")
-        print("    ┗━━━━━━━━━━┛   ┗━━━━━━━━━┬━━━━━━━━━━━━━┛   ┗━━━━┬━━━━━┛")
-        print("                              │                        │")
-        print("                      ┏━━━━━━━┴━━━━━━┓          ┏━━━━┻━━━━┓")
-        print("                      ┃   BATHROOM   ┃          ┃ UTILITY ┃")
-        print(f"                      ┃      {mark('Bathroom')}      ┃          ┃    {mark('Utility Room')}   ┃")
-        print("                      ┗━━━━━━━━━━━━━━┛          ┗━━━━━━━━━┛")
-        print("                              │")
-        print("            ┏━━━━━━━━━━━━━━━━━┻━━━━━━━━━━━━━━━━━┓")
-        print("            ┃         GRAND HALL                ┃")
-        print(f"            ┃              {mark('Grand Hall')}                   ┃")
-        print("            ┗━━┬━━━━━━━━━━━━━┬━━━━━━━━━━━━┬━━━━┛")
-        print("               │             │            │")
-        print("      ┏━━━━━━━━┴━━━━━━┓   ┏━━┴━━━━┓  ┏━━━┴━━━━━━┓")
-        print("      ┃   LIBRARY     ┃   ┃DINING ┃  ┃  LIVING   ┃")
-        print(f"      ┃      {mark('Library')}      ┃   ┃ ROOM ┃  ┃   ROOM   ┃")
-        print(f"      ┗━━━━━━━┬━━━━━━┛   ┗━━━┬━━━┛  ┗━━━━━━━━━━┛")
-        print("              │               │")
-        print("      ┏━━━━━━━┴━━━━━━┓   ┏━━━┴━━━━━━┓")
-        print("      ┃   BASEMENT   ┃   ┃  KITCHEN  ┃")
-        print(f"      ┃      {mark('Basement')}      ┃   ┃     {mark('Kitchen')}    ┃")
-        print("      ┗━━━━━━━━━━━━━━┛   ┗━━━━┬━━━━━━┛")
-        print("                               │")
-        print("                       ┏━━━━━━━┴━━━━━━━┓")
-        print("                       ┃ CONSERVATORY  ┃")
-        print(f"                       ┃      {mark('Conservatory')}       ┃")
-        print("                       ┗━━━━━━━━━━━━━━━┛")
-        print()
-        print("Legend: ■ = visited  □ = unvisited")
-        print("="*75 + "\n")
+        # Display the estate map quickly - it's laid out from the house itself (see FloorPlan)
+        instant_print(world.floor_plan().render(self.room_visited))
+
+# What each timed haunting does
+def sanity_drain(game, amount):
+    # Gradual sanity loss over time
+    game.sanity -= amount
+    if game.sanity <= 0:
+        game.game_over = True
+        with game.effects() as batch:
+            batch.died(LOST_TO_TIME)
+
+def music_box_plays(game):
+    # A while after you wind the music box, it starts again on its own
+    slow_print("\nSomewhere in the house, a music box starts to play. Nobody wound it.")
+    slow_print("The tune is slower than before. It stops mid-note.")
+    game.when_in_room("Kids Bedroom", "music_box_turned")
+    game.lose_sanity(5)
+
+def music_box_turned(game):
+    slow_print("The music box is closed. The ballerina is outside it now, facing the door.")
+    game.lose_sanity(3)
+
+def crucifix_fades(game):
+    if game.crucifix_protect:
+        game.crucifix_protect = False
+        slow_print("\nThe crucifix in your pocket has gone cold. Whatever it held back is free again.")
+
+# Things that roam the house hunting you. Each starts in its lair, moves one room
+# towards you every GHOSTS_MOVE_EVERY turns, and when it reaches you the effect
+# happens and it goes back to its lair
+GHOSTS = {
+    "dark figure": {
+        "lair": "Basement",
+        "near": "Heavy footsteps in the next room. Something tall is looking for you.",
+        "text": "The DARK FIGURE is here. It reaches for you with fingers like smoke.",
+        "effect": ("lose_life", 1, "Where it touched you, your skin has gone grey and cold."),
+    },
+    "whispering shade": {
+        "lair": "Attic",
+        "near": "Whispering drifts through the wall. It's saying your name.",
+        "text": "A shade passes straight through you, whispering as it goes.",
+        "effect": ("lose_sanity", 8, "You can still hear it after it's gone."),
+    },
+}
+
+def spawn_ghost(game, kind, count=1):
+    # Set ghosts roaming, starting from their lair. The lists are replaced rather
+    # than added to, so the autosave sees the change
+    game.ghost_kinds = game.ghost_kinds + [kind] * count
+    game.ghost_rooms = game.ghost_rooms + [world.room_ids[GHOSTS[kind]["lair"]]] * count
+    if not game.is_scheduled("ghosts_move"):
+        game.schedule("ghosts_move", GHOSTS_MOVE_EVERY, every=GHOSTS_MOVE_EVERY)
+
+def dark_figure_wakes(game):
+    slow_print("\nFar below you, a door opens. Something has started to walk the halls.")
+    spawn_ghost(game, "dark figure")
+
+def ghosts_move(game):
+    # Every ghost takes one step along the distance field towards the player - one
+    # list lookup each. With more than GHOST_BUDGET of them, only that many move
+    # this time, carrying on from where the last lot stopped
+    player = game.current_room.id
+    step = world.next_step[player]
+    rooms = game.ghost_rooms
+    count = len(rooms)
+    if count <= GHOST_BUDGET:
+        rooms = [step[room] for room in rooms]
+    else:
+        rooms = list(rooms)
+        start = game.ghost_cursor % count
+        end = start + GHOST_BUDGET
+        rooms[start:end] = [step[room] for room in rooms[start:end]]
+        if end > count:
+            rooms[:end - count] = [step[room] for room in rooms[:end - count]]
+        game.ghost_cursor = end % count
+    game.ghost_rooms = rooms
+
+    # A warning for each kind of ghost one room away
+    distance = world.distance[player]
+    near = {kind for kind, room in zip(game.ghost_kinds, rooms) if distance[room] == 1}
+    for kind in near:
+        slow_print(GHOSTS[kind]["near"])
+
+    # Anything that's reached you
+    if player in rooms:
+        for i, room in enumerate(rooms):
+            if room != player:
+                continue
+            ghost = GHOSTS[game.ghost_kinds[i]]
+            rooms[i] = world.room_ids[ghost["lair"]]
+            slow_print(ghost["text"])
+            effect, *args = ghost["effect"]
+            getattr(game, effect)(*args)
+            if game.game_over:
+                break
+
+HAUNTINGS = {
+    "sanity_drain": sanity_drain,
+    "music_box": music_box_plays,
+    "music_box_turned": music_box_turned,
+    "crucifix_fades": crucifix_fades,
+    "dark_figure_wakes": dark_figure_wakes,
+    "ghosts_move": ghosts_move,
+}
+
+# Notes that aren't objects of their own, so examining doesn't find them
+HIDDEN_NOTES = ("locked_box_journal",)
 
 def read_note(game, note_id, note_text):
-    # Read a note with slow printing for atmosphere
+    # Read a note with slow printing for atmosphere, a page at a time
     if note_id in game.notes_read:
         slow_print("You've already read this. The words are the same.")
         return
     
     game.notes_read.add(note_id)
-    slow_print("\n" + "-"*60)
-    for line in note_text:
-        slow_print(line)
-    slow_print("-"*60 + "\n")
+    show_text("\n".join(["\n" + "-"*60, note_text, "-"*60 + "\n"]))
     game.gain_sanity(5)
 
 # Item interaction functions
@@ -254,14 +773,24 @@ def examine_object(game, obj_name):
         slow_print(f"There's no {obj_name} here to examine.")
         return
     
-    slow_print(obj_info["description"])
+    show_text(load_text(obj_info["description"]))
     
     # Handle health effects
-    if "health" in obj_info:
-        game.lives = max(0, min(game.max_lives, game.lives + obj_info["health"]))
-        if obj_info["health"] < 0:
+    obj_id = world.object_ids[game.current_room.id][obj_name]
+    note = world.object_note[obj_id]
+    if note:
+        game.notes_read.add(note)
+    haunting = world.object_haunting[obj_id]
+    if haunting and not game.is_scheduled(haunting[0]):
+        game.schedule(*haunting)
+    
+    health = world.object_health[obj_id]
+    if health is not None:
+        game.lives = max(0, min(game.max_lives, game.lives + health))
+        if health < 0:
             slow_print("You feel pain shoot through you!")
-        game.show_health()
+        with game.effects() as batch:
+            batch.health = True
         if game.lives <= 0:
             game.game_over = True
             return
@@ -276,37 +805,137 @@ def examine_object(game, obj_name):
         if "examined_description" in obj_info:
             obj_info["description"] = obj_info["examined_description"]
 
+# Random encounters as data. Every outcome has the text shown, the effect as
+# (GameState method, arguments...), a weight (how likely it is compared to the
+# others) and optional conditions:
+#   needs_item / without_item - only if the player has / hasn't got an item
+#   min_sanity / max_sanity   - only within a sanity range
+#   min_repeats / max_repeats - only after / until the encounter has happened that many times
+# Each table is compiled once into alias-method samplers, so a roll is O(1)
+# however many outcomes it has
+CONDITION_KEYS = ("needs_item", "without_item", "min_sanity", "max_sanity", "min_repeats", "max_repeats")
+
+ENCOUNTERS = {
+    "cupboard": [
+        {"text": "Something scurries out and bites your ankle!", "effect": ("lose_life", 1, "The bite burns. Infection sets in."), "weight": 1},
+        {"text": "Hands. Cold, dead hands reach out.", "effect": ("lose_life", 1, "They're so cold. They pull you closer."), "weight": 1},
+        {"text": "A rusted blade falls out, cutting you.", "effect": ("lose_life", 1, "Blood drips onto the floor."), "weight": 1},
+        {"text": "The door slams near your face.", "effect": ("lose_sanity", 8, "That was too close."), "weight": 1},
+        {"text": "A small, rusted key hidden behind a false panel!", "effect": ("add_item", "rusty key"), "weight": 1},
+        {"text": "Nothing. Just cobwebs and rot.", "effect": ("lose_sanity", 3, "The emptiness feels deliberate."), "weight": 1},
+    ],
+    "wardrobe": [
+        {"text": "Something inside grabs you!", "effect": ("lose_life", 1, "The wardrobe tries to swallow you."), "weight": 1},
+        {"text": "The door slams with a deafening bang.", "effect": ("lose_sanity", 7, "Did something hear that?"), "weight": 1},
+        {"text": "A wooden crucifix hangs inside, glowing faintly.", "effect": ("add_item", "crucifix"), "weight": 1},
+        {"text": "Empty. But you swear something moved.", "effect": ("lose_sanity", 5, "The shadows weren't right."), "weight": 1},
+    ],
+    "meditate": [
+        {"text": "You close your eyes and breathe deeply. Peace washes over you.", "effect": ("gain_sanity", 15), "weight": 1},
+        {"text": "As you meditate, you hear a child's laughter. Not threatening. Comforting.", "effect": ("gain_life", 1), "weight": 1},
+        {"text": "You feel a small hand take yours gently. When you open your eyes, you're alone.", "effect": ("gain_sanity", 10), "weight": 1},
+        {"text": "Something whispers in your ear: 'Run. Run now.' You jolt awake, heart pounding.", "effect": ("lose_sanity", 5), "weight": 1},
+    ],
+}
+
+class AliasTable:
+    # Walker's alias method - after building, every weighted draw is one random
+    # number, one list lookup and one comparison
+    def __init__(self, weights):
+        self.size = len(weights)
+        total = sum(weights)
+        scaled = [weight * self.size / total for weight in weights]
+        self.prob = [1.0] * self.size
+        self.alias = list(range(self.size))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            low = small.pop()
+            high = large.pop()
+            self.prob[low] = scaled[low]
+            self.alias[low] = high
+            scaled[high] += scaled[low] - 1.0
+            if scaled[high] < 1.0:
+                small.append(high)
+            else:
+                large.append(high)
+
+    def sample(self, rng):
+        # One uniform number picks the column and decides between it and its alias
+        spot = rng.random() * self.size
+        column = int(spot)
+        return column if spot - column < self.prob[column] else self.alias[column]
+
+def outcome_allowed(game, outcome, repeats):
+    # Whether an outcome's conditions hold right now
+    if "needs_item" in outcome and outcome["needs_item"] not in game.inventory:
+        return False
+    if "without_item" in outcome and outcome["without_item"] in game.inventory:
+        return False
+    if game.sanity < outcome.get("min_sanity", game.sanity):
+        return False
+    if game.sanity > outcome.get("max_sanity", game.sanity):
+        return False
+    if repeats < outcome.get("min_repeats", repeats):
+        return False
+    if repeats > outcome.get("max_repeats", repeats):
+        return False
+    return True
+
+class EncounterTable:
+    def __init__(self, name, outcomes):
+        self.name = name
+        self.outcomes = outcomes
+        # A weight that isn't a positive number would build an alias table that
+        # picks the wrong outcomes, or none at all
+        for i, outcome in enumerate(outcomes):
+            weight = outcome.get("weight")
+            if (isinstance(weight, bool) or not isinstance(weight, (int, float))
+                    or not math.isfinite(weight) or weight <= 0):
+                raise ValueError(f"Encounter '{name}' outcome {i} has weight {weight!r} - it must be a positive number")
+        # Only the outcomes with conditions need checking on each roll
+        self.conditional = [i for i, outcome in enumerate(outcomes)
+                            if any(key in outcome for key in CONDITION_KEYS)]
+        if len(self.conditional) == len(outcomes):
+            raise ValueError(f"Encounter '{name}' needs at least one outcome without conditions")
+        # Blocked outcomes -> (sampler, outcome positions it picks from). Built the first
+        # time each combination turns up, usually just the one where nothing is blocked
+        self.samplers = {}
+
+    def roll(self, game, repeats):
+        # Pick an outcome, weighted, from the ones allowed right now
+        blocked = tuple(i for i in self.conditional
+                        if not outcome_allowed(game, self.outcomes[i], repeats))
+        compiled = self.samplers.get(blocked)
+        if compiled is None:
+            allowed = [i for i in range(len(self.outcomes)) if i not in blocked]
+            compiled = (AliasTable([self.outcomes[i]["weight"] for i in allowed]), allowed)
+            self.samplers[blocked] = compiled
+        sampler, allowed = compiled
+        return self.outcomes[allowed[sampler.sample(game.rng)]]
+
+encounter_tables = {name: EncounterTable(name, outcomes) for name, outcomes in ENCOUNTERS.items()}
+
+def run_encounter(game, name):
+    # Roll on an encounter table and apply what happens
+    repeats = game.encounter_counts.get(name, 0)
+    outcome = encounter_tables[name].roll(game, repeats)
+    game.encounter_counts[name] = repeats + 1
+    slow_print(outcome["text"])
+    effect, *args = outcome["effect"]
+    getattr(game, effect)(*args)
+
 def search_cupboard(game):
     # Random encounter when searching kitchen cupboard
-    outcomes = [
-        ("Something scurries out and bites your ankle!", lambda: game.lose_life(1, "The bite burns. Infection sets in.")),
-        ("Hands. Cold, dead hands reach out.", lambda: game.lose_life(1, "They're so cold. They pull you closer.")),
-        ("A rusted blade falls out, cutting you.", lambda: game.lose_life(1, "Blood drips onto the floor.")),
-        ("The door slams near your face.", lambda: game.lose_sanity(8, "That was too close.")),
-        ("A small, rusted key hidden behind a false panel!", lambda: game.add_item("rusty key")),
-        ("Nothing. Just cobwebs and rot.", lambda: game.lose_sanity(3, "The emptiness feels deliberate.")),
-    ]
-    outcome = random.choice(outcomes)
-    slow_print(outcome[0])
-    if callable(outcome[1]): 
-        outcome[1]()
+    run_encounter(game, "cupboard")
 
 def search_wardrobe(game):
     # Random encounter when searching master bedroom wardrobe
-    outcomes = [
-        ("Something inside grabs you!", lambda: game.lose_life(1, "The wardrobe tries to swallow you.")),
-        ("The door slams with a deafening bang.", lambda: game.lose_sanity(7, "Did something hear that?")),
-        ("A wooden crucifix hangs inside, glowing faintly.", lambda: game.add_item("crucifix")),
-        ("Empty. But you swear something moved.", lambda: game.lose_sanity(5, "The shadows weren't right."))
-    ]
-    outcome = random.choice(outcomes)
-    slow_print(outcome[0])
-    if callable(outcome[1]): 
-        outcome[1]()
+    run_encounter(game, "wardrobe")
 
 def use_cassette_player(game):
     # Play cassette tape in library for important clues
-    if game.current_room.name != "Library":
+    if game.current_room.id != world.room_ids["Library"]:
         slow_print("There's nothing to play it on here.")
         game.lose_sanity(3)
         return
@@ -324,17 +953,17 @@ def use_cassette_player(game):
     game.notes_read.add("tape_played")
     slow_print("You insert the cassette tape...")
     slow_print("Static crackles. Then a distorted voice:")
-    time.sleep(1)
+    pause(1)
     slow_print('"Graeme... if you find this..."')
-    time.sleep(1)
+    pause(1)
     slow_print('"Three things you need. The holy symbol protects..."')
-    time.sleep(1)
+    pause(1)
     slow_print('"The blade strikes true... The book binds evil..."')
-    time.sleep(1)
+    pause(1)
     slow_print('"Together... only together can you end this..."')
-    time.sleep(1)
+    pause(1)
     slow_print('"The basement... that\'s where it sleeps..."')
-    time.sleep(1)
+    pause(1)
     slow_print('"But the attic... secrets in the locked box... the crowbar..."')
     slow_print("")
     slow_print("The tape ends with a scream.")
@@ -353,35 +982,13 @@ def use_crowbar_on_box(game):
     
     slow_print("You wedge the crowbar under the lid.")
     slow_print("Wood splinters. Metal groans. The lock breaks.")
-    time.sleep(1)
+    pause(1)
     slow_print("Inside, you find a faded journal and a photograph.")
-    time.sleep(1)
+    pause(1)
     game.locked_box_opened = True
+    spawn_ghost(game, "whispering shade")
     
-    read_note(game, "locked_box_journal", [
-        "Graeme's Final Journal Entry:",
-        "",
-        "October 31st, 1952",
-        "",
-        "Margaret is dead. Thomas too. Sarah vanished three days ago.",
-        "I know what waits for me in the basement.",
-        "",
-        "If anyone finds this - you need three things:",
-        "1. The CRUCIFIX from the master bedroom - it wards off evil",
-        "2. The KNIFE from the kitchen - blessed steel cuts through darkness",
-        "3. The ANCIENT BOOK from the library - contains the binding ritual",
-        "",
-        "Without all three, you cannot defeat what lurks below.",
-        "The basement door requires the RUSTY KEY from the kitchen.",
-        "",
-        "The garden is death. Don't go outside.",
-        "The mirrors show truth. Don't look at them.",
-        "",
-        "I'm going down now. I won't be coming back up.",
-        "May God have mercy on whoever comes next.",
-        "",
-        "- Graeme Crampton"
-    ])
+    read_note(game, "locked_box_journal", load_text(packed("attic/locked box journal")))
     
     game.add_item("old photograph")
     slow_print("\nThe photograph shows a family: a man, woman, and two children.")
@@ -394,16 +1001,16 @@ def boss_fight(game):
     slow_print("You unlock the basement door and descend into absolute darkness.")
     slow_print("The door slams shut behind you. A lock clicks.")
     slow_print("")
-    time.sleep(1)
+    pause(1)
     slow_print("Something moves in the darkness. Multiple somethings.")
     slow_print("Red eyes open. One pair. Then another. Then dozens.")
     slow_print("")
-    time.sleep(1)
+    pause(1)
     slow_print("A DARK FIGURE emerges from the shadows - tall, wrong, impossible.")
     slow_print("Its eyes burn like coals. It reaches for you with too many arms.")
     slow_print("This is the thing that killed the Cramptons.")
     slow_print("="*75)
-    time.sleep(1)
+    pause(1)
     
     has_knife = "knife" in game.inventory
     has_crucifix = "crucifix" in game.inventory
@@ -414,11 +1021,11 @@ def boss_fight(game):
         slow_print("\nYou hold the knife, crucifix, and ancient book.")
         slow_print("The book falls open to a page marked in dried blood.")
         slow_print("You begin reading the Latin words aloud...")
-        time.sleep(1)
+        pause(1)
         slow_print("The crucifix blazes with holy light!")
         slow_print("The figure SCREAMS - a sound that shouldn't exist.")
         slow_print("You drive the knife forward with the last word of the ritual.")
-        time.sleep(1)
+        pause(1)
         slow_print("The blade strikes true. The figure explodes into shadow and ash.")
         slow_print("The darkness lifts. The house... breathes out.")
         slow_print("The curse is broken. The Cramptons can finally rest.")
@@ -432,7 +1039,7 @@ def boss_fight(game):
         slow_print("The crucifix glows, weakening the figure.")
         slow_print("But without the book, you can't complete the ritual!")
         slow_print("You strike with the knife anyway!")
-        time.sleep(1)
+        pause(1)
         slow_print("The figure staggers but fights back viciously!")
         game.lose_life(2, "Its claws rake across you!")
         if game.lives > 0:
@@ -497,20 +1104,7 @@ grand_hall = Room(
 )
 
 # Note added via examine
-grand_hall.objects["entrance note"]["description"] = """A note in shaky handwriting:
-
-'To whoever enters this house - turn back now.
-
-If you cannot leave, then listen:
-- The KITCHEN holds supplies and a key
-- The LIBRARY contains knowledge 
-- The ATTIC has secrets in a locked box
-- The BASEMENT is where everything ends
-
-Find what you need. Escape if you can.
-But don't trust the mirrors. And never go to the garden.
-
-- Margaret Crampton, Final Warning'"""
+grand_hall.objects["entrance note"]["description"] = packed("grand_hall/entrance note")
 
 kitchen = Room(
     "Kitchen",
@@ -533,21 +1127,7 @@ kitchen = Room(
             "examined_description": "The drawer is empty now, just rusty spoons and forks remain."
         },
         "recipe note": {
-            "description": """A recipe card with writing on the back:
-
-'Day 4 in this hell
-
-The scratching in the walls won't stop. Sarah says she hears 
-children laughing upstairs, but there are no children here.
-There haven't been children here for ten years.
-
-Graeme says the basement key is hidden in the kitchen.
-Behind a false panel in the cupboard.
-He won't tell us why he locked the basement in the first place.
-
-The RUSTY KEY - that's our way to answers. Or our doom.
-
-I'm so scared. - Margaret'""",
+            "description": packed("kitchen/recipe note"),
             "items": []
         }
     }
@@ -578,25 +1158,7 @@ library = Room(
             "action": "use_cassette_player"
         },
         "journal": {
-            "description": """A leather journal, water-damaged:
-
-'October 28th, 1952 - Graeme Crampton
-
-I found something in the basement. Something that shouldn't exist.
-It killed Thomas. Just... took him. Sarah saw it happen and now 
-she won't stop screaming.
-
-I've locked the basement. The RUSTY KEY is hidden in the kitchen
-cupboard, behind the false panel. No one can go down there.
-
-But I know I'll have to eventually. To end this.
-
-I'm gathering what I need:
-- The CRUCIFIX from our bedroom - blessed by Father Michael
-- The KNIFE from the kitchen - forged with iron from a church bell  
-- The ANCIENT BOOK from this library - contains the binding ritual
-
-If I fail... may God forgive me.'""",
+            "description": packed("library/journal"),
             "items": []
         }
     }
@@ -617,37 +1179,11 @@ basement = Room(
             "items": []
         },
         "warning": {
-            "description": """Words carved into the stone wall:
-
-'TURN BACK
-NOT READY
-NEED THREE THINGS
-CRUCIFIX - KNIFE - BOOK
-TOGETHER OR DIE'
-
-The letters are carved deep, desperately.""",
+            "description": packed("basement/warning"),
             "items": []
         },
         "final message": {
-            "description": """Papers scattered on the floor, stained dark:
-
-'FINAL ENTRY - Graeme Crampton - October 31st, 1952
-
-I'm going to face it. I have the three items.
-The CRUCIFIX to ward it off.
-The KNIFE to strike it down.
-The ANCIENT BOOK to bind it forever.
-
-If you're reading this, I failed.
-
-You need ALL THREE ITEMS to defeat what's down here.
-Without them, you will die.
-
-The door requires the RUSTY KEY from the kitchen.
-
-Tell Margaret I'm sorry. Tell Sarah I love-'
-
-[The writing ends in a long streak of blood]""",
+            "description": packed("basement/final message"),
             "items": []
         }
     }
@@ -700,25 +1236,7 @@ second_floor_hall = Room(
             "items": []
         },
         "hidden note": {
-            "description": """A note hidden under loose carpet:
-
-'Day 6 - Jacob writing
-
-The children's room is dangerous. Whatever you do,
-don't wind up the music box. I made that mistake.
-Last night I heard it playing by itself.
-
-This morning, Thomas was gone. We searched everywhere.
-Graeme found him in the basement. What was left of him.
-
-The master bedroom has protection. Margaret's CRUCIFIX.
-It helped her sleep through the whispers.
-I don't think any of us will sleep again.
-
-The UTILITY ROOM has tools. Maybe something useful.
-Maybe something to help us break out.
-
-God help us all. - Jacob, October 30th, 1952'""",
+            "description": packed("second_floor_hall/hidden note"),
             "items": []
         }
     }
@@ -744,35 +1262,7 @@ master_bedroom = Room(
             "action": "search_wardrobe"
         },
         "letter": {
-            "description": """A letter on the dresser, never sent:
-
-'My Dearest Elizabeth,
-
-By the time anyone reads this, we will be gone.
-The Crampton Estate has claimed us, as it has claimed 
-so many others before.
-
-We tried to leave. God knows we tried.
-But the house... it doesn't let go.
-The doors lock. The windows won't break.
-And the thing in the basement... it's spreading.
-
-If you value your life, never come looking for us.
-Let the house keep its dead.
-
-The children miss you. Sarah asks about you every day.
-I tell her you're coming. I lie to my own daughter.
-Because I know we're never leaving this place.
-
-Tell Graeme's brother we're sorry. Tell him to stay away.
-
-The CRUCIFIX in the wardrobe is blessed. It protects.
-But not forever. Nothing lasts forever here.
-
-I'm so sorry. I'm so, so sorry.
-
-Forever yours,
-Margaret Crampton'""",
+            "description": packed("master_bedroom/letter"),
             "items": []
         }
     }
@@ -795,27 +1285,11 @@ kids_bedroom = Room(
         "music box": {
             "description": "A delicate music box with a spinning ballerina. Something tells you NOT to wind it up. The last person who did... didn't survive.",
             "items": [],
-            "health": -2
+            "health": -2,
+            "haunting": ("music_box", 6)
         },
         "drawing": {
-            "description": """A child's drawing in crayon:
-
-A crude house drawn in black.
-Stick figures with X's for eyes scattered around it.
-One figure stands in an upstairs window.
-It has too many eyes. Too many arms.
-Drawn in red crayon.
-
-In a child's handwriting at the bottom:
-'our frend in the atik'
-(The 'k' is backwards)
-
-Next to it, in adult handwriting:
-'Sarah drew this the day before she disappeared.
- She said her "friend" taught her how.
- I found this under her pillow.
- I found blood on the pillow too.
- - Margaret'"""
+            "description": packed("kids_bedroom/drawing")
         }
     }
 )
@@ -866,33 +1340,7 @@ utility_room = Room(
             "items": []
         },
         "maintenance log": {
-            "description": """A maintenance log, written in neat handwriting:
-
-'Crampton Estate - Maintenance Notes
-Jacob Harris, Groundskeeper
-
-October 15th, 1952:
-Fixed leak in kitchen. Mr. Crampton seemed distracted.
-
-October 20th, 1952:
-Strange sounds from basement. Mr. Crampton says not to worry.
-CROWBAR in utility room if needed for repairs.
-
-October 25th, 1952:
-The boy Thomas is missing. Mrs. Crampton won't stop crying.
-Something is wrong in this house.
-
-October 28th, 1952:
-I tried to leave. The front door won't open.
-I'm trapped here with them.
-
-The CROWBAR might break us out. Or break open that
-box in the attic. Graeme kept saying something was
-hidden up there. Something important.
-
-God, I just want to go home.
-
-[The rest of the pages are blank]'""",
+            "description": packed("utility_room/maintenance log"),
             "items": []
         }
     }
@@ -918,16 +1366,7 @@ dining_room = Room(
             "items": []
         },
         "place settings": {
-            "description": """Each plate has a name card:
-
-'Graeme Crampton' - Head of table
-'Margaret Crampton' - Opposite end
-'Thomas Crampton' - Left side
-'Sarah Crampton' - Right side
-
-A fifth card sits in the center of the table, blank.
-Waiting for a name.
-Waiting for you.""",
+            "description": packed("dining_room/place settings"),
             "items": []
         }
     }
@@ -954,27 +1393,7 @@ living_room = Room(
             "items": []
         },
         "family note": {
-            "description": """A note tucked behind a photograph frame:
-
-'To whoever finds this,
-
-This room was where we gathered. Where we felt safe.
-Before the basement. Before everything went wrong.
-
-The SMALL KEY in the fireplace opens the conservatory door.
-But don't go to the garden. Please. Don't make our mistake.
-
-We went out there looking for Sarah.
-We found things in the garden.
-Bodies. So many bodies.
-
-It hunts in the garden. 
-If you go outside, it will find you.
-
-Stay inside. Find the RUSTY KEY. Face what's in the basement.
-That's the only way to end this.
-
-- Margaret, October 30th, 1952'""",
+            "description": packed("living_room/family note"),
             "items": []
         }
     }
@@ -996,31 +1415,7 @@ conservatory = Room(
             "action": "garden_door"
         },
         "gardener's log": {
-            "description": """A weathered journal on a potting bench:
-
-'Gardener's Log - Crampton Estate
-
-October 1st, 1952:
-All the plants died overnight. Every single one.
-The house is poisoning the soil somehow.
-
-October 10th, 1952:
-Something walks in the garden at night.
-I've seen it. Tall. Wrong shape. Too many limbs.
-I told Mr. Crampton. He just stared at me.
-
-October 15th, 1952:
-Found bodies in the garden. Old bones. New bones.
-This has been happening for years. Decades maybe.
-The garden FEEDS it.
-
-October 20th, 1952:
-Don't go outside. NEVER GO OUTSIDE.
-The SMALL KEY opens this door but it's a trap.
-The garden is death.
-
-[The final entry is just repeated words:]
-DON'T GO OUT DON'T GO OUT DON'T GO OUT'""",
+            "description": packed("conservatory/gardener's log"),
             "items": []
         }
     }
@@ -1091,78 +1486,696 @@ attic.neighbors = {
     "down": bathroom
 }
 
+# Every room in the house in a fixed order - a room's position here is its room id
+all_rooms = [
+    grand_hall, kitchen, library, basement, attic, second_floor_hall,
+    master_bedroom, kids_bedroom, bathroom, utility_room, dining_room,
+    living_room, conservatory
+]
+
+def collect_items(rooms):
+    # Every item that can end up in the inventory, in a fixed order
+    items = []
+    for room in rooms:
+        for obj_info in room.objects.values():
+            for item in obj_info.get("items", []):
+                if item and item not in items:
+                    items.append(item)
+    # Items that only come from actions, not from examining objects
+    for item in ("rusty key", "crucifix", "old photograph"):
+        if item not in items:
+            items.append(item)
+    return items
+
+all_items = collect_items(all_rooms)
+
+def clone_world(rooms):
+    # A separate copy of the house, so a game can change it without touching anyone else's
+    return copy.deepcopy(rooms)
+
+def snapshot_world(rooms):
+    # Remember the parts of the rooms that examining things changes (items and descriptions).
+    # Only objects still holding items can change, and examine_object swaps in a new
+    # items list rather than emptying the old one, so keeping the original list
+    # objects is enough to put them back later
+    snapshot = []
+    for room in rooms:
+        for obj_info in room.objects.values():
+            if obj_info.get("items"):
+                snapshot.append((obj_info, obj_info["items"], obj_info["description"]))
+    return snapshot
+
+def restore_world(snapshot):
+    # Put the rooms back how they were when the snapshot was taken
+    for obj_info, items, description in snapshot:
+        if obj_info.get("items") is not items:
+            obj_info["items"] = items
+        if obj_info["description"] is not description:
+            obj_info["description"] = description
+
+# Autosave - every turn is appended to a journal as a small record of what changed,
+# and every SNAPSHOT_EVERY turns the whole game is written out and the journal starts again.
+# Each record is written straight through to the file, so killing the game
+# loses the current turn at most
+SAVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "saves")
+SNAPSHOT_EVERY = 20
+
+class RecordedRandom(random.Random):
+    # Random that remembers every number it draws, so the journal can log the dice rolls
+    def __init__(self, seed=None):
+        super().__init__(seed)
+        self.draws = []
+
+    def random(self):
+        value = super().random()
+        self.draws.append(value)
+        return value
+
+def save_state(game):
+    # Every GameState field as plain values that can go in a save file
+    state = {}
+    for field, value in vars(game).items():
+        if field == "rng":
+            continue
+        if field == "current_room":
+            value = value.name
+        elif isinstance(value, set):
+            value = sorted(value)
+        elif isinstance(value, (list, dict)):
+            value = copy.copy(value)
+        state[field] = value
+    return state
+
+def load_state(game, state, rooms):
+    # Put saved values back onto a GameState
+    room_by_name = {room.name: room for room in rooms}
+    for field, value in state.items():
+        if field == "current_room":
+            value = room_by_name[value]
+        elif isinstance(getattr(game, field, None), set):
+            value = set(value)
+        setattr(game, field, value)
+    # Counted again from the heap rather than trusted - older saves don't have it
+    game.scheduled = {}
+    for timer in getattr(game, "timers", ()):
+        game.scheduled[timer[2]] = game.scheduled.get(timer[2], 0) + 1
+
+class TurnJournal:
+    def __init__(self, session, rooms, rng):
+        self.session = session
+        self.rooms = rooms
+        self.rng = rng
+        self.snapshot_path = os.path.join(SAVE_DIR, f"{session}.snapshot.json")
+        self.journal_path = os.path.join(SAVE_DIR, f"{session}.journal")
+        self.turn = 0
+        self.action = None
+        self.last_state = {}
+        self.world_changes = {}  # "Room/object" -> items and description, everything changed so far
+        self.file = None
+
+        # Only objects that still hold items can change
+        self.watched = []
+        for room in rooms:
+            for obj_name, obj_info in room.objects.items():
+                if obj_info.get("items"):
+                    self.watched.append((f"{room.name}/{obj_name}", obj_info))
+
+    @classmethod
+    def start(cls, game, rooms, session=None):
+        # Start journalling a brand new game (named after the time unless a session id is given)
+        os.makedirs(SAVE_DIR, exist_ok=True)
+        game.rng = RecordedRandom()
+        journal = cls(session or time.strftime("%Y%m%d-%H%M%S"), rooms, game.rng)
+        journal.last_state = save_state(game)
+        journal.write_snapshot(game)
+        return journal
+
+    @classmethod
+    def resume(cls, session, game, rooms):
+        # Load the snapshot, then replay the journal tail on top of it
+        with open(os.path.join(SAVE_DIR, f"{session}.snapshot.json"), encoding="utf-8") as f:
+            snapshot = json.load(f)
+        rng = RecordedRandom()
+        version, internal, gauss = snapshot["rng"]
+        rng.setstate((version, tuple(internal), gauss))
+        game.rng = rng
+        load_state(game, snapshot["state"], rooms)
+        object_by_key = {
+            f"{room.name}/{obj_name}": obj_info
+            for room in rooms for obj_name, obj_info in room.objects.items()
+        }
+        world_changes = dict(snapshot["world"])
+        turn = snapshot["turn"]
+
+        journal_path = os.path.join(SAVE_DIR, f"{session}.journal")
+        if os.path.exists(journal_path):
+            with open(journal_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # half-written last turn from a crash
+                    if record["turn"] <= turn:
+                        continue  # already in the snapshot
+                    load_state(game, record["state"], rooms)
+                    world_changes.update(record["world"])
+                    # Roll the dice again so the random numbers carry on exactly where they were
+                    for _ in record["draws"]:
+                        random.Random.random(rng)
+                    turn = record["turn"]
+
+        for key, change in world_changes.items():
+            object_by_key[key]["items"] = change["items"]
+            object_by_key[key]["description"] = change["description"]
+
+        journal = cls(session, rooms, rng)
+        journal.turn = turn
+        journal.world_changes = world_changes
+        journal.last_state = save_state(game)
+        journal.write_snapshot(game)
+        return journal
+
+    def note_action(self, *action):
+        # Remember what the player chose this turn
+        self.action = list(action)
+
+    def record_turn(self, game):
+        # Append what changed since the last record. Nothing is written if nothing happened
+        state = save_state(game)
+        changes = {field: value for field, value in state.items() if self.last_state.get(field) != value}
+        world = {}
+        for key, obj_info in self.watched:
+            # Items get taken, and come back if the game is rewound. An object we haven't
+            # logged yet still holds its items, so emptied means changed
+            logged = self.world_changes.get(key)
+            if (logged["items"] != obj_info["items"]) if logged else not obj_info["items"]:
+                world[key] = {"items": list(obj_info["items"]), "description": obj_info["description"]}
+        if not changes and not world and self.action is None:
+            return
+
+        self.turn += 1
+        self.world_changes.update(world)
+        self.last_state = state
+        record = {"turn": self.turn, "action": self.action, "draws": self.rng.draws, "state": changes, "world": world}
+        self.file.write(json.dumps(record) + "\n")
+        self.action = None
+        self.rng.draws = []
+
+        if self.turn % SNAPSHOT_EVERY == 0:
+            self.write_snapshot(game)
+
+    def write_snapshot(self, game):
+        # Write the whole game out (replacing the old snapshot in one go), then start an empty journal
+        snapshot = {
+            "session": self.session,
+            "turn": self.turn,
+            "rng": self.rng.getstate(),
+            "state": save_state(game),
+            "world": self.world_changes,
+        }
+        temp_path = self.snapshot_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        os.replace(temp_path, self.snapshot_path)
+        if self.file:
+            self.file.close()
+        self.file = open(self.journal_path, "w", encoding="utf-8", buffering=1)
+
+    def rewound(self, game):
+        # The game has gone back some turns. Replaying the journal can't undo anything,
+        # so write the whole game out again as it is now
+        for key, obj_info in self.watched:
+            self.world_changes[key] = {"items": list(obj_info["items"]), "description": obj_info["description"]}
+        self.last_state = save_state(game)
+        self.action = None
+        self.rng.draws = []
+        self.write_snapshot(game)
+
+    def suspend(self, game):
+        # The game is being dropped from memory for a while - write it out as it is
+        # right now, so resume picks it up from exactly here
+        self.rewound(game)
+        self.file.close()
+
+    def finish(self):
+        # The game is over - nothing left to resume
+        self.file.close()
+        delete_session(self.session)
+
+def delete_session(session):
+    # Remove a saved game's files
+    for name in (f"{session}.snapshot.json", f"{session}.journal"):
+        path = os.path.join(SAVE_DIR, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+# Rewinding - every turn the game was in is kept, so the player can go back any number
+# of turns. Each turn is a tuple of chunks, and each chunk a tuple of HISTORY_CHUNK
+# field values. Lists, dicts and sets are kept frozen (tuples, FrozenDicts and
+# frozensets), so the live game can't change them underneath the history and they
+# never need copying. A turn only makes new chunks where a field changed and shares
+# all the others - and every value it didn't change - with the turn before, so a turn
+# costs what changed in it. Going back compares the turn with the game as it stands
+# and thaws out only the fields that differ
+HISTORY_CHUNK = 8
+
+class FrozenDict(tuple):
+    # A dict as its (key, value) pairs, so it can be told apart from a list when thawed
+    pass
+
+def freeze(value):
+    # A field's value as one nothing can change
+    kind = type(value)
+    if kind is list:
+        return tuple(map(freeze, value))
+    if kind is dict:
+        return FrozenDict(zip(value, map(freeze, value.values())))
+    if kind is set:
+        return frozenset(value)
+    return value
+
+def thaw(value):
+    # A frozen value as the game uses it
+    if isinstance(value, FrozenDict):
+        return {key: thaw(item) for key, item in value}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    if isinstance(value, frozenset):
+        return set(value)
+    return value
+
+class TurnHistory:
+    def __init__(self, game, rooms):
+        self.fields = [field for field in vars(game) if field != "rng"]  # the dice aren't rewound
+        self.containers = [i for i, field in enumerate(self.fields) if type(getattr(game, field)) in (list, dict, set)]
+        # Only objects that still hold items can change
+        self.objects = [obj_info for room in rooms for obj_info in room.objects.values() if obj_info.get("items")]
+        self.turns = []
+        self.count = 0  # turns kept - anything past this in turns was rewound away, and gets written over
+
+    def read(self, game):
+        # Every value kept for a turn, frozen - the game's fields, then (items, description) for each object
+        values = [getattr(game, field) for field in self.fields]
+        for i in self.containers:
+            values[i] = freeze(values[i])
+        values += [(tuple(obj_info["items"]), obj_info["description"]) for obj_info in self.objects]
+        return values
+
+    def record(self, game):
+        # Keep the game as it is at the start of a turn
+        values = self.read(game)
+        if not self.count:
+            turn = tuple(tuple(values[i:i + HISTORY_CHUNK]) for i in range(0, len(values), HISTORY_CHUNK))
+        else:
+            turn = self.turns[self.count - 1]
+            changed = {}
+            for i, value in enumerate(values):
+                chunk, slot = divmod(i, HISTORY_CHUNK)
+                if turn[chunk][slot] != value:
+                    changed.setdefault(chunk, list(turn[chunk]))[slot] = value
+            if changed:
+                turn = tuple(tuple(changed[chunk]) if chunk in changed else turn[chunk] for chunk in range(len(turn)))
+        if self.count < len(self.turns):
+            self.turns[self.count] = turn
+        else:
+            self.turns.append(turn)
+        self.count += 1
+
+    def rewind(self, game, turns=1):
+        # Put the game back how it was at the start of an earlier turn (or the first one),
+        # ready for that turn to be recorded and played again. It's compared with the game
+        # as it is now rather than as it was last recorded - the turn's sanity drain and
+        # hauntings have happened since. Returns how many turns it went back
+        target = max(0, self.count - 1 - turns)
+        now = self.read(game)
+        for chunk, values in enumerate(self.turns[target]):
+            for slot, value in enumerate(values):
+                index = chunk * HISTORY_CHUNK + slot
+                if value != now[index]:
+                    self.put_back(game, index, value)
+        went_back = self.count - 1 - target
+        self.count = target
+        return went_back
+
+    def trim(self, keep):
+        # Forget all but the last keep turns - they can't be rewound to any more
+        self.turns = self.turns[max(0, self.count - keep):self.count]
+        self.count = len(self.turns)
+
+    def put_back(self, game, index, value):
+        if index < len(self.fields):
+            setattr(game, self.fields[index], thaw(value))
+        else:
+            items, description = value
+            obj_info = self.objects[index - len(self.fields)]
+            obj_info["items"] = list(items)
+            obj_info["description"] = description
+
+# Achievements. Each one is a test over fields GameState keeps anyway, and says which
+# fields it reads. AchievementTracker files them under those fields, and once a turn
+# compares just the watched fields with how they were last time - only achievements
+# reading a field that changed are tested again, so a turn costs the same whether
+# there are five or five hundred. A test returns True once it's earned, False once
+# it can't be any more (either way it stops being tested), or None for not yet.
+# Earned ones go in game.achievements, so they're saved and rewound with the game
+def read_every_note(game):
+    return True if world.notes <= game.notes_read else None
+
+def win_without_resting(game):
+    if game.used_life_bonus:
+        return False
+    return True if game.escaped else None
+
+def survive_the_garden(game):
+    # Into the conservatory and out again without anything touching you
+    if game.room_death_count.get("Conservatory"):
+        return False
+    if "Conservatory" in game.room_visited and game.current_room.name != "Conservatory":
+        return True
+    return None
+
+def no_deaths_anywhere(game):
+    if game.room_death_count:
+        return False
+    return True if game.escaped else None
+
+def box_before_tape(game):
+    if game.locked_box_opened:
+        return "cassette tape" not in game.inventory
+    return False if "cassette tape" in game.inventory else None
+
+ACHIEVEMENTS = {
+    "bookworm": {
+        "title": "Bookworm",
+        "text": "Read every note in the house.",
+        "watches": ("notes_read",),
+        "test": read_every_note,
+    },
+    "iron_will": {
+        "title": "Iron Will",
+        "text": "Escape without resting once.",
+        "watches": ("used_life_bonus", "escaped"),
+        "test": win_without_resting,
+    },
+    "green_thumb": {
+        "title": "Green Thumb",
+        "text": "Leave the conservatory without a scratch.",
+        "watches": ("current_room", "room_death_count"),
+        "test": survive_the_garden,
+    },
+    "untouchable": {
+        "title": "Untouchable",
+        "text": "Escape without anything laying a finger on you.",
+        "watches": ("room_death_count", "escaped"),
+        "test": no_deaths_anywhere,
+    },
+    "curiosity": {
+        "title": "Curiosity",
+        "text": "Open the locked box before finding the tape.",
+        "watches": ("locked_box_opened", "inventory"),
+        "test": box_before_tape,
+    },
+}
+
+class AchievementTracker:
+    def __init__(self, achievements=ACHIEVEMENTS):
+        self.achievements = achievements
+        self.watchers = {}  # field -> keys of the achievements that read it
+        for key, achievement in achievements.items():
+            for field in achievement["watches"]:
+                self.watchers.setdefault(field, []).append(key)
+        self.last = {}      # field -> its value when last looked at
+        self.settled = set()  # keys that are earned or can't be any more
+
+    def update(self, game):
+        # Test whatever reads a field that has changed, and announce anything earned.
+        # The first time round every field counts as changed. Returns the keys earned
+        changed = set()
+        for field, keys in self.watchers.items():
+            value = freeze(getattr(game, field))
+            if field not in self.last or self.last[field] != value:
+                self.last[field] = value
+                changed.update(keys)
+        earned = []
+        for key in changed - self.settled:
+            if key in game.achievements:
+                self.settled.add(key)
+                continue
+            result = self.achievements[key]["test"](game)
+            if result is None:
+                continue
+            self.settled.add(key)
+            if result:
+                earned.append(key)
+        for key in sorted(earned):
+            game.achievements = game.achievements | {key}
+            achievement = self.achievements[key]
+            slow_print(f"\n*** Achievement: {achievement['title']} - {achievement['text']} ***")
+        return earned
+
+    def rewound(self):
+        # The game has gone back - what couldn't be earned from where it was might be now
+        self.last.clear()
+        self.settled.clear()
+
+def latest_session():
+    # The most recent unfinished game in the saves folder, or None
+    if not os.path.isdir(SAVE_DIR):
+        return None
+    snapshots = [name for name in os.listdir(SAVE_DIR) if name.endswith(".snapshot.json")]
+    if not snapshots:
+        return None
+    newest = max(snapshots, key=lambda name: os.path.getmtime(os.path.join(SAVE_DIR, name)))
+    return newest[:-len(".snapshot.json")]
+
+# Typed commands - "examine wardrobe", "go up", "use crowbar" work as well as the menu letters.
+# Every room, object and item name goes into two lookup tables when the world loads:
+# a prefix table (a flattened trie - every prefix of every word points at the names
+# it could be the start of) and a trigram table for typos. Lookups only ever look
+# at names that are actually around you, so they stay fast however big the house gets
+
+# Words the player might type for each verb
+VERB_WORDS = {
+    "examine": "examine", "look": "examine", "read": "examine", "inspect": "examine",
+    "check": "examine", "open": "examine", "take": "examine", "get": "examine", "x": "examine",
+    "search": "search",
+    "go": "go", "move": "go", "walk": "go", "run": "go", "climb": "go", "enter": "go",
+    "use": "use", "play": "use", "unlock": "use",
+    "rest": "rest", "sleep": "rest",
+    "meditate": "meditate", "pray": "meditate",
+    "map": "map",
+    "inventory": "inventory", "pockets": "inventory", "i": "inventory",
+    "stats": "stats", "status": "stats",
+    "undo": "rewind", "rewind": "rewind",
+    "help": "help",
+}
+
+DIRECTION_WORDS = {
+    "north": "north", "n": "north", "south": "south", "s": "south",
+    "east": "east", "e": "east", "west": "west", "w": "west",
+    "up": "up", "u": "up", "upstairs": "up", "down": "down", "d": "down", "downstairs": "down",
+}
+
+# Words that don't change what the player means
+FILLER_WORDS = {"the", "a", "an", "at", "to", "on", "in", "into", "with", "my", "of"}
+
+# Items that do something when used, and the room action they trigger
+ITEM_ACTIONS = {
+    "crowbar": "use_crowbar",
+    "cassette tape": "cassette_player",
+    "rusty key": "use_key",
+    "small key": "garden_door",
+}
+
+# Verbs that are just a room action or menu entry
+SIMPLE_VERBS = {"rest": "rest", "meditate": "meditate", "map": "map", "inventory": "inventory", "stats": "stats"}
+
+def trigrams(text):
+    # Three-letter chunks of a word, padded so the start and end count too
+    text = f" {text} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class CommandIndex:
+    def __init__(self, rooms):
+        self.prefixes = {}   # prefix -> names it could be the start of
+        self.grams = {}      # trigram -> names containing it
+        self.gram_counts = {}
+        for name in list(VERB_WORDS) + list(DIRECTION_WORDS):
+            self.add(name)
+        for room in rooms:
+            self.add(room.name)
+            for obj_name in room.objects:
+                self.add(obj_name)
+        for item in collect_items(rooms):
+            self.add(item)
+
+    def add(self, name):
+        # Index a name under every prefix of each of its words, so "note" finds "recipe note"
+        key = name.lower()
+        words = key.split()
+        for start in range(len(words)):
+            tail = " ".join(words[start:])
+            for end in range(1, len(tail) + 1):
+                self.prefixes.setdefault(tail[:end], set()).add(name)
+        grams = trigrams(key)
+        self.gram_counts[name] = len(grams)
+        for gram in grams:
+            self.grams.setdefault(gram, set()).add(name)
+
+    def lookup(self, text, candidates, min_score=0.3):
+        # Find which of candidates the player means by text.
+        # Returns (name, None) on a match or (None, reason) if there isn't one
+        matches = self.prefixes.get(text, set()) & candidates
+        if len(matches) == 1:
+            return next(iter(matches)), None
+        if matches:
+            # Whole words beat prefixes - "box" means the locked box, not the boxes
+            whole = [name for name in matches if f" {name.lower()}".endswith(f" {text}")]
+            if len(whole) == 1:
+                return whole[0], None
+            return None, f"Which do you mean: {' or '.join(sorted(matches))}?"
+
+        # No prefix match - try the closest spelling instead
+        query = trigrams(text)
+        hits = {}
+        for gram in query:
+            for name in self.grams.get(gram, ()):
+                if name in candidates:
+                    hits[name] = hits.get(name, 0) + 1
+        best, best_score = None, 0.0
+        for name, shared in hits.items():
+            score = shared / (len(query) + self.gram_counts[name] - shared)
+            if score > best_score:
+                best, best_score = name, score
+        if best_score >= min_score:
+            return best, None
+        return None, f"You don't see any '{text}' here."
+
+    def verb(self, word):
+        # The verb a word stands for, or None
+        if word in VERB_WORDS:
+            return VERB_WORDS[word]
+        if word in DIRECTION_WORDS:
+            return None
+        name, _ = self.lookup(word, VERB_NAMES, min_score=0.4)
+        return VERB_WORDS[name] if name else None
+
+    def parse(self, game, text):
+        # Turn a typed command into (action_type, target) for game_loop, or (None, reason).
+        # target is None when the submenu should be shown instead
+        words = [word for word in text.lower().split() if word not in FILLER_WORDS]
+        if not words:
+            return None, None
+        room = game.current_room
+        menu_codes = {code for _, code in show_room_menu(game)}
+
+        verb = self.verb(words[0]) if len(words[0]) > 1 or words[0] in VERB_WORDS else None
+        noun = " ".join(words[1:] if verb else words)
+
+        if verb is None:
+            # Just a noun - a direction or neighbouring room means go there, an object means examine it
+            target = self.destination(room, noun)
+            if target:
+                return "movement", target
+            if noun in DIRECTION_WORDS:
+                return None, f"You can't go '{noun}' from here."
+            name, reason = self.lookup(noun, world.object_sets[room.id])
+            return ("examine", name) if name else (None, reason)
+
+        if verb == "help":
+            return "help", None
+        if verb == "rewind":
+            # "undo" goes back one turn, "rewind 3" three
+            if noun and not noun.isdigit():
+                return None, "Rewind how many turns?"
+            return "rewind", int(noun) if noun else 1
+        if verb in SIMPLE_VERBS:
+            code = SIMPLE_VERBS[verb]
+            return (code, None) if code in menu_codes else (None, "You can't do that here.")
+
+        if verb == "go":
+            if not noun:
+                return "movement", None
+            target = self.destination(room, noun)
+            return ("movement", target) if target else (None, f"You can't go '{noun}' from here.")
+
+        if verb == "search" and not noun:
+            # The room's search action, if it has one
+            for code in ("search_kitchen", "search_wardrobe"):
+                if code in menu_codes:
+                    return code, None
+            return None, "There's nothing here worth searching."
+
+        if not noun:
+            return "examine", None
+
+        if verb == "use":
+            name, reason = self.lookup(noun, world.object_sets[room.id] | set(game.inventory))
+            if name is None:
+                return None, reason
+            if name in room.objects:
+                return "examine", name
+            code = ITEM_ACTIONS.get(name)
+            if code and code in menu_codes:
+                return code, None
+            return None, f"The {name} is no use here."
+
+        # examine / search something
+        name, reason = self.lookup(noun, world.object_sets[room.id])
+        return ("examine", name) if name else (None, reason)
+
+    def destination(self, room, text):
+        # The direction that text means from this room - a direction word (or the start
+        # of one) or a neighbour's name. A direction there's no exit in goes nowhere,
+        # rather than to whichever neighbour's name starts with the same letter
+        directions = {DIRECTION_WORDS[name] for name in self.prefixes.get(text, ()) if name in DIRECTION_WORDS}
+        if directions:
+            direction = directions.pop() if len(directions) == 1 else None
+            return direction if direction in room.neighbors else None
+        neighbours = {next_room.name: direction for direction, next_room in room.neighbors.items()}
+        name, _ = self.lookup(text, set(neighbours))
+        return neighbours[name] if name else None
+
+VERB_NAMES = {word for word in VERB_WORDS if len(word) > 1}
+command_index = CommandIndex(all_rooms)
+
 # Game loop functions
+# Room-specific interactions on the main menu
+ROOM_ACTIONS = {
+    "Kitchen": ("Search cupboard for supplies", "search_kitchen"),
+    "Library": ("Use cassette player", "cassette_player"),
+    "Basement": ("Use rusty key on hidden door", "use_key"),
+    "Conservatory": ("Try garden door", "garden_door"),
+    "Master Bedroom": ("Search wardrobe", "search_wardrobe"),
+    "Attic": ("Use crowbar on locked box", "use_crowbar"),
+    "Kids Bedroom": ("Meditate to recover sanity", "meditate")
+}
+
+DIRECTION_NAMES = {
+    "north": "North",
+    "south": "South",
+    "east": "East",
+    "west": "West",
+    "up": "Upstairs/Up",
+    "down": "Downstairs/Down"
+}
+
 def show_room_menu(game):
-    # Display room-specific action menu
+    # Display room-specific action menu - the compiled menu for the room,
+    # plus the rest option (once per room)
     room = game.current_room
-    choices = []
-    
-    # Always available actions
-    choices.append(("View map", "map"))
-    choices.append(("Check inventory", "inventory"))
-    choices.append(("Show stats", "stats"))
-    
-    # Movement options
-    if room.neighbors:
-        choices.append(("Movement options", "movement"))
-    
-    # Examine objects
-    if room.objects:
-        choices.append(("Examine objects", "examine"))
-    
-    # Room-specific interactions
-    room_actions = {
-        "Kitchen": ("Search cupboard for supplies", "search_kitchen"),
-        "Library": ("Use cassette player", "cassette_player"),
-        "Basement": ("Use rusty key on hidden door", "use_key"),
-        "Conservatory": ("Try garden door", "garden_door"),
-        "Master Bedroom": ("Search wardrobe", "search_wardrobe"),
-        "Attic": ("Use crowbar on locked box", "use_crowbar"),
-        "Kids Bedroom": ("Meditate to recover sanity", "meditate")
-    }
-    
-    if room.name in room_actions:
-        choices.append(room_actions[room.name])
-    
-    # Rest option (once per room)
+    choices = list(world.main_menu[room.id])
     if room.name not in game.used_life_bonus:
         choices.append(("Rest and recover", "rest"))
-    
     return choices
 
 def handle_movement_menu(game):
     # Handle movement submenu
-    room = game.current_room
-    choices = []
-    
-    direction_names = {
-        "north": "North",
-        "south": "South",
-        "east": "East",
-        "west": "West",
-        "up": "Upstairs/Up",
-        "down": "Downstairs/Down"
-    }
-    
-    for direction, next_room in room.neighbors.items():
-        dir_name = direction_names.get(direction, direction.title())
-        choices.append((f"Go {dir_name} to {next_room.name}", direction))
-    
-    choices.append(("Back to main menu", "back"))
-    
-    return choices
+    return list(world.movement_menu[game.current_room.id])
 
 def handle_examine_menu(game):
     # Handle examine submenu
-    room = game.current_room
-    choices = []
-    
-    for obj_name in room.objects.keys():
-        choices.append((f"Examine {obj_name}", obj_name))
-    
-    choices.append(("Back to main menu", "back"))
-    
-    return choices
+    return list(world.examine_menu[game.current_room.id])
 
 def print_menu(choices):
     # Print menu choices with letter shortcuts - QUICK
@@ -1171,251 +2184,1082 @@ def print_menu(choices):
         quick_print(f"  {letter}) {description}")
     return letters
 
-def get_choice(letters):
-    # Get valid choice from player
-    while True:
-        choice = input("\n> ").strip().lower()
-        if choice in letters:
-            return letters.index(choice)
-        quick_print("Invalid choice. Please try again.")
-
-def handle_action(game, action_code):
-    # Handle special action codes
-    if action_code == "map":
-        game.show_map()
-        
-    elif action_code == "inventory":
-        if not game.inventory:
-            quick_print("Your pockets are empty. You have nothing.")
-        else:
-            quick_print("You check your pockets:")
-            for item in game.inventory:
-                quick_print(f"  - {item}")
-    
-    elif action_code == "stats":
-        game.show_stats()
+def unlock_basement(game):
+    # Try the rusty key on the hidden door in the basement.
+    # Returns True if the door opened and the player now has to choose whether to go down
+    if "rusty key" not in game.inventory:
+        slow_print("You need a key to unlock the hidden door.")
+        slow_print("The door remains sealed. Mocking you.")
+        game.lose_sanity(3)
+        return False
     
-    elif action_code == "rest":
-        game.gain_life(1)
-        slow_print("You take a moment to compose yourself.")
-        slow_print("Your racing heart begins to slow.")
-        
-    elif action_code == "search_kitchen":
-        search_cupboard(game)
-        
-    elif action_code == "cassette_player":
-        use_cassette_player(game)
-        
-    elif action_code == "use_crowbar":
-        use_crowbar_on_box(game)
-        
-    elif action_code == "use_key":
-        if "rusty key" not in game.inventory:
-            slow_print("You need a key to unlock the hidden door.")
-            slow_print("The door remains sealed. Mocking you.")
-            game.lose_sanity(3)
-        else:
-            slow_print("The RUSTY KEY slides into a hidden lock in the wall.")
-            slow_print("Metal scrapes against metal. The lock clicks loudly.")
-            slow_print("A door swings open, revealing stairs descending into darkness.")
-            slow_print("")
-            time.sleep(1)
-            slow_print("Cold air rushes up from below. You hear something breathing.")
-            slow_print("This is it. Whatever haunts this place waits below.")
-            slow_print("The thing that killed Graeme. That killed them all.")
-            slow_print("")
-            time.sleep(1)
-            
-            quick_print("Do you descend to face what waits in the darkness?")
-            quick_print("  a) Yes, it's time to end this")
-            quick_print("  b) No, not yet - I need to prepare")
-            
-            choice = input("\n> ").strip().lower()
-            if choice == 'a':
-                result = boss_fight(game)
-                if not result:
-                    game.game_over = True
-                return result
-            else:
-                slow_print("You step back from the darkness. Your courage falters.")
-                slow_print("Not yet. You're not ready yet.")
-                
-    elif action_code == "garden_door":
-        if "small key" not in game.inventory:
-            slow_print("The garden door is locked with a brass lock.")
-            slow_print("You need the SMALL KEY to open it.")
-            game.lose_sanity(2)
-        else:
-            slow_print("You unlock the garden door with the SMALL KEY.")
-            slow_print("The lock clicks. Cold wind rushes in.")
-            slow_print("You push the door open and step outside...")
-            slow_print("")
-            time.sleep(1)
-            slow_print("Bodies. Dozens of them. Pale and lifeless.")
-            slow_print("They're scattered across the overgrown grass.")
-            slow_print("Some are old - just bones. Others are fresh. Recent.")
-            slow_print("Their eyes stare blankly at the storm-dark sky.")
-            slow_print("")
-            time.sleep(1)
-            slow_print("A shadow moves between the trees. Fast. Inhuman.")
-            slow_print("It sees you. It's coming for you!")
-            slow_print("You slam the door and lock it, gasping for breath.")
-            slow_print("Something SLAMS against the door from outside.")
-            slow_print("Again. And again. And again.")
-            slow_print("Then... silence.")
-            game.lose_sanity(20)
-            game.lose_life(1, "The terror costs you dearly. Your hands won't stop shaking.")
-            
-    elif action_code == "search_wardrobe":
-        search_wardrobe(game)
-        
-    elif action_code == "meditate":
-        outcomes = [
-            ("You close your eyes and breathe deeply. Peace washes over you.", lambda: game.gain_sanity(15)),
-            ("As you meditate, you hear a child's laughter. Not threatening. Comforting.", lambda: game.gain_life(1)),
-            ("You feel a small hand take yours gently. When you open your eyes, you're alone.", lambda: game.gain_sanity(10)),
-            ("Something whispers in your ear: 'Run. Run now.' You jolt awake, heart pounding.", lambda: game.lose_sanity(5))
-        ]
-        outcome = random.choice(outcomes)
-        slow_print(outcome[0])
-        outcome[1]()
+    slow_print("The RUSTY KEY slides into a hidden lock in the wall.")
+    slow_print("Metal scrapes against metal. The lock clicks loudly.")
+    slow_print("A door swings open, revealing stairs descending into darkness.")
+    slow_print("")
+    pause(1)
+    slow_print("Cold air rushes up from below. You hear something breathing.")
+    slow_print("This is it. Whatever haunts this place waits below.")
+    slow_print("The thing that killed Graeme. That killed them all.")
+    slow_print("")
+    pause(1)
     
+    quick_print("Do you descend to face what waits in the darkness?")
+    quick_print("  a) Yes, it's time to end this")
+    quick_print("  b) No, not yet - I need to prepare")
+    return True
+
+def descend_to_basement(game, descend):
+    # The player's answer at the open basement door
+    if descend:
+        result = boss_fight(game)
+        if not result:
+            game.game_over = True
+        return result
+    slow_print("You step back from the darkness. Your courage falters.")
+    slow_print("Not yet. You're not ready yet.")
+    return None
+
+def move_player(game, direction):
+    # Walk through to the neighbouring room in that direction
+    game.current_room = game.current_room.neighbors[direction]
+    slow_print(f"\nYou move {direction}...")
+    slow_print("The floorboards creak under your weight.")
+    slow_print("Somewhere in the house, something stirs.")
+    pause(0.5)
+
+def use_object(game, obj_name):
+    # Examine an object, or run its special action if it has one
+    obj_id = world.object_ids[game.current_room.id].get(obj_name)
+    if obj_id is not None and world.object_action[obj_id]:
+        world.action_handlers[world.object_action[obj_id]](game)
+    else:
+        examine_object(game, obj_name)
+
+def show_inventory(game):
+    if not game.inventory:
+        quick_print("Your pockets are empty. You have nothing.")
+    else:
+        quick_print("You check your pockets:")
+        for item in game.inventory:
+            quick_print(f"  - {item}")
+
+def rest(game):
+    game.gain_life(1)
+    slow_print("You take a moment to compose yourself.")
+    slow_print("Your racing heart begins to slow.")
+
+def use_basement_key(game, descend=None):
+    # descend answers the basement question up front (None means ask the player)
+    if unlock_basement(game):
+        if descend is None:
+            descend = input("\n> ").strip().lower() == 'a'
+        return descend_to_basement(game, descend)
     return None
 
-def game_loop(game):
-    # Main game loop
+def open_garden_door(game):
+    if "small key" not in game.inventory:
+        slow_print("The garden door is locked with a brass lock.")
+        slow_print("You need the SMALL KEY to open it.")
+        game.lose_sanity(2)
+    else:
+        slow_print("You unlock the garden door with the SMALL KEY.")
+        slow_print("The lock clicks. Cold wind rushes in.")
+        slow_print("You push the door open and step outside...")
+        slow_print("")
+        pause(1)
+        slow_print("Bodies. Dozens of them. Pale and lifeless.")
+        slow_print("They're scattered across the overgrown grass.")
+        slow_print("Some are old - just bones. Others are fresh. Recent.")
+        slow_print("Their eyes stare blankly at the storm-dark sky.")
+        slow_print("")
+        pause(1)
+        slow_print("A shadow moves between the trees. Fast. Inhuman.")
+        slow_print("It sees you. It's coming for you!")
+        slow_print("You slam the door and lock it, gasping for breath.")
+        slow_print("Something SLAMS against the door from outside.")
+        slow_print("Again. And again. And again.")
+        slow_print("Then... silence.")
+        game.lose_sanity(20)
+        game.lose_life(1, "The terror costs you dearly. Your hands won't stop shaking.")
+
+# Every action there is, by the code a room menu (ROOM_ACTIONS and the menu every
+# room has) or an object's "action" uses for it. CompiledWorld numbers them for
+# its opcodes and refuses a room or object whose action isn't here
+ACTIONS = {
+    "map": lambda game: game.show_map(),
+    "inventory": show_inventory,
+    "stats": lambda game: game.show_stats(),
+    "rest": rest,
+    "search_kitchen": search_cupboard,
+    "search_cupboard": search_cupboard,
+    "search_wardrobe": search_wardrobe,
+    "meditate": lambda game: run_encounter(game, "meditate"),
+    "cassette_player": use_cassette_player,
+    "use_cassette_player": use_cassette_player,
+    "use_crowbar": use_crowbar_on_box,
+    "use_key": use_basement_key,
+    "garden_door": open_garden_door,
+}
+
+# What every room's main menu starts with
+EVERY_ROOM_MENU = (("View map", "map"), ("Check inventory", "inventory"), ("Show stats", "stats"))
+
+def handle_action(game, action_code, descend=None):
+    # Run a room action. descend answers the basement question up front (None
+    # means ask the player) - the rusty key is the only action that asks one.
+    # Returns the basement's outcome, or None
+    if ACTIONS[action_code] is use_basement_key:
+        return use_basement_key(game, descend)
+    ACTIONS[action_code](game)
+    return None
+
+# The map, laid out from the doors between rooms rather than drawn by hand. Going
+# north, south, east or west is a step on a grid, and up or down is the same spot
+# on the floor above or below - a room whose spot is already taken goes in the
+# nearest free one. Each floor is drawn as boxes with the doors between neighbours,
+# all of it once per world into one template string. Showing the map only patches
+# the visited markers that changed since it was last shown, at offsets worked out
+# when the template was made
+MAP_ROOM_WIDTH = 12  # inside each room's box
+MAP_GAP = 3          # between boxes, where the doors go
+MAP_STEPS = {"north": (0, -1), "south": (0, 1), "east": (1, 0), "west": (-1, 0)}
+MAP_FLOORS = {"up": 1, "down": -1}
+FLOOR_ORDINALS = ["FIRST", "SECOND", "THIRD", "FOURTH", "FIFTH"]
+VISITED, UNVISITED = "■", "□"
+
+def floor_name(floor):
+    # Floors are counted from the first room's, which is the first floor
+    if floor < 0:
+        return "BASEMENT" if floor == -1 else f"BASEMENT {-floor}"
+    return f"{FLOOR_ORDINALS[floor]} FLOOR" if floor < len(FLOOR_ORDINALS) else f"FLOOR {floor + 1}"
+
+def nearest_free(taken, floor, x, y):
+    # The spot closest to (x, y) on a floor that nothing is in yet
+    radius = 0
+    while True:
+        for dy in range(-radius, radius + 1):
+            for dx in range(-radius, radius + 1):
+                if max(abs(dx), abs(dy)) == radius and (floor, x + dx, y + dy) not in taken:
+                    return floor, x + dx, y + dy
+        radius += 1
+
+class FloorPlan:
+    def __init__(self, names, neighbors):
+        # names and neighbors are CompiledWorld's - room id -> name, and -> ((direction, room id), ...)
+        spots = {}  # room id -> (floor, x, y)
+        taken = set()
+        for first in range(len(names)):
+            if first in spots:
+                continue
+            # Anything not joined to the rooms already placed starts off to their east
+            right = max((x for _, x, _ in spots.values()), default=-2) + 2
+            spots[first] = nearest_free(taken, 0, right, 0)
+            taken.add(spots[first])
+            queue = collections.deque([first])
+            while queue:
+                room_id = queue.popleft()
+                floor, x, y = spots[room_id]
+                for direction, next_id in neighbors[room_id]:
+                    if next_id in spots:
+                        continue
+                    dx, dy = MAP_STEPS.get(direction, (0, 0))
+                    spots[next_id] = nearest_free(taken, floor + MAP_FLOORS.get(direction, 0), x + dx, y + dy)
+                    taken.add(spots[next_id])
+                    queue.append(next_id)
+
+        doors = {(room_id, next_id) for room_id, links in enumerate(neighbors) for _, next_id in links}
+        where = {spot: room_id for room_id, spot in spots.items()}
+        width = MAP_ROOM_WIDTH + 2
+
+        def joined(a, b):
+            return a is not None and b is not None and ((a, b) in doors or (b, a) in doors)
+
+        lines = ["", "=" * 75, "CRAMPTON ESTATE - FLOOR PLAN".center(75).rstrip(), "=" * 75]
+        markers = []  # (line, column, room name) for each room's visited marker
+        for floor in sorted({floor for floor, _, _ in spots.values()}, reverse=True):
+            cells = [(x, y) for f, x, y in spots.values() if f == floor]
+            left, right = min(x for x, _ in cells), max(x for x, _ in cells)
+            top, bottom = min(y for _, y in cells), max(y for _, y in cells)
+            lines += ["", f"  {floor_name(floor)}", ""]
+            for y in range(top, bottom + 1):
+                row = [where.get((floor, x, y)) for x in range(left, right + 1)]
+                box_lines = [[] for _ in range(5)]
+                for column, room_id in enumerate(row):
+                    if column:
+                        # The door to the room on the left, if there is one
+                        door = "─" * MAP_GAP if joined(row[column - 1], room_id) else " " * MAP_GAP
+                        for i, box_line in enumerate(box_lines):
+                            box_line.append(door if i == 2 else " " * MAP_GAP)
+                    if room_id is None:
+                        for box_line in box_lines:
+                            box_line.append(" " * width)
+                        continue
+                    name = textwrap.wrap(names[room_id].upper(), MAP_ROOM_WIDTH)[:2]
+                    name = ([""] + name) if len(name) == 1 else name
+                    stairs = "".join(arrow for arrow, step in (("▲", "up"), ("▼", "down"))
+                                     if any(direction == step for direction, _ in neighbors[room_id]))
+                    mark = (UNVISITED + (" " + stairs if stairs else "")).center(MAP_ROOM_WIDTH)
+                    above = "┻" if joined(where.get((floor, left + column, y - 1)), room_id) else "━"
+                    below = "┳" if joined(where.get((floor, left + column, y + 1)), room_id) else "━"
+                    half = MAP_ROOM_WIDTH // 2
+                    column_start = sum(len(part) for part in box_lines[3])
+                    box_lines[0].append("┏" + "━" * half + above + "━" * (MAP_ROOM_WIDTH - half - 1) + "┓")
+                    box_lines[1].append("┃" + name[0].center(MAP_ROOM_WIDTH) + "┃")
+                    box_lines[2].append("┃" + name[1].center(MAP_ROOM_WIDTH) + "┃")
+                    box_lines[3].append("┃" + mark + "┃")
+                    box_lines[4].append("┗" + "━" * half + below + "━" * (MAP_ROOM_WIDTH - half - 1) + "┛")
+                    markers.append((len(lines) + 3, 2 + column_start + 1 + mark.index(UNVISITED), names[room_id]))
+                lines += ["  " + "".join(box_line).rstrip() for box_line in box_lines]
+                if y < bottom:
+                    # Doors to the row below
+                    links = [joined(room_id, where.get((floor, left + column, y + 1))) for column, room_id in enumerate(row)]
+                    lines.append("  " + "".join(
+                        " " * (MAP_ROOM_WIDTH // 2 + 1) + ("│" if link else " ") + " " * (width - MAP_ROOM_WIDTH // 2 - 2 + MAP_GAP)
+                        for link in links).rstrip())
+        lines += ["", f"Legend: {VISITED} = visited  {UNVISITED} = unvisited  ▲ ▼ = stairs up / down", "=" * 75 + "\n"]
+
+        # The template is kept cut up at the markers - the text between them, and each
+        # marker on its own - so marking a room is replacing one piece
+        starts = [0]
+        for line in lines:
+            starts.append(starts[-1] + len(line) + 1)
+        text = "\n".join(lines)
+        self.parts = []
+        self.pieces = {}  # room name -> where its marker is in parts
+        done = 0
+        for offset, name in sorted((starts[line] + column, name) for line, column, name in markers):
+            self.parts.append(text[done:offset])
+            self.pieces[name] = len(self.parts)
+            self.parts.append(UNVISITED)
+            done = offset + 1
+        self.parts.append(text[done:])
+        self.marked = set()  # rooms showing VISITED right now
+
+    def render(self, visited):
+        # The map with the visited rooms marked - only markers that have changed since
+        # the last time are touched
+        for name in self.marked.symmetric_difference(visited):
+            piece = self.pieces.get(name)
+            if piece is not None:
+                self.parts[piece] = VISITED if name in visited else UNVISITED
+        self.marked = set(name for name in visited if name in self.pieces)
+        return "".join(self.parts)
+
+class CompiledWorld:
+    # The house lowered to flat tables indexed by number, built once when the game
+    # loads. Rooms and objects get ids, and everything about them that never changes
+    # - menus, neighbours, object actions, health effects, starting items - is worked
+    # out here, so a turn indexes lists instead of searching dicts and building
+    # strings. Anything that can change (items taken, descriptions) stays on the rooms.
+    # Compiling also checks the world for mistakes, like an action nothing handles
+    def __init__(self, rooms):
+        self.room_names = [room.name for room in rooms]
+        self.room_ids = {room.name: room_id for room_id, room in enumerate(rooms)}
+        self.neighbors = []      # room id -> ((direction, room id), ...)
+        self.main_menu = []      # room id -> main menu choices, apart from rest
+        self.movement_menu = []  # room id -> movement submenu choices
+        self.examine_menu = []   # room id -> examine submenu choices
+        self.object_ids = []     # room id -> {object name: object id}
+        self.object_sets = []    # room id -> frozenset of its object names
+        self.object_names = []   # object id -> name
+        self.object_room = []    # object id -> room id
+        self.object_action = []  # object id -> opcode, 0 for just examining it
+        self.object_health = []  # object id -> change in lives when examined, or None
+        self.object_items = []   # object id -> ids (places in all_items) of the items it starts with
+        self.object_haunting = []  # object id -> (event, delay) it sets off when examined, or None
+        self.object_note = []    # object id -> key of the note it holds, or None
+        self.plan = None         # FloorPlan, made the first time someone looks at the map
+
+        # Opcode n runs action_handlers[n]
+        opcodes = {name: opcode for opcode, name in enumerate(ACTIONS, 1)}
+        self.action_handlers = [None] + list(ACTIONS.values())
+        for _, code in EVERY_ROOM_MENU:
+            if code not in opcodes:
+                raise ValueError(f"Every room offers '{code}', which isn't in ACTIONS")
+
+        for room_id, room in enumerate(rooms):
+            room.id = room_id
+            neighbors = []
+            for direction, next_room in room.neighbors.items():
+                if next_room.name not in self.room_ids:
+                    raise ValueError(f"{room.name} leads {direction} to {next_room.name}, which isn't in the house")
+                neighbors.append((direction, self.room_ids[next_room.name]))
+            self.neighbors.append(tuple(neighbors))
+
+            menu = list(EVERY_ROOM_MENU)
+            if room.neighbors:
+                menu.append(("Movement options", "movement"))
+            if room.objects:
+                menu.append(("Examine objects", "examine"))
+            if room.name in ROOM_ACTIONS:
+                label, code = ROOM_ACTIONS[room.name]
+                if code not in opcodes:
+                    raise ValueError(f"{room.name} offers '{code}', which isn't in ACTIONS")
+                menu.append((label, code))
+            self.main_menu.append(tuple(menu))
+
+            self.movement_menu.append(tuple(
+                [(f"Go {DIRECTION_NAMES.get(direction, direction.title())} to {next_room.name}", direction)
+                 for direction, next_room in room.neighbors.items()]
+                + [("Back to main menu", "back")]))
+            self.examine_menu.append(tuple(
+                [(f"Examine {obj_name}", obj_name) for obj_name in room.objects]
+                + [("Back to main menu", "back")]))
+
+            ids = {}
+            for obj_name, obj_info in room.objects.items():
+                ids[obj_name] = len(self.object_names)
+                action = obj_info.get("action")
+                if action and action not in opcodes:
+                    raise ValueError(f"{room.name}/{obj_name} has action '{action}', which isn't in ACTIONS")
+                for item in obj_info.get("items", []):
+                    if item and item not in all_items:
+                        raise ValueError(f"{room.name}/{obj_name} holds '{item}', which isn't in all_items")
+                self.object_names.append(obj_name)
+                self.object_room.append(room_id)
+                self.object_action.append(opcodes[action] if action else 0)
+                self.object_health.append(obj_info.get("health"))
+                self.object_items.append(tuple(all_items.index(item) for item in obj_info.get("items", []) if item))
+                haunting = obj_info.get("haunting")
+                if haunting and haunting[0] not in HAUNTINGS:
+                    raise ValueError(f"{room.name}/{obj_name} sets off '{haunting[0]}', which isn't a haunting")
+                self.object_haunting.append(tuple(haunting) if haunting else None)
+                description = obj_info["description"]
+                self.object_note.append(description[len(PACKED_MARK):] if description.startswith(PACKED_MARK) else None)
+            self.object_ids.append(ids)
+            self.object_sets.append(frozenset(ids))
+
+        # Every note there is to read - the ones lying around, and the ones found other ways
+        self.notes = frozenset(note for note in self.object_note if note) | frozenset(HIDDEN_NOTES)
+
+        # Distance fields for anything hunting the player. distance[target][room] is how
+        # many moves it takes to get from room to target (-1 if it can't), and
+        # next_step[target][room] is the room to move to next. Worked out backwards
+        # from each target, following the doors the other way
+        count = len(rooms)
+        arrivals = [[] for _ in range(count)]  # room id -> rooms with a door into it
+        for room_id, neighbors in enumerate(self.neighbors):
+            for _, next_id in neighbors:
+                arrivals[next_id].append(room_id)
+        self.distance = []
+        self.next_step = []
+        for target in range(count):
+            distance = [-1] * count
+            step = list(range(count))  # somewhere it can't get to, it stays put
+            distance[target] = 0
+            queue = collections.deque([target])
+            while queue:
+                room_id = queue.popleft()
+                for previous in arrivals[room_id]:
+                    if distance[previous] < 0:
+                        distance[previous] = distance[room_id] + 1
+                        step[previous] = room_id
+                        queue.append(previous)
+            self.distance.append(distance)
+            self.next_step.append(step)
+
+    def floor_plan(self):
+        if self.plan is None:
+            self.plan = FloorPlan(self.room_names, self.neighbors)
+        return self.plan
+
+world = CompiledWorld(all_rooms)
+
+# Hot reload - the rooms, objects and encounters are defined in this file and their
+# text in Haunted_text.txt. ContentWatcher notices when either changes and builds the
+# new world in a background thread: a fresh copy of this file is run (never imported,
+# so nothing else sees it), the new rooms are compiled and the text packed again.
+# Only then, between turns, is it swapped in - a few assignments, and every live copy
+# of the house is brought up to the new definition without losing anyone's progress.
+# Changes to code, or to which rooms, exits and objects there are, still need a restart
+SOURCE = os.path.abspath(__file__)
+
+# The house as it's defined, before anyone has played in it - what live copies are compared with
+defined_rooms = clone_world(all_rooms)
+
+def world_shape(rooms):
+    # What a reload can't change under a running game - the rooms, how they connect and what's in them
+    return [(room.name, sorted((direction, next_room.name) for direction, next_room in room.neighbors.items()),
+             list(room.objects)) for room in rooms]
+
+def definition_changes(old_rooms, new_rooms):
+    # What's different between two definitions of the house, worked out once so that
+    # bringing each live copy up to date only touches what changed:
+    # [(room id, new description, [(object name, old definition, new definition), ...]), ...]
+    changes = []
+    for room_id, (old, new) in enumerate(zip(old_rooms, new_rooms)):
+        objects = [(obj_name, old.objects[obj_name], new.objects[obj_name])
+                   for obj_name in old.objects if old.objects[obj_name] != new.objects[obj_name]]
+        if objects or old.description != new.description:
+            changes.append((room_id, new.description, objects))
+    return changes
+
+def refit_rooms(rooms, changes):
+    # Bring a live copy of the house up to a new definition. Items that have been
+    # taken stay taken, and examined objects keep their examined description
+    for room_id, description, objects in changes:
+        room = rooms[room_id]
+        room.description = description
+        for obj_name, before, after in objects:
+            obj_info = room.objects[obj_name]
+            taken = bool(before.get("items")) and not obj_info.get("items")
+            for key in [key for key in obj_info if key not in after and key not in ("items", "description")]:
+                del obj_info[key]
+            for key, value in after.items():
+                if key not in ("items", "description"):
+                    obj_info[key] = copy.deepcopy(value)
+            if obj_info.get("items") == before.get("items"):
+                obj_info["items"] = list(after.get("items", []))
+            if taken and "examined_description" in after:
+                obj_info["description"] = after["examined_description"]
+            else:
+                obj_info["description"] = after["description"]
+
+class ContentWatcher:
+    # poll() is cheap - two stats - so call it between turns as often as you like
+    def __init__(self):
+        self.paths = (SOURCE, TEXT_SOURCE)
+        self.mtimes = self.stat()
+        self.builder = None
+        self.built = None   # (rooms, their changes, compiled world, ENCOUNTERS, encounter tables, text pack) - None for what hasn't changed
+        self.failed = None  # why the last build didn't work
+
+    def stat(self):
+        return [os.path.getmtime(path) if os.path.exists(path) else None for path in self.paths]
+
+    def poll(self, worlds=()):
+        # Swap in a finished build, or start one if anything has changed. worlds are the
+        # live copies of the house to bring up to date (all_rooms always is).
+        # Returns a line saying what happened, or None if nothing did
+        if self.builder and not self.builder.is_alive():
+            self.builder = None
+            if self.failed:
+                message, self.failed = self.failed, None
+                return f"World not reloaded - {message}"
+            built, self.built = self.built, None
+            return self.swap(built, worlds)
+        if self.builder is None:
+            mtimes = self.stat()
+            if mtimes != self.mtimes:
+                changed = [old != new for old, new in zip(self.mtimes, mtimes)]
+                self.mtimes = mtimes
+                self.builder = threading.Thread(target=self.build, args=changed, daemon=True)
+                self.builder.start()
+        return None
+
+    def build(self, source_changed, text_changed):
+        # The slow part, off in the background
+        try:
+            rooms = changes = compiled = encounters = tables = pack = None
+            if source_changed:
+                spec = importlib.util.spec_from_file_location("_reloaded_house", SOURCE)
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+                if module.text_pack:
+                    module.text_pack.close()
+                # Refused outright, even when the text has changed too - the new text
+                # would go in alongside rooms that don't match it
+                if world_shape(module.all_rooms) != world_shape(defined_rooms):
+                    raise ValueError("the rooms, exits or objects have changed, which needs a restart")
+                rooms = module.all_rooms
+                changes = definition_changes(defined_rooms, rooms)
+                compiled = CompiledWorld(rooms)
+                encounters = module.ENCOUNTERS
+                tables = {name: EncounterTable(name, outcomes) for name, outcomes in encounters.items()}
+            if text_changed:
+                build_text_pack()
+                pack = TextPack()
+            self.built = (rooms, changes, compiled, encounters, tables, pack)
+        except Exception as error:
+            self.failed = f"{type(error).__name__}: {error}"
+
+    def swap(self, built, worlds):
+        global defined_rooms, world, encounter_tables, ENCOUNTERS, text_pack
+        rooms, changes, compiled, encounters, tables, pack = built
+        if rooms:
+            done = set()
+            for live in [all_rooms, *worlds]:
+                if id(live) not in done:
+                    done.add(id(live))
+                    refit_rooms(live, changes)
+            defined_rooms, world = rooms, compiled
+            ENCOUNTERS, encounter_tables = encounters, tables
+        if pack:
+            old_pack, text_pack = text_pack, pack
+            if old_pack:
+                old_pack.close()
+        changed = (["rooms and encounters"] if rooms else []) + (["text"] if pack else [])
+        return "World reloaded - " + " and ".join(changed)
+
+def show_intro():
+    # The opening story, shown before a new game
     slow_print("="*75)
     slow_print("        WELCOME TO THE CRAMPTON ESTATE")
     slow_print("="*75)
     slow_print("")
-    time.sleep(1)
+    pause(1)
     slow_print("The storm outside rages as you stumble through the front door.")
     slow_print("Lightning flashes. Thunder rolls.")
     slow_print("Behind you, the door slams shut on its own.")
     slow_print("You hear the lock click. Once. Twice. Three times.")
     slow_print("")
-    time.sleep(1)
+    pause(1)
     slow_print("There's no going back the way you came.")
     slow_print("The house has you now.")
     slow_print("")
-    time.sleep(1)
+    pause(1)
     slow_print("Your only hope is to find another way out.")
     slow_print("But the Crampton Estate doesn't let people leave.")
     slow_print("It hasn't for decades.")
     slow_print("")
-    time.sleep(1)
+    pause(1)
     slow_print("Move quickly. The house feeds on hesitation.")
     slow_print("Watch your sanity. Watch your health.")
     slow_print("Read the notes. Learn what happened here.")
     slow_print("And whatever you do...")
     slow_print("Don't let the darkness win.")
     slow_print("")
-    time.sleep(1)
+    pause(1)
     quick_print("Type '?' at any main menu for help.")
     slow_print("="*75)
-    
-    input("\nPress Enter to begin your nightmare...")
-    
-    while not game.game_over:
+
+class GameSession:
+    # One game, driven a line of input at a time so it can be played from the
+    # terminal, a network connection or a script alike. All the text goes through
+    # the print functions as usual; prompt is what the player is being asked for next
+    def __init__(self, game, journal=None, status=None, history=None, achievements=None):
+        self.game = game
+        self.journal = journal  # autosaves every turn
+        self.status = status    # StatusBar to show the stats on, instead of printing them
+        self.history = history  # TurnHistory for rewinding
+        self.achievements = achievements  # AchievementTracker
+        self.reader = None      # NoteReader the player is part way through
+        self.after_reading = None
+        self.waiting = None     # which on_... method handles the next line
+        self.prompt = None
+        self.finished = False
+        self.choices = []
+        self.letters = []
+
+    def start(self, intro=True):
+        # Begin the game - intro is skipped when resuming a saved game
+        if intro:
+            show_intro()
+            self.wait("begin", "\nPress Enter to begin your nightmare...")
+        else:
+            self.begin_turn()
+
+    def wait(self, what, prompt="\n> "):
+        self.waiting = what
+        self.prompt = prompt
+
+    def send(self, line):
+        # Feed in one line the player typed
+        if self.finished:
+            return
+        token = _pager.set(self.page_through)
+        try:
+            with EffectBatch(self.game, self.status):
+                getattr(self, "on_" + self.waiting)(line.strip().lower())
+        finally:
+            _pager.reset(token)
+
+    def page_through(self, reader):
+        # show_text has more pages than fit - the player turns them at the end of the turn
+        if self.reader:
+            return False  # already reading something, so this one's shown in full
+        self.reader = reader
+        return True
+
+    def on_page(self, choice):
+        reader = self.reader
+        reader.release()
+        if choice == "q":
+            reader.stop()
+        else:
+            reader.show_page()
+        if not reader.done:
+            reader.hold()
+            return
+        self.reader = None
+        for line in reader.held:
+            quick_print(line)
+        self.end_turn(self.after_reading)
+
+    def on_begin(self, choice):
+        self.begin_turn()
+
+    def on_help(self, choice):
+        self.begin_turn()
+
+    def begin_turn(self):
+        # Start of every turn - autosave, drain sanity, show the room and the menu
+        game = self.game
+        settle_effects()
+        if game.game_over:
+            self.finish()
+            return
+        if self.achievements:
+            self.achievements.update(game)
+        if self.journal:
+            self.journal.record_turn(game)
+        if self.history:
+            self.history.record(game)
+        
         game.update_room_visit()
         
         # Passive sanity drain
-        if game.passive_sanity_drain():
-            break
-        
-        # Display current status
-        print("\n" + "="*75)
+        over = game.passive_sanity_drain()
+        settle_effects()
+        if over:
+            self.finish()
+            return
+        instant_print("\n" + "="*75)
         game.current_room.describe()
-        print("-"*75)
-        game.show_stats()
-        print("="*75)
+        if self.status:
+            self.status.update(game)
+        else:
+            instant_print("-"*75)
+            game.show_stats()
+        instant_print("="*75)
         
         # Show main menu
         quick_print("\nWhat will you do?")
-        choices = show_room_menu(game)
-        letters = print_menu(choices)
+        self.choices = show_room_menu(game)
+        self.letters = print_menu(self.choices)
         quick_print("  ?) Help")
+        self.wait("main")
+
+    def on_main(self, choice):
+        game = self.game
+        if choice == '?':
+            self.show_help()
+            return
         
-        choice_input = input("\n> ").strip().lower()
-        
-        if choice_input == '?':
-            show_help()
-            continue
-            
-        if choice_input not in letters:
-            quick_print("Invalid choice. Please try again.")
-            game.lose_sanity(2, "Hesitation. Every second counts. The house is watching.")
-            continue
-        
-        idx = letters.index(choice_input)
-        action_type = choices[idx][1]
+        if choice in self.letters:
+            action_type = self.choices[self.letters.index(choice)][1]
+            target = None
+        else:
+            # Not a menu letter - maybe a typed command like "examine wardrobe"
+            action_type, target = command_index.parse(game, choice)
+            if action_type is None:
+                quick_print(target or "Invalid choice. Please try again.")
+                game.lose_sanity(2, "Hesitation. Every second counts. The house is watching.")
+                self.begin_turn()
+                return
+            if action_type == "help":
+                self.show_help()
+                return
+            if action_type == "rewind":
+                self.rewind(target)
+                return
+        if self.journal:
+            self.journal.note_action(action_type)
         
-        # Handle movement submenu
+        # Movement and examine open a submenu unless the command already said where/what
         if action_type == "movement":
-            quick_print("\nWhere do you want to go?")
-            move_choices = handle_movement_menu(game)
-            move_letters = print_menu(move_choices)
-            move_idx = get_choice(move_letters)
-            
-            direction = move_choices[move_idx][1]
-            if direction == "back":
-                continue
-            
-            game.current_room = game.current_room.neighbors[direction]
-            slow_print(f"\nYou move {direction}...")
-            slow_print("The floorboards creak under your weight.")
-            slow_print("Somewhere in the house, something stirs.")
-            time.sleep(0.5)
-            
-        # Handle examine submenu
+            if target is None:
+                quick_print("\nWhere do you want to go?")
+                self.submenu("movement", handle_movement_menu(game))
+            else:
+                self.go(target)
         elif action_type == "examine":
-            quick_print("\nWhat do you want to examine?")
-            exam_choices = handle_examine_menu(game)
-            exam_letters = print_menu(exam_choices)
-            exam_idx = get_choice(exam_letters)
-            
-            obj_name = exam_choices[exam_idx][1]
-            if obj_name == "back":
-                continue
-            
-            # Check for special actions
-            obj_info = game.current_room.objects.get(obj_name)
-            if obj_info and obj_info.get("action"):
-                action = obj_info["action"]
-                if action == "search_cupboard":
-                    search_cupboard(game)
-                elif action == "search_wardrobe":
-                    search_wardrobe(game)
-                elif action == "use_cassette_player":
-                    use_cassette_player(game)
-                elif action == "use_crowbar":
-                    use_crowbar_on_box(game)
-                elif action == "garden_door":
-                    handle_action(game, "garden_door")
+            if target is None:
+                quick_print("\nWhat do you want to examine?")
+                self.submenu("examine", handle_examine_menu(game))
             else:
-                examine_object(game, obj_name)
-            
+                self.look(target)
+        
         # Handle special actions
+        elif action_type == "use_key" and unlock_basement(game):
+            self.wait("descend")
         else:
-            result = handle_action(game, action_type)
-            if result is True:  # Escaped/won
-                break
-        
+            self.end_turn(handle_action(game, action_type))
+
+    def rewind(self, turns):
+        # Go back to the start of an earlier turn and play it again from there
+        if not self.history or self.history.count < 2:
+            quick_print("There's no going back. Not from here.")
+            self.wait("main")
+            return
+        turns = self.history.rewind(self.game, turns)
+        if self.journal:
+            self.journal.rewound(self.game)
+        if self.achievements:
+            self.achievements.rewound()
+        slow_print(f"The clocks tick backwards. {turns} {'turn' if turns == 1 else 'turns'} unwind around you.")
+        slow_print("The house lets you try again. It knows how this ends.")
+        self.begin_turn()
+
+    def show_help(self):
+        show_help()
+        self.wait("help", "\nPress Enter to continue...")
+
+    @property
+    def keys(self):
+        # Answers to the current prompt that are a single key, so a keyboard that
+        # reads keys one at a time can act on them the moment they're pressed
+        if self.waiting == "main":
+            return set(self.letters) | {"?"}
+        if self.waiting in ("movement", "examine"):
+            return set(self.letters)
+        if self.waiting == "descend":
+            return {"a", "b"}
+        if self.waiting == "page":
+            return {"q"}
+        return set()
+
+    def submenu(self, what, choices):
+        self.choices = choices
+        self.letters = print_menu(choices)
+        self.wait(what)
+
+    def submenu_choice(self, choice):
+        # The code picked from a submenu, or None (and ask again) if it wasn't on it
+        if choice not in self.letters:
+            quick_print("Invalid choice. Please try again.")
+            return None
+        return self.choices[self.letters.index(choice)][1]
+
+    def on_movement(self, choice):
+        direction = self.submenu_choice(choice)
+        if direction == "back":
+            self.begin_turn()
+        elif direction:
+            self.go(direction)
+
+    def on_examine(self, choice):
+        obj_name = self.submenu_choice(choice)
+        if obj_name == "back":
+            self.begin_turn()
+        elif obj_name:
+            self.look(obj_name)
+
+    def on_descend(self, choice):
+        self.end_turn(descend_to_basement(self.game, choice == 'a'))
+
+    def go(self, direction):
+        if self.journal:
+            self.journal.note_action("movement", direction)
+        move_player(self.game, direction)
+        self.end_turn()
+
+    def look(self, obj_name):
+        if self.journal:
+            self.journal.note_action("examine", obj_name)
+        use_object(self.game, obj_name)
+        self.end_turn()
+
+    def end_turn(self, result=None):
+        game = self.game
+        if self.reader:
+            # Finish reading first - the rest of the turn is held back until then
+            self.after_reading = result
+            self.wait("page", "\n-- Enter to read on, q to stop reading --")
+            return
+        settle_effects()
         # Check for death
         if game.lives <= 0 or game.sanity <= 0:
             game.game_over = True
-            break
+            self.finish()
+            return
         
         # Check for victory
         if game.escaped and game.boss_defeated:
+            if self.achievements:
+                self.achievements.update(game)
             show_victory(game)
-            break
+            self.finish()
+            return
         
-        time.sleep(0.3)
-    
-    # Game over
-    if game.game_over and not game.escaped:
-        show_game_over(game)
+        pause(0.3)
+        self.begin_turn()
+
+    def finish(self):
+        # The game has ended one way or another, so there's nothing to resume
+        settle_effects()
+        self.finished = True
+        self.waiting = self.prompt = None
+        game = self.game
+        if self.achievements:
+            self.achievements.update(game)
+        if self.journal:
+            self.journal.record_turn(game)
+            self.journal.finish()
+        if self.status:
+            self.status.update(game)
+        
+        # Game over
+        if game.game_over and not game.escaped:
+            show_game_over(game)
+
+# Hesitation mode - the house doesn't wait while you make up your mind. Every menu
+# has a deadline, and letting it pass costs sanity just like a wrong answer does.
+# Sanity drains by the clock while a menu is up, and anything roaming the house
+# keeps walking. Everything the clock does is kept as a time it's next due, so the
+# loop sleeps in select until either the player types or the next one comes round
+HESITATION_SECONDS = 20  # how long a menu waits for an answer
+CLOCK_DRAIN_SECONDS = 15 # a point of sanity goes this often while a menu is up
+GHOST_STEP_SECONDS = 6   # roaming ghosts take a step this often while you stand there
+
+# Prompts that are on the clock - not reading a note, or the title screen
+TIMED_PROMPTS = ("main", "movement", "examine", "descend")
+
+class HouseClock:
+    def __init__(self, session, now=None):
+        self.session = session
+        now = time.monotonic() if now is None else now
+        self.next_drain = now + CLOCK_DRAIN_SECONDS
+        self.answered(now)
+
+    def answered(self, now):
+        # The player has typed something - a new deadline and the ghosts start over.
+        # The drain carries on, so a quick answer doesn't hold it off
+        self.deadline = now + HESITATION_SECONDS
+        self.next_step = now + GHOST_STEP_SECONDS
+
+    def running(self):
+        return not self.session.finished and self.session.waiting in TIMED_PROMPTS
+
+    def next_due(self):
+        # When the next thing happens, or None if nothing will until the player answers
+        if not self.running():
+            return None
+        due = min(self.deadline, self.next_drain)
+        if self.session.game.ghost_kinds:
+            due = min(due, self.next_step)
+        return due
+
+    def tick(self, now):
+        # Do whatever has come due. Returns the lines it printed - they're held back
+        # and then shown together, so the caller knows to show the prompt again
+        if not self.running():
+            return []
+        game = self.session.game
+        shown = []
+        with redirect_output(shown.append), EffectBatch(game, self.session.status):
+            if now >= self.next_drain:
+                self.next_drain = now + CLOCK_DRAIN_SECONDS
+                sanity_drain(game, 1)
+            if game.ghost_kinds and now >= self.next_step and not game.game_over:
+                self.next_step = now + GHOST_STEP_SECONDS
+                ghosts_move(game)
+            if now >= self.deadline and not game.game_over:
+                self.deadline = now + HESITATION_SECONDS
+                game.lose_sanity(2, "Hesitation. Every second counts. The house is watching.")
+            if game.lives <= 0 or game.sanity <= 0:
+                game.game_over = True
+        if shown:
+            instant_print()  # off the prompt's line
+        for line in shown:
+            fast_print(line)
+        if game.game_over:
+            self.session.finish()
+        elif self.session.status:
+            self.session.status.update(game)
+        return shown
+
+# One-key mode - on a terminal, the keyboard is read a key at a time rather than a
+# line at a time, so a menu letter takes effect as soon as it's pressed with no Enter
+# and no wait for the terminal's line editing. While there are menu letters on offer
+# a typed command starts with "/" - otherwise its first letter would answer the menu -
+# and other keys do nothing; at any other prompt the first key starts it. It's echoed
+# and edited here until Enter. Keys pressed while the game is still printing wait
+# their turn, so c then a goes straight through movement. A key held down repeats
+# the same letter in the same read or a few milliseconds apart, and only counts once
+ESCAPE_SEQUENCE = re.compile(rb"\[[0-9;?]*[ -/]*[@-~]|O.|")  # what follows ESC for arrows and function keys
+ENTER_KEYS = (b"\r", b"\n")
+ERASE_KEYS = (b"\x7f", b"\x08")
+END_KEY = b"\x04"  # Ctrl-D
+KEY_REPEAT_SECONDS = 0.04  # the same key again sooner than this is the terminal repeating it
+
+class TerminalInput:
+    # The player's answers from the terminal, waited for with a timeout instead of
+    # blocking for good. The wait is select on stdin, and what's read from its file
+    # descriptor is split up here - anything left in Python's own buffer would be
+    # invisible to select. Where stdin can't be selected (a Windows console, a file)
+    # a thread reads lines instead, and the wait is on a queue
+    def __init__(self, stream=None, raw=False):
+        self.stream = stream if stream else sys.stdin
+        self.buffer = b""
+        self.lines = None
+        self.saved = None      # the terminal's own settings, put back by close in one-key mode
+        self.typed = b""       # a command being typed a key at a time
+        self.typing = False
+        self.received = 0      # bytes read from the terminal so far
+        self.reads = []        # (where in those bytes a read started, when), for what's still in buffer
+        self.last_key = None   # (the one-key answer just taken, the read it came in)
+        self.selector = selectors.DefaultSelector()
+        try:
+            self.fd = self.stream.fileno()
+            self.selector.register(self.fd, selectors.EVENT_READ)
+        except (ValueError, OSError, io.UnsupportedOperation):
+            self.selector.close()
+            self.selector = None
+            self.lines = queue.Queue()
+            threading.Thread(target=self.read_lines, daemon=True).start()
+            return
+        if raw and termios and os.isatty(self.fd):
+            self.saved = termios.tcgetattr(self.fd)
+            tty.setcbreak(self.fd)
+
+    @property
+    def raw(self):
+        return self.saved is not None
+
+    @property
+    def pending(self):
+        # What's been typed of a command so far, to show again after the prompt
+        return self.typed.decode(errors="replace")
+
+    def read_lines(self):
+        for line in self.stream:
+            self.lines.put(line)
+        self.lines.put(None)
+
+    def read(self, timeout=None, keys=()):
+        # The player's next answer, or None if timeout seconds go by first. In one-key
+        # mode any of keys is an answer on its own. EOFError once there's nothing more
+        if self.lines is not None:
+            try:
+                line = self.lines.get(timeout=timeout)
+            except queue.Empty:
+                return None
+            if line is None:
+                raise EOFError
+            return line.rstrip("\r\n")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self.raw:
+                while self.buffer:
+                    answer = self.take_key(keys)
+                    if answer is not None:
+                        return answer
+            elif b"\n" in self.buffer:
+                line, _, self.buffer = self.buffer.partition(b"\n")
+                return line.decode(errors="replace").rstrip("\r")
+            wait = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not self.selector.select(wait):
+                return None
+            data = os.read(self.fd, 4096)
+            if not data:
+                if self.buffer and not self.raw:
+                    line, self.buffer = self.buffer, b""
+                    return line.decode(errors="replace")  # a last line with no newline
+                raise EOFError
+            self.feed(data)
+
+    def feed(self, data, now=None):
+        # Add what one read of the terminal gave, and when
+        self.reads.append((self.received, time.monotonic() if now is None else now))
+        self.received += len(data)
+        self.buffer += data
+
+    def take_key(self, keys):
+        # Act on the next key waiting. Returns the answer once there is one
+        start = self.received - len(self.buffer)
+        while len(self.reads) > 1 and self.reads[1][0] <= start:
+            del self.reads[0]
+        last, self.last_key = self.last_key, None
+        key, self.buffer = self.buffer[:1], self.buffer[1:]
+        if key == b"\x1b":
+            self.buffer = self.buffer[ESCAPE_SEQUENCE.match(self.buffer).end():]
+            return None
+        if key in ENTER_KEYS:
+            line = self.typed.decode(errors="replace")
+            self.typed = b""
+            self.typing = False
+            self.echo("\n")
+            return line
+        if key in ERASE_KEYS:
+            if self.typed:
+                self.typed = self.typed[:-1]
+                while self.typed and self.typed[-1] & 0xC0 == 0x80:
+                    self.typed = self.typed[:-1]  # the rest of a character that took several bytes
+                self.echo("\b \b")
+            elif self.typing:
+                self.typing = False
+            return None
+        if key == END_KEY and not self.typing:
+            raise EOFError
+        if not self.typing:
+            letter = key.decode(errors="replace").lower()
+            if letter in keys:
+                read = self.reads[0]
+                self.last_key = (letter, read)
+                if last and last[0] == letter and (last[1] == read or read[1] - last[1][1] < KEY_REPEAT_SECONDS):
+                    return None  # held down, not pressed again
+                self.echo(letter + "\n")
+                return letter
+            if keys and key != b"/":
+                return None
+            self.typing = True
+            if key == b"/":
+                return None
+        if key >= b"\xc0":
+            # The first byte of a character that takes several - keep them together
+            size = 2 if key < b"\xe0" else 3 if key < b"\xf0" else 4
+            key, self.buffer = key + self.buffer[:size - 1], self.buffer[size - 1:]
+        if key >= b" ":
+            self.typed += key
+            self.echo(key.decode(errors="replace"))
+        return None
+
+    def echo(self, text):
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+    def close(self):
+        if self.saved is not None:
+            termios.tcsetattr(self.fd, termios.TCSADRAIN, self.saved)
+            self.saved = None
+        if self.selector:
+            self.selector.close()
+
+def wait_for_line(session, clock, keyboard):
+    # Show the prompt and wait for the player's answer, letting the clock (if there
+    # is one) act whenever something comes due. None if the game ended first
+    sys.stdout.write(session.prompt)
+    sys.stdout.flush()
+    while True:
+        due = clock.next_due() if clock else None
+        line = keyboard.read(None if due is None else max(0.0, due - time.monotonic()), session.keys)
+        if line is not None:
+            if clock:
+                clock.answered(time.monotonic())
+            return line
+        if clock.tick(time.monotonic()):
+            if session.finished:
+                return None
+            sys.stdout.write(session.prompt + keyboard.pending)
+            sys.stdout.flush()
+
+def game_loop(game, journal=None, intro=True, timed=False, one_key=True):
+    # Main game loop - keeps asking the player for input until the session is over.
+    # timed is hesitation mode, where the house keeps going while you think, and
+    # one_key reads a key at a time when it's a real terminal
+    status = StatusBar() if StatusBar.supported() else None
+    session = GameSession(game, journal, status, TurnHistory(game, all_rooms), AchievementTracker())
+    content = ContentWatcher()
+    keyboard = TerminalInput(raw=one_key) if timed or one_key else None
+    try:
+        session.start(intro)
+        clock = HouseClock(session) if timed else None
+        while not session.finished:
+            if keyboard:
+                line = wait_for_line(session, clock, keyboard)
+                if line is None:
+                    break
+            else:
+                line = input(session.prompt)
+            content.poll()
+            session.send(line)
+    finally:
+        if keyboard:
+            keyboard.close()
+        if status:
+            status.close()
 
 def show_help():
     # Display help information - QUICK PRINT
@@ -1438,6 +3282,13 @@ def show_help():
     quick_print("  - Rest when you can to recover health (once per room)")
     quick_print("  - Don't linger too long - sanity drains over time")
     quick_print("  - The GARDEN is death - avoid it if possible")
+    quick_print("  - Instead of menu letters you can type commands, like")
+    quick_print("    'examine wardrobe', 'go up', 'kitchen' or 'use crowbar'")
+    quick_print("  - Made a fatal mistake? 'undo' takes back a turn, 'rewind 3' three")
+    quick_print("  - Menu letters work the moment you press them. To type a command,")
+    quick_print("    press / first and finish with Enter")
+    quick_print("  - Playing with --hesitation? Then the house won't wait for you.")
+    quick_print("    Dither at a menu and it costs you, and the clock drains your sanity")
     quick_print("")
     quick_print("KEY ITEMS TO FIND:")
     quick_print("  - CROWBAR: In Utility Room - opens attic box")
@@ -1448,7 +3299,6 @@ def show_help():
     quick_print("  - CASSETTE TAPE: Play in library for important clues")
     quick_print("")
     quick_print("=" *75)
-    input("\nPress Enter to continue...")
 
 def show_victory(game):
     # Display victory screen
@@ -1456,28 +3306,28 @@ def show_victory(game):
     slow_print("                         V I C T O R Y")
     slow_print("="*75)
     slow_print("")
-    time.sleep(1)
+    pause(1)
     slow_print("You climb the basement stairs, your legs shaking.")
     slow_print("The house is different now. Lighter. Quieter.")
     slow_print("The oppressive darkness has lifted like morning fog.")
     slow_print("")
-    time.sleep(1)
+    pause(1)
     slow_print("You make your way through the silent halls.")
     slow_print("The portraits no longer watch you. They're just paintings now.")
     slow_print("The whispers have stopped. The house breathes easy.")
     slow_print("")
-    time.sleep(1)
+    pause(1)
     slow_print("The front door stands before you.")
     slow_print("It opens easily now, as if the house is letting you go.")
     slow_print("Releasing you from its grip.")
     slow_print("You step out into the cold night air.")
     slow_print("")
-    time.sleep(1)
+    pause(1)
     slow_print("Behind you, the Crampton Estate stands silent.")
     slow_print("The windows are dark. No shadows move within.")
     slow_print("The curse is broken. The Cramptons can finally rest.")
     slow_print("")
-    time.sleep(1)
+    pause(1)
     slow_print("But you know you'll never be the same.")
     slow_print("The memories will haunt you forever.")
     slow_print("You've seen things no one should see.")
@@ -1490,6 +3340,7 @@ def show_victory(game):
     quick_print(f"  Rooms Explored: {game.survived_count}")
     quick_print(f"  Items Collected: {len(game.inventory)}")
     quick_print(f"  Notes Read: {len([n for n in game.notes_read if n != 'tape_played'])}")
+    quick_print(f"  Achievements: {len(game.achievements)}/{len(ACHIEVEMENTS)}")
     quick_print("")
     slow_print("You survived the Crampton Estate.")
     slow_print("You defeated the darkness.")
@@ -1523,6 +3374,7 @@ def show_game_over(game):
     quick_print(f"  Final Sanity: {game.sanity}/100")
     quick_print(f"  Items Found: {', '.join(game.inventory) if game.inventory else 'None'}")
     quick_print(f"  Notes Read: {len([n for n in game.notes_read if n != 'tape_played'])}")
+    quick_print(f"  Achievements: {len(game.achievements)}/{len(ACHIEVEMENTS)}")
     quick_print("")
     slow_print("The Crampton Estate claims another soul.")
     slow_print("Another name carved into its walls.")
@@ -1534,13 +3386,32 @@ def show_game_over(game):
 
 # Main execution
 if __name__ == "__main__":
-    quick_print("\nInitializing Crampton Estate...")
-    time.sleep(0.5)
-    quick_print("Loading saved souls...")
-    time.sleep(0.5)
-    quick_print("Opening the door...")
-    time.sleep(0.5)
-    print()
-    
     game = GameState(grand_hall)
-    game_loop(game)
\ No newline at end of file
+    timed = "--hesitation" in sys.argv[1:]
+    one_key = "--lines" not in sys.argv[1:]  # --lines: answer with Enter, the old way
+    
+    # Offer to carry on from the last autosave
+    session = latest_session()
+    resume = False
+    if session:
+        quick_print("\nAn unfinished nightmare is waiting for you.")
+        quick_print("  a) Resume where you left off")
+        quick_print("  b) Start a new game")
+        resume = input("\n> ").strip().lower() == 'a'
+    
+    if resume:
+        journal = TurnJournal.resume(session, game, all_rooms)
+        quick_print("\nThe house remembers you...")
+        game_loop(game, journal, intro=False, timed=timed, one_key=one_key)
+    else:
+        if session:
+            delete_session(session)
+        quick_print("\nInitializing Crampton Estate...")
+        pause(0.5)
+        quick_print("Loading saved souls...")
+        pause(0.5)
+        quick_print("Opening the door...")
+        pause(0.5)
+        instant_print()
+        
+        game_loop(game, TurnJournal.start(game, all_rooms), timed=timed, one_key=one_key)
\ No newline at end of file
@@ -0,0 +1,292 @@
+import os
+import re
+import sys
+import time
+import random
+import signal
+import socket
+import asyncio
+import argparse
+import resource
+import subprocess
+
+import Haunted_house as house
+import Haunted_server as server
+
+# Load generator - how many players can one host carry?
+# Starts a server of its own (or uses one that's already running), then ramps up
+# synthetic players in stages: 10 of them, then 100, then 1000... Every player is a
+# real client on its own connection, reading the menus off the screen the way a
+# person would and picking from them - the main menu from show_room_menu, then the
+# movement and examine submenus. Each stage reports turn latency percentiles,
+# throughput, errors, and how much memory the workers use for each live session -
+# both as the operating system sees it and as the workers' own ledgers account for it.
+
+PORT = server.PORT + 1
+RAMP = [10, 100, 1000]
+STAGE_SECONDS = 10
+THINK_SECONDS = 1.0   # average pause before each turn, like a fast player
+TURN_TIMEOUT = 10.0   # a frame slower than this counts as an error
+
+# "  a) View map" - a menu entry
+MENU_LINE = re.compile(r"^  ([a-z])\) ")
+
+# Typed routes a player can follow before carrying on at random
+ROUTES = {
+    "random": [],
+    "walkthrough": ["", "west", "sofa", "east", "east", "south", "drawer"] + ["search"] * 6
+                   + ["north", "west", "north", "ancient book", "cassette player", "down", "use rusty key", "a"],
+}
+
+
+class StageStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.latencies = []
+        self.errors = 0
+        self.games = 0      # sessions started
+        self.finished = 0   # games played to the end
+
+    def percentile(self, fraction):
+        # Nearest-rank percentile of the turn latencies, in milliseconds
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return 1000 * ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def read_frame(reader):
+    # One frame from the server - (lines of text, prompt). An empty prompt means the game is over
+    lines = []
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("server hung up")
+        text = line.decode(errors="replace").rstrip("\n")
+        if text.startswith(server.PROMPT_MARK):
+            return lines, text[1:]
+        lines.append(text)
+
+
+class Player:
+    def __init__(self, test, rng, route):
+        self.test = test
+        self.rng = rng
+        self.route = route
+        self.sessions = []
+
+    def choose(self, lines, prompt, steps):
+        # What to type next - the next step of the route, or any entry on the last menu shown
+        step = next(steps, None)
+        if step is not None:
+            return step
+        if "read on" in prompt:
+            return "q" if self.rng.random() < 0.2 else ""
+        letters = []
+        for line in lines:
+            match = MENU_LINE.match(line)
+            if match:
+                letters.append(match.group(1))
+            elif not line.strip():
+                continue
+            elif letters and not line.startswith("  "):
+                letters = []  # a later menu replaces an earlier one
+        return self.rng.choice(letters) if letters else ""
+
+    async def run(self):
+        # Play games one after another until the test is over
+        await asyncio.sleep(self.rng.random())  # don't all connect at once
+        while not self.test.stopping:
+            try:
+                await self.play()
+            except (OSError, ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+                self.test.stats.errors += 1
+                await asyncio.sleep(0.5 + self.rng.random())
+
+    async def play(self):
+        reader, writer = await asyncio.open_connection(self.test.host, self.test.port, limit=1 << 20)
+        try:
+            writer.write(b"NEW\n")
+            hello = (await asyncio.wait_for(reader.readline(), TURN_TIMEOUT)).split()
+            if len(hello) != 2:
+                raise ValueError(f"unexpected greeting {hello}")
+            self.sessions.append(hello[1].decode())
+            self.test.stats.games += 1
+            lines, prompt = await asyncio.wait_for(read_frame(reader), TURN_TIMEOUT)
+            steps = iter(self.route)
+            while prompt and not self.test.stopping:
+                line = self.choose(lines, prompt, steps)
+                if self.test.think:
+                    await asyncio.sleep(self.rng.expovariate(1 / self.test.think))
+                start = time.perf_counter()
+                writer.write(line.encode() + b"\n")
+                await writer.drain()
+                lines, prompt = await asyncio.wait_for(read_frame(reader), TURN_TIMEOUT)
+                self.test.stats.latencies.append(time.perf_counter() - start)
+            if not prompt:
+                self.test.stats.finished += 1
+        finally:
+            writer.close()
+
+
+def worker_memory(supervisor_pid):
+    # Resident memory of a server's worker processes in bytes, or None if we can't tell
+    total = 0
+    try:
+        for pid in os.listdir("/proc"):
+            if not pid.isdigit():
+                continue
+            try:
+                with open(f"/proc/{pid}/stat") as f:
+                    parent = int(f.read().rsplit(")", 1)[1].split()[1])
+                if parent != supervisor_pid:
+                    continue
+                with open(f"/proc/{pid}/cmdline", "rb") as f:
+                    if b"Haunted_server" not in f.read():
+                        continue  # multiprocessing's resource tracker
+                with open(f"/proc/{pid}/status") as f:
+                    for line in f:
+                        if line.startswith("VmRSS:"):
+                            total += int(line.split()[1]) * 1024
+            except (FileNotFoundError, ProcessLookupError, IndexError, ValueError):
+                continue
+    except FileNotFoundError:
+        return None
+    return total
+
+def live_sessions(port):
+    # Games the server is holding right now and the KB they hold, from its shared table
+    try:
+        table = server.SessionTable.attach(server.table_name(port))
+    except FileNotFoundError:
+        return 0, 0
+    count = memory = 0
+    for _, record in table.scan():
+        count += 1
+        memory += record["memory"]
+    table.close()
+    return count, memory
+
+
+class LoadTest:
+    def __init__(self, host=server.HOST, port=PORT, think=THINK_SECONDS, route="random", seed=None):
+        self.host = host
+        self.port = port
+        self.think = think
+        self.route = ROUTES[route]
+        self.rng = random.Random(seed)
+        self.players = []
+        self.tasks = []
+        self.stats = StageStats()
+        self.stopping = False
+        self.server = None
+
+    def start_server(self, workers=None):
+        # A server of our own, so its workers' memory can be measured
+        command = [sys.executable, server.__file__, "serve", "--host", self.host, "--port", str(self.port)]
+        if workers:
+            command += ["--workers", str(workers)]
+        self.server = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection((self.host, self.port), timeout=1).close()
+                return
+            except OSError:
+                if time.monotonic() > deadline or self.server.poll() is not None:
+                    raise RuntimeError("the server didn't start")
+                time.sleep(0.1)
+
+    def stop_server(self):
+        # Shut our server down, and throw away the games the players left unfinished
+        self.server.send_signal(signal.SIGTERM)
+        self.server.wait()
+        for player in self.players:
+            for session in player.sessions:
+                house.delete_session(session)
+
+    async def ramp(self, stages, seconds, report=print):
+        # Run each stage for so many seconds with that many players. Returns a row per stage
+        baseline = worker_memory(self.server.pid) if self.server else None
+        results = []
+        for clients in stages:
+            while len(self.players) < clients:
+                player = Player(self, random.Random(self.rng.random()), self.route)
+                self.players.append(player)
+                self.tasks.append(asyncio.ensure_future(player.run()))
+            self.stats = StageStats()
+            await asyncio.sleep(seconds)
+            results.append(self.summary(clients, baseline))
+            if report:
+                report(self.format_row(results[-1]))
+        self.stopping = True
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        return results
+
+    def summary(self, clients, baseline):
+        stats = self.stats
+        elapsed = time.perf_counter() - stats.started
+        turns = len(stats.latencies)
+        sessions, accounted = live_sessions(self.port)
+        memory = worker_memory(self.server.pid) if self.server else None
+        per_session = (memory - baseline) / sessions if memory is not None and sessions else None
+        return {
+            "clients": clients,
+            "turns/s": turns / elapsed,
+            "p50": stats.percentile(0.50),
+            "p95": stats.percentile(0.95),
+            "p99": stats.percentile(0.99),
+            "errors": stats.errors / max(turns + stats.errors, 1),
+            "games": stats.games,
+            "finished": stats.finished,
+            "sessions": sessions,
+            "per session": per_session,
+            "accounted": accounted / sessions if sessions else None,
+        }
+
+    @staticmethod
+    def format_row(row):
+        memory = f"{row['per session'] / 1024:10.1f}" if row["per session"] is not None else f"{'-':>10}"
+        accounted = f"{row['accounted']:9.1f}" if row["accounted"] is not None else f"{'-':>9}"
+        return (f"{row['clients']:7} {row['turns/s']:9.1f} {row['p50']:8.2f} {row['p95']:8.2f} {row['p99']:8.2f} "
+                f"{row['errors']:7.2%} {row['games']:6} {row['finished']:8} {row['sessions']:8} {memory} {accounted}")
+
+HEADER = f"{'clients':>7} {'turns/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} {'games':>6} {'finished':>8} {'sessions':>8} {'KB/session':>10} {'accounted':>9}"
+
+
+def raise_file_limit():
+    # Every player is a connection, on both ends - allow as many as the system lets us
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find out how many players one host can carry")
+    parser.add_argument("--host", default=server.HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes for our server (default: one per core)")
+    parser.add_argument("--existing", action="store_true", help="test a server that's already running instead of starting one")
+    parser.add_argument("--ramp", default=",".join(map(str, RAMP)), help="players in each stage, e.g. 10,100,1000")
+    parser.add_argument("--seconds", type=float, default=STAGE_SECONDS, help="how long each stage runs")
+    parser.add_argument("--think", type=float, default=THINK_SECONDS, help="average seconds a player waits before each turn")
+    parser.add_argument("--route", choices=sorted(ROUTES), default="random")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    stages = [int(count) for count in args.ramp.split(",")]
+    limit = raise_file_limit()
+    if max(stages) * 2 + 64 > limit:
+        print(f"Warning: only {limit} open files allowed - the biggest stages will see connection errors")
+
+    test = LoadTest(args.host, args.port, args.think, args.route, args.seed)
+    if not args.existing:
+        test.start_server(args.workers)
+    try:
+        print(HEADER)
+        asyncio.run(test.ramp(stages, args.seconds))
+    finally:
+        if test.server:
+            test.stop_server()
+    sys.exit(0)
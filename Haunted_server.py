@@ -0,0 +1,1123 @@
+import os
+import re
+import sys
+import time
+import uuid
+import types
+import signal
+import socket
+import struct
+import asyncio
+import bisect
+import hashlib
+import argparse
+import selectors
+import traceback
+import tracemalloc
+from multiprocessing import shared_memory, resource_tracker
+
+import Haunted_house as house
+
+# Hosting the game for lots of players over the network.
+# A supervisor process owns the one listening socket and forks a worker process
+# per core. Every game session belongs to one worker, picked by a consistent hash
+# of its session id, so a player always lands on the worker holding their game.
+# The supervisor reads the first line a client sends (which session they want),
+# then hands the connection itself to the owning worker and forgets about it.
+# Workers run asyncio and keep each session's game in memory, autosaving through
+# TurnJournal - if a worker dies the supervisor starts a new one in its place,
+# and sessions are loaded back from their saves the next time their player connects.
+#
+# Protocol, one line at a time:
+#   client -> "NEW" or "SESSION <id>"
+#   server -> "SESSION <id>", then the game text
+#   every reply ends with a line starting with PROMPT_MARK, followed by the prompt
+#   (an empty prompt means the game is over and the connection is closed)
+#   client -> one line of input per prompt
+#
+# Spectators send "WATCH <id>" instead and then just receive: what the player
+# types (as "> ..." lines) and everything the game prints back, in the same frames.
+# Co-op players send "JOIN <house>" and get "HOUSE <house> <session>" back, then
+# play as usual - everyone who joins the same house shares its rooms. Their games
+# live on the worker that owns the house rather than the session, so spectators
+# are sent to whichever worker's slots hold the session in the SessionTable.
+# A worker that's over its memory budget (with --over-budget refuse) answers new
+# games with "FULL", then a message and an empty prompt. An id that isn't a
+# SESSION_ID gets "BAD" the same way - ids end up in save file names.
+#
+# Every live session also has a fixed-size record in a shared memory segment
+# (see SessionTable) holding its hot GameState fields, so the supervisor or the
+# "sessions" admin command can look at every game without asking the workers.
+# That includes how much memory each one holds - see MemoryLedger.
+
+HOST = "127.0.0.1"
+PORT = 7313
+PROMPT_MARK = "\x1e"
+HELLO_LIMIT = 256
+VIEWER_BACKLOG = 64 * 1024  # bytes a spectator can fall behind before frames are dropped
+SLOTS_PER_WORKER = 1024
+FULL = f"FULL\nThe house is full tonight. Come back later.\n{PROMPT_MARK}\n".encode()
+BAD = f"BAD\nThere's no such session here.\n{PROMPT_MARK}\n".encode()
+
+# What a session or house id may be - it's part of the save file names, and it has
+# to fit the session field of a SessionTable record whole
+SESSION_ID_LENGTH = 32
+SESSION_ID = re.compile(rf"[A-Za-z0-9_-]{{1,{SESSION_ID_LENGTH}}}")
+
+
+def ring_hash(text):
+    # Stable 64-bit hash - Python's own hash() changes between processes
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "big")
+
+class ShardRing:
+    # Consistent hash ring. Every worker owns lots of points around the ring and a
+    # session belongs to the first point at or after its own hash, so each worker gets
+    # an even share and restarting one never moves anybody else's sessions
+    def __init__(self, workers, points=64):
+        self.ring = sorted((ring_hash(f"worker-{worker}-{point}"), worker)
+                           for worker in range(workers) for point in range(points))
+        self.keys = [key for key, _ in self.ring]
+
+    def owner(self, session_id):
+        index = bisect.bisect(self.keys, ring_hash(session_id)) % len(self.keys)
+        return self.ring[index][1]
+
+
+# Shared session table. The segment starts with a header saying how it's laid out,
+# then one record per slot. Each worker owns its own run of slots, so only one
+# process ever writes a given record and no locking is needed between processes.
+# The first field of a record is a sequence number that's odd while the record is
+# being written - readers that see it odd, or see it change under them, read again
+TABLE_HEADER = struct.Struct("<4sII")  # magic, slots, record size
+TABLE_MAGIC = b"CRMP"
+RECORD = struct.Struct(f"<I{SESSION_ID_LENGTH}shhIhHIIII")
+RECORD_FIELDS = ["session", "lives", "sanity", "turn_count", "room",
+                 "flags", "inventory", "visited", "rested", "memory"]
+
+# Bits in the "flags" field
+FLAG_CRUCIFIX, FLAG_BOX_OPENED, FLAG_BOSS_DEFEATED, FLAG_ESCAPED, FLAG_GAME_OVER = (1 << i for i in range(5))
+FLAG_NAMES = {FLAG_CRUCIFIX: "crucifix", FLAG_BOX_OPENED: "box", FLAG_BOSS_DEFEATED: "boss",
+              FLAG_ESCAPED: "escaped", FLAG_GAME_OVER: "over"}
+
+ROOM_IDS = {room.name: i for i, room in enumerate(house.all_rooms)}
+ITEM_BITS = {item: 1 << i for i, item in enumerate(house.all_items)}
+ROOM_BITS = {room.name: 1 << i for i, room in enumerate(house.all_rooms)}
+
+def table_name(port):
+    # The segment's name, so the admin command can find the server on a port
+    return f"crampton_{port}"
+
+def bitmask(names, bits):
+    mask = 0
+    for name in names:
+        mask |= bits.get(name, 0)
+    return mask
+
+def pack_flags(game):
+    flags = 0
+    if game.crucifix_protect:
+        flags |= FLAG_CRUCIFIX
+    if game.locked_box_opened:
+        flags |= FLAG_BOX_OPENED
+    if game.boss_defeated:
+        flags |= FLAG_BOSS_DEFEATED
+    if game.escaped:
+        flags |= FLAG_ESCAPED
+    if game.game_over:
+        flags |= FLAG_GAME_OVER
+    return flags
+
+
+class SessionTable:
+    def __init__(self, memory, owner=True):
+        self.memory = memory
+        self.owner = owner  # the process that made the segment removes it again
+        self.view = memory.buf
+        magic, self.slots, record_size = TABLE_HEADER.unpack_from(self.view, 0)
+        if magic != TABLE_MAGIC or record_size != RECORD.size:
+            raise ValueError(f"Shared memory '{memory.name}' isn't a session table")
+
+    @classmethod
+    def create(cls, name, slots):
+        # Make a new, empty table. Forked workers share the same mapping
+        try:
+            old = shared_memory.SharedMemory(name)
+            old.close()
+            old.unlink()  # left behind by a server that didn't shut down cleanly
+        except FileNotFoundError:
+            pass
+        memory = shared_memory.SharedMemory(name, create=True, size=TABLE_HEADER.size + slots * RECORD.size)
+        TABLE_HEADER.pack_into(memory.buf, 0, TABLE_MAGIC, slots, RECORD.size)
+        return cls(memory)
+
+    @classmethod
+    def attach(cls, name):
+        # Open a running server's table to read it
+        # Python's resource tracker would remove the segment when we exit, as if we made
+        # it. From 3.13 it can be told not to track it; before that it has to be
+        # unregistered, which is only needed on POSIX, by the name with a leading "/"
+        try:
+            memory = shared_memory.SharedMemory(name, track=False)
+        except TypeError:
+            memory = shared_memory.SharedMemory(name)
+            if os.name == "posix":
+                resource_tracker.unregister("/" + memory.name, "shared_memory")
+        return cls(memory, owner=False)
+
+    def offset(self, slot):
+        return TABLE_HEADER.size + slot * RECORD.size
+
+    def write(self, slot, session_id, game, memory=0):
+        # Copy a game's hot fields into its record, along with the KB it holds. The
+        # sequence goes odd before the fields are touched and even again after
+        offset = self.offset(slot)
+        sequence = struct.unpack_from("<I", self.view, offset)[0] | 1
+        struct.pack_into("<I", self.view, offset, sequence)
+        RECORD.pack_into(
+            self.view, offset, sequence,
+            session_id.encode(),
+            game.lives,
+            game.sanity,
+            game.turn_count,
+            ROOM_IDS.get(game.current_room.name, -1),
+            pack_flags(game),
+            bitmask(game.inventory, ITEM_BITS),
+            bitmask(game.room_visited, ROOM_BITS),
+            bitmask(game.used_life_bonus, ROOM_BITS),
+            min(memory, 0xFFFFFFFF),
+        )
+        struct.pack_into("<I", self.view, offset, (sequence + 1) & 0xFFFFFFFF)
+
+    def clear(self, slot):
+        offset = self.offset(slot)
+        sequence = struct.unpack_from("<I", self.view, offset)[0] | 1
+        struct.pack_into("<I", self.view, offset, sequence)
+        self.view[offset + 4:offset + RECORD.size] = bytes(RECORD.size - 4)
+        struct.pack_into("<I", self.view, offset, (sequence + 1) & 0xFFFFFFFF)
+
+    def read(self, slot):
+        # One record as a dict, or None if the slot is empty
+        offset = self.offset(slot)
+        for _ in range(1000):
+            before = struct.unpack_from("<I", self.view, offset)[0]
+            if before & 1:
+                continue  # being written right now
+            fields = RECORD.unpack_from(self.view, offset)
+            # The sequence again, now the record's copied - if a write started since,
+            # what we copied may be half old and half new
+            if struct.unpack_from("<I", self.view, offset)[0] == before:
+                break
+        else:
+            return None  # its worker died part way through writing it
+        if not fields[1].strip(b"\0"):
+            return None
+        record = dict(zip(RECORD_FIELDS, fields[1:]))
+        record["session"] = record["session"].rstrip(b"\0").decode()
+        return record
+
+    def find(self, session_id):
+        # The slot holding a session's record, or None if it isn't listed
+        key = session_id.encode().ljust(SESSION_ID_LENGTH, b"\0")
+        for slot in range(self.slots):
+            offset = self.offset(slot) + 4
+            if self.view[offset:offset + SESSION_ID_LENGTH] == key:
+                return slot
+        return None
+
+    def scan(self):
+        # Every live session, as (slot, record)
+        for slot in range(self.slots):
+            record = self.read(slot)
+            if record is not None:
+                yield slot, record
+
+    def close(self):
+        self.view.release()
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+class Broadcast:
+    # Everyone watching one session. Each frame is encoded once and every viewer
+    # is handed a memoryview of the same bytes, so a thousand viewers cost a
+    # thousand write calls and nothing more. Nobody is ever waited for - a viewer
+    # whose connection has backed up just misses frames until it catches up
+    def __init__(self):
+        self.viewers = {}  # writer -> frames dropped since their last one
+        self.last_frame = b""
+
+    def add(self, writer):
+        self.viewers[writer] = 0
+        if self.last_frame:
+            writer.write(self.last_frame)  # so they can see where the player is
+
+    def remove(self, writer):
+        self.viewers.pop(writer, None)
+
+    def publish(self, frame):
+        self.last_frame = frame
+        if not self.viewers:
+            return
+        view = memoryview(frame)
+        for writer, dropped in list(self.viewers.items()):
+            if writer.is_closing():
+                del self.viewers[writer]
+            elif writer.transport.get_write_buffer_size() > VIEWER_BACKLOG:
+                self.viewers[writer] = dropped + 1
+            else:
+                if dropped:
+                    writer.write(f"... ({dropped} missed)\n".encode())
+                    self.viewers[writer] = 0
+                writer.write(view)
+
+    def close(self):
+        for writer in self.viewers:
+            writer.close()
+        self.viewers.clear()
+
+
+class HostedSession:
+    # One player's game on a worker - its own copy of the house (unless it's
+    # sharing one), its own output buffer
+    def __init__(self, session_id, rooms=None):
+        self.session_id = session_id
+        self.rooms = rooms if rooms else house.clone_world(house.all_rooms)
+        self.game = house.GameState(self.rooms[0])
+        self.output = []
+        self.context = house.headless_context(self.output.append)
+        self.spectators = Broadcast()
+        self.typed = None
+        self.house_id = None   # set when it's in a SharedHouse
+        self.connections = 0   # players connected to it right now
+        self.last_played = time.monotonic()
+
+        snapshot = os.path.join(house.SAVE_DIR, f"{session_id}.snapshot.json")
+        self.resumed = os.path.exists(snapshot)
+        if rooms:
+            # In a shared house. The journal saves the world along with the game,
+            # and other players change this world too, so these games aren't saved
+            # or rewound
+            self.session = house.GameSession(self.game, achievements=house.AchievementTracker())
+            self.context.run(self.session.start)
+        elif self.resumed:
+            # Back from a save - a worker restart or a server reboot
+            journal = house.TurnJournal.resume(session_id, self.game, self.rooms)
+            self.session = house.GameSession(self.game, journal, history=house.TurnHistory(self.game, self.rooms),
+                                             achievements=house.AchievementTracker())
+            self.context.run(house.quick_print, "\nThe house remembers you...")
+            self.context.run(self.session.start, False)
+        else:
+            journal = house.TurnJournal.start(self.game, self.rooms, session_id)
+            self.session = house.GameSession(self.game, journal, history=house.TurnHistory(self.game, self.rooms),
+                                             achievements=house.AchievementTracker())
+            self.context.run(self.session.start)
+
+    @property
+    def finished(self):
+        return self.session.finished
+
+    def send(self, line):
+        # Play one line of the player's input
+        self.typed = line.strip()
+        self.context.run(self.session.send, line)
+
+    def frame(self):
+        # Everything printed since last time, followed by the prompt line
+        text = "\n".join(self.output)
+        self.output.clear()
+        prompt = (self.session.prompt or "").strip("\n")
+        frame = f"{text}\n{PROMPT_MARK}{prompt}\n".encode()
+        if self.spectators.viewers:
+            # Spectators see what was typed as well
+            typed = f"> {self.typed}\n".encode() if self.typed is not None else b""
+            self.spectators.publish(typed + frame)
+        else:
+            self.spectators.last_frame = frame
+        self.typed = None
+        return frame
+
+    def compact(self):
+        # Give back what memory can go without touching the game - all but the last
+        # few turns of rewind history. True if there was anything to give back
+        history = self.session.history
+        if history is None or history.count <= HISTORY_AFTER_COMPACT:
+            return False
+        history.trim(HISTORY_AFTER_COMPACT)
+        return True
+
+    def can_spill(self):
+        # Only a saved game nobody is playing right now can leave memory
+        return not self.connections and self.session.journal is not None and not self.finished
+
+    def spill(self):
+        # Drop out of memory. The save is written out as it stands, and the game is
+        # loaded back from it when the player reconnects
+        self.session.journal.suspend(self.game)
+        self.spectators.close()
+
+
+class SharedHouse:
+    # Co-op - one copy of the rooms that several players explore together. Each
+    # player still has their own GameState, but take the knife from the kitchen
+    # drawer and it's gone for everybody.
+    # A turn can change the rooms anywhere inside it (examine_object), so whole
+    # turns are the unit of work: players post their lines to the house's mailbox
+    # and a single actor task plays them one at a time. Nothing else ever writes
+    # to the rooms, so two players can't both take the same item
+    def __init__(self, house_id):
+        self.house_id = house_id
+        self.rooms = house.clone_world(house.all_rooms)
+        self.players = {}   # session id -> (player number, HostedSession)
+        self.joined = 0
+        self.mailbox = asyncio.Queue()
+        self.actor = asyncio.ensure_future(self.run())
+
+    def join(self):
+        self.joined += 1
+        session = HostedSession(uuid.uuid4().hex, self.rooms)
+        session.house_id = self.house_id
+        self.players[session.session_id] = (self.joined, session)
+        self.tell_others(session, f"\n(Player {self.joined} has entered the house)")
+        return self.joined, session
+
+    def leave(self, session):
+        number, _ = self.players.pop(session.session_id, (None, None))
+        if number is not None:
+            self.tell_others(session, f"\n(Player {number} has left the house)")
+
+    def tell_others(self, session, text):
+        # Shows up in everyone else's next frame
+        for _, other in self.players.values():
+            if other is not session:
+                other.output.append(text)
+
+    async def play(self, session, line):
+        # Have the actor play one line for a player, and wait until it has
+        done = asyncio.get_running_loop().create_future()
+        await self.mailbox.put((session, line, done))
+        await done
+
+    async def run(self):
+        while True:
+            session, line, done = await self.mailbox.get()
+            try:
+                if session.session_id in self.players:
+                    carrying = len(session.game.inventory)
+                    session.send(line)
+                    number = self.players[session.session_id][0]
+                    for item in session.game.inventory[carrying:]:
+                        self.tell_others(session, f"\n(Player {number} found the {item})")
+                done.set_result(None)
+            except Exception as error:
+                done.set_exception(error)
+
+    def close(self):
+        self.actor.cancel()
+
+
+# Memory accounting. A session's footprint is measured by walking everything it
+# holds - its GameState, its copy of the rooms, rewind history, journal, the last
+# frame - and adding up sys.getsizeof. Whatever the game module itself holds (the
+# rooms as defined and everything they refer to) is shared by every session, so it
+# isn't counted against any of them, and a shared house's rooms are counted once for
+# the house rather than once per player. A walk takes most of a millisecond, so a
+# check only spends MEASURE_SECONDS on it: sessions never measured come first, then
+# ones that have played since they were last measured, at most every REMEASURE_SECONDS.
+# tracemalloc (--trace-memory) is the check on all this: it sees every allocation
+# the worker makes, so its total and the ledger's should stay close
+MEMORY_CHECK_SECONDS = 1
+MEASURE_SECONDS = 0.02
+REMEASURE_SECONDS = 10
+MEMORY_REPORT_SECONDS = 60   # how often --trace-memory prints what tracemalloc sees
+REPORT_SITES = 5             # allocation sites in each report
+HISTORY_AFTER_COMPACT = 20   # turns of rewind history a compacted session keeps
+OVER_BUDGET_ACTIONS = ["compact", "spill", "refuse"]
+
+WALKED = (dict, list, tuple, set, frozenset)
+UNCOUNTED = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+
+def own_object(obj):
+    # Instances of our own classes are walked into - anything else only counts itself
+    return type(obj).__module__ in (house.__name__, __name__) and hasattr(obj, "__dict__")
+
+def shared_objects():
+    # Ids of everything reachable from the game module's own rooms
+    shared = set()
+    stack = [house.all_rooms, house.defined_rooms]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in shared:
+            continue
+        shared.add(id(obj))
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, WALKED):
+            stack.extend(obj)
+        elif own_object(obj):
+            stack.extend(vars(obj).values())
+    return shared
+
+def deep_size(root, shared, skip=(), seen=None):
+    # Bytes held by root and everything it refers to, leaving out the shared objects
+    # and anything in skip. Every object counted is added to seen
+    seen = set() if seen is None else seen
+    total = 0
+    stack = [root]
+    while stack:
+        obj = stack.pop()
+        key = id(obj)
+        if key in seen or key in shared or key in skip:
+            continue
+        seen.add(key)
+        if obj is None or obj is True or obj is False or isinstance(obj, UNCOUNTED):
+            continue
+        if type(obj) is int and -5 <= obj <= 256:
+            continue  # Python keeps one of each of these
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, WALKED):
+            stack.extend(obj)
+        elif own_object(obj):
+            attributes = vars(obj)
+            seen.add(id(attributes))
+            total += sys.getsizeof(attributes)
+            stack.extend(attributes.values())
+    return total
+
+
+class MemoryLedger:
+    # How many bytes every session on a worker holds, and the budgets they're held to
+    def __init__(self, session_budget=None, worker_budget=None, action="compact", trace=False):
+        self.session_budget = session_budget  # bytes, or None for no limit
+        self.worker_budget = worker_budget
+        self.action = action                  # what to do when the worker is over budget
+        self.trace = trace                    # keep tracemalloc running as a cross-check
+        self.sizes = {}         # session id -> bytes
+        self.measured = {}      # session id -> when it was last measured
+        self.house_sizes = {}   # house id -> bytes of its shared rooms
+        self.house_objects = {} # house id -> ids of everything in its rooms
+        self.dirty = set()      # sessions played since they were last measured
+        self.dirty_houses = set()
+        self.shared = shared_objects()
+        self.refusing = False
+
+    @property
+    def total(self):
+        return sum(self.sizes.values()) + sum(self.house_sizes.values())
+
+    def kilobytes(self, session_id):
+        return self.sizes.get(session_id, 0) // 1024
+
+    def touch(self, session):
+        # The session has played - measure it again at the next check
+        self.dirty.add(session.session_id)
+        if session.house_id:
+            self.dirty_houses.add(session.house_id)
+
+    def forget(self, session_id):
+        self.sizes.pop(session_id, None)
+        self.measured.pop(session_id, None)
+        self.dirty.discard(session_id)
+
+    def forget_house(self, house_id):
+        self.house_sizes.pop(house_id, None)
+        self.house_objects.pop(house_id, None)
+        self.dirty_houses.discard(house_id)
+
+    def reloaded(self, sessions):
+        # The world was reloaded, so the rooms everybody shares are new objects
+        self.shared = shared_objects()
+        self.dirty.update(sessions)
+        self.measured.clear()
+        self.dirty_houses.update(self.house_objects)
+
+    def measure(self, session, houses):
+        # Measure one session now
+        skip = ()
+        if session.house_id:
+            if session.house_id not in self.house_objects:
+                self.measure_house(houses[session.house_id])
+            skip = self.house_objects[session.house_id]
+        self.sizes[session.session_id] = deep_size(session, self.shared, skip)
+        self.measured[session.session_id] = time.monotonic()
+        self.dirty.discard(session.session_id)
+
+    def measure_house(self, shared):
+        objects = set()
+        self.house_sizes[shared.house_id] = deep_size(shared.rooms, self.shared, seen=objects)
+        self.house_objects[shared.house_id] = objects
+        self.dirty_houses.discard(shared.house_id)
+
+    def catch_up(self, sessions, houses):
+        # Measure sessions that have played since last time, until MEASURE_SECONDS is
+        # used up. Returns the ones measured
+        deadline = time.perf_counter() + MEASURE_SECONDS
+        for house_id in list(self.dirty_houses):
+            if house_id in houses:
+                self.measure_house(houses[house_id])
+            else:
+                self.dirty_houses.discard(house_id)
+        due = time.monotonic() - REMEASURE_SECONDS
+        queue = sorted((self.measured.get(session_id, 0), session_id) for session_id in self.dirty)
+        measured = []
+        for when, session_id in queue:
+            if when > due or time.perf_counter() > deadline:
+                break
+            session = sessions.get(session_id)
+            if session is None:
+                self.dirty.discard(session_id)
+                continue
+            self.measure(session, houses)
+            measured.append(session)
+        return measured
+
+
+class Worker:
+    def __init__(self, index, channel, table, memory=None):
+        self.index = index
+        self.channel = channel  # connections arrive here from the supervisor
+        self.sessions = {}
+        self.houses = {}
+        self.tasks = set()
+        self.stopped = None
+        self.content = house.ContentWatcher()
+        self.ledger = MemoryLedger(**(memory or {}))
+
+        # Our own run of slots in the shared table. A worker that died may have
+        # left records behind, so start them all off empty
+        self.table = table
+        first = index * SLOTS_PER_WORKER
+        self.free_slots = list(range(first + SLOTS_PER_WORKER - 1, first - 1, -1))
+        self.slots = {}  # session id -> slot
+        for slot in self.free_slots:
+            table.clear(slot)
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        self.stopped = loop.create_future()
+        self.channel.setblocking(False)
+        loop.add_reader(self.channel.fileno(), self.on_channel)
+        loop.add_signal_handler(signal.SIGTERM, self.stop)
+        loop.call_later(1, self.check_supervisor, os.getppid())
+        loop.call_later(1, self.check_content)
+        loop.call_later(MEMORY_CHECK_SECONDS, self.check_memory)
+        if self.ledger.trace:
+            tracemalloc.start()
+            loop.call_later(MEMORY_REPORT_SECONDS, self.report_memory)
+        await self.stopped
+
+    def check_supervisor(self, parent):
+        # A datagram channel doesn't tell us when the other end goes away, so look
+        # every second - if the supervisor was killed outright we'd be adopted by init
+        if os.getppid() != parent:
+            self.stop()
+        else:
+            asyncio.get_running_loop().call_later(1, self.check_supervisor, parent)
+
+    def check_content(self):
+        # Pick up edits to the rooms and text every second. The new world is built in
+        # the background and swapped in here, between turns, for every game on this worker
+        message = self.content.poll([session.rooms for session in self.sessions.values()])
+        if message:
+            print(f"Worker {self.index}: {message}", flush=True)
+            self.ledger.reloaded(self.sessions)
+        asyncio.get_running_loop().call_later(1, self.check_content)
+
+    def check_memory(self):
+        # Bring the ledger up to date, then hold every session and the worker as a
+        # whole to their budgets
+        ledger = self.ledger
+        for session in ledger.catch_up(self.sessions, self.houses):
+            self.publish(session, touch=False)
+        if ledger.session_budget:
+            for session_id, size in list(ledger.sizes.items()):
+                if size > ledger.session_budget:
+                    self.compact(self.sessions[session_id], "over its budget")
+        if ledger.worker_budget:
+            self.enforce_worker_budget()
+        asyncio.get_running_loop().call_later(MEMORY_CHECK_SECONDS, self.check_memory)
+
+    def enforce_worker_budget(self):
+        ledger = self.ledger
+        over = ledger.total > ledger.worker_budget
+        if ledger.action == "refuse":
+            if over != ledger.refusing:
+                state = "refusing new games" if over else "taking new games again"
+                print(f"Worker {self.index}: {ledger.total // 1024} KB in use - {state}", flush=True)
+            ledger.refusing = over
+        elif over and ledger.action == "compact":
+            # Biggest first, until we're back under
+            for session_id in sorted(ledger.sizes, key=ledger.sizes.get, reverse=True):
+                if ledger.total <= ledger.worker_budget:
+                    break
+                self.compact(self.sessions[session_id], "to bring the worker under budget")
+        elif over and ledger.action == "spill":
+            # Longest idle first, until we're back under
+            idle = [session for session in self.sessions.values() if session.can_spill()]
+            idle.sort(key=lambda session: session.last_played)
+            spilled = 0
+            for session in idle:
+                if ledger.total <= ledger.worker_budget:
+                    break
+                session.spill()
+                self.close_session(session.session_id)
+                spilled += 1
+            if spilled:
+                print(f"Worker {self.index}: Spilled {spilled} idle sessions to disk - "
+                      f"{ledger.total // 1024} KB in use", flush=True)
+
+    def compact(self, session, reason):
+        before = self.ledger.sizes.get(session.session_id, 0)
+        if session.compact():
+            self.ledger.measure(session, self.houses)
+            self.publish(session, touch=False)
+            print(f"Worker {self.index}: Compacted {session.session_id} {reason} - "
+                  f"{before // 1024} KB down to {self.ledger.kilobytes(session.session_id)} KB", flush=True)
+
+    def report_memory(self):
+        # What tracemalloc sees next to what the ledger accounts for, and where it's going
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        traced, peak = tracemalloc.get_traced_memory()
+        print(f"Worker {self.index}: {len(self.sessions)} sessions, {self.ledger.total // 1024} KB accounted, "
+              f"{traced // 1024} KB traced ({peak // 1024} KB peak)", flush=True)
+        for stat in snapshot.statistics("lineno")[:REPORT_SITES]:
+            print(f"Worker {self.index}:   {stat}", flush=True)
+        asyncio.get_running_loop().call_later(MEMORY_REPORT_SECONDS, self.report_memory)
+
+    def stop(self):
+        if not self.stopped.done():
+            self.stopped.set_result(None)
+
+    def on_channel(self):
+        # A connection handed over by the supervisor, with its session id
+        try:
+            message, fds, _, _ = socket.recv_fds(self.channel, HELLO_LIMIT * 2, 1)
+        except BlockingIOError:
+            return
+        if not message and not fds:
+            self.stop()  # the supervisor has gone
+            return
+        hello, _, leftover = message.partition(b"\n")
+        mode, _, session_id = hello.decode().partition(" ")
+        for fd in fds:
+            client = socket.socket(fileno=fd)
+            if mode == "WATCH":
+                task = asyncio.ensure_future(self.serve_spectator(client, session_id))
+            elif mode == "JOIN":
+                task = asyncio.ensure_future(self.serve_member(client, session_id, leftover))
+            else:
+                task = asyncio.ensure_future(self.serve_client(client, session_id, leftover))
+            # The event loop only keeps a weak reference to a task, so hold on to it
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    def open_session(self, session_id):
+        # The session from memory, or loaded from its save, or a brand new game.
+        # (None, False) if it would be a new game and we're refusing those
+        session = self.sessions.get(session_id)
+        if session is None or session.finished:
+            saved = os.path.exists(os.path.join(house.SAVE_DIR, f"{session_id}.snapshot.json"))
+            if self.ledger.refusing and not saved:
+                return None, False
+            session = HostedSession(session_id)
+            self.sessions[session_id] = session
+            self.publish(session)
+            return session, True
+        return session, False
+
+    def publish(self, session, touch=True):
+        # Update the session's record in the shared table. Unless told otherwise
+        # it has just played, so it's due to be measured again too
+        if touch:
+            self.ledger.touch(session)
+            session.last_played = time.monotonic()
+        slot = self.slots.get(session.session_id)
+        if slot is None:
+            if not self.free_slots:
+                return  # table full - the game still works, it just isn't listed
+            slot = self.free_slots.pop()
+            self.slots[session.session_id] = slot
+        self.table.write(slot, session.session_id, session.game, self.ledger.kilobytes(session.session_id))
+
+    def close_session(self, session_id):
+        self.sessions.pop(session_id, None)
+        self.ledger.forget(session_id)
+        slot = self.slots.pop(session_id, None)
+        if slot is not None:
+            self.table.clear(slot)
+            self.free_slots.append(slot)
+
+    async def serve_spectator(self, client, session_id):
+        reader, writer = await asyncio.open_connection(sock=client)
+        session = self.sessions.get(session_id)
+        if session is None or session.finished:
+            writer.write(f"Nobody is playing {session_id} right now\n{PROMPT_MARK}\n".encode())
+            writer.close()
+            return
+        writer.write(f"WATCH {session_id}\n".encode())
+        session.spectators.add(writer)
+        try:
+            # Nothing to read - just wait until they hang up
+            while await reader.read(HELLO_LIMIT):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            session.spectators.remove(writer)
+            writer.close()
+
+    async def serve_member(self, client, house_id, leftover):
+        # One player in a shared house
+        reader, writer = await asyncio.open_connection(sock=client)
+        if leftover:
+            reader.feed_data(leftover)
+        if self.ledger.refusing:
+            writer.write(FULL)
+            writer.close()
+            return
+        shared = self.houses.get(house_id)
+        if shared is None:
+            shared = self.houses[house_id] = SharedHouse(house_id)
+        number, session = shared.join()
+        self.sessions[session.session_id] = session
+        self.publish(session)
+        try:
+            session.output.insert(0, f"\nYou are player {number} in this house.")
+            writer.write(f"HOUSE {house_id} {session.session_id}\n".encode() + session.frame())
+            await writer.drain()
+            while not session.finished:
+                line = await reader.readline()
+                if not line:
+                    break
+                await shared.play(session, line.decode(errors="replace"))
+                self.publish(session)
+                writer.write(session.frame())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            # Shared games can't be picked up again later, so leaving ends them
+            writer.close()
+            shared.leave(session)
+            self.close_session(session.session_id)
+            session.spectators.close()
+            if not shared.players:
+                shared.close()
+                del self.houses[house_id]
+                self.ledger.forget_house(house_id)
+
+    async def serve_client(self, client, session_id, leftover):
+        reader, writer = await asyncio.open_connection(sock=client)
+        if leftover:
+            reader.feed_data(leftover)
+        session = None
+        try:
+            session, fresh = self.open_session(session_id)
+            if session is None:
+                writer.write(FULL)
+                return
+            session.connections += 1
+            if not fresh:
+                session.output.append("\nThe house remembers you...")
+            writer.write(f"SESSION {session_id}\n".encode() + session.frame())
+            await writer.drain()
+            while not session.finished:
+                line = await reader.readline()
+                if not line:
+                    break  # player left - the game stays here for when they come back
+                session.send(line.decode(errors="replace"))
+                self.publish(session)
+                writer.write(session.frame())
+                await writer.drain()
+            if session.finished:
+                self.close_session(session_id)
+                session.spectators.close()
+        except ConnectionError:
+            pass
+        finally:
+            if session is not None:
+                session.connections -= 1
+            writer.close()
+
+
+class Supervisor:
+    def __init__(self, workers=None, host=HOST, port=PORT, memory=None):
+        self.worker_count = workers or os.cpu_count() or 1
+        self.host = host
+        self.port = port
+        self.memory = memory  # MemoryLedger settings for every worker
+        self.ring = ShardRing(self.worker_count)
+        self.pids = {}       # worker index -> process id
+        self.channels = {}   # worker index -> socket to send connections down
+        self.pending = {}    # client socket -> what it has sent so far
+        self.listener = None
+        self.table = None
+
+    def spawn(self, index):
+        # Fork the worker for one shard
+        parent_end, child_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                # Only keep our end of our own channel
+                parent_end.close()
+                self.listener.close()
+                for channel in self.channels.values():
+                    channel.close()
+                for client in self.pending:
+                    client.close()
+                asyncio.run(Worker(index, child_end, self.table, self.memory).serve())
+            except Exception:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        child_end.close()
+        if index in self.channels:
+            self.channels[index].close()
+        self.pids[index] = pid
+        self.channels[index] = parent_end
+
+    def reap(self):
+        # Restart any worker that has died. Its sessions come back from their saves
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            for index, worker_pid in list(self.pids.items()):
+                if worker_pid == pid:
+                    print(f"Worker {index} stopped - starting a new one")
+                    self.spawn(index)
+
+    def restart(self, index):
+        # Make sure the old worker is really gone, then start a new one
+        pid = self.pids.get(index)
+        try:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        except (ProcessLookupError, ChildProcessError):
+            pass
+        self.spawn(index)
+
+    def read_hello(self, client, selector):
+        # Read the client's first line. Once it's all here, pass the connection on
+        try:
+            data = client.recv(HELLO_LIMIT)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+        if not data:
+            selector.unregister(client)
+            del self.pending[client]
+            client.close()
+            return
+        buffer = self.pending[client]
+        buffer += data
+        if b"\n" not in buffer:
+            if len(buffer) > HELLO_LIMIT:
+                selector.unregister(client)
+                del self.pending[client]
+                client.close()
+            return
+
+        selector.unregister(client)
+        del self.pending[client]
+        line, _, leftover = bytes(buffer).partition(b"\n")
+        words = line.decode(errors="replace").split()
+        mode = words[0].upper() if words else "NEW"
+        if len(words) == 2 and mode in ("SESSION", "WATCH", "JOIN"):
+            session_id = words[1]
+            if not SESSION_ID.fullmatch(session_id):
+                try:
+                    client.send(BAD)
+                except OSError:
+                    pass
+                client.close()
+                return
+        else:
+            mode, session_id = "SESSION", uuid.uuid4().hex
+        self.hand_over(client, mode, session_id, leftover)
+
+    def owner(self, mode, session_id):
+        # The worker a connection goes to. A spectator goes wherever the game is
+        # actually being played - a co-op game is on its house's worker
+        if mode == "WATCH":
+            slot = self.table.find(session_id)
+            if slot is not None:
+                return slot // SLOTS_PER_WORKER
+        return self.ring.owner(session_id)
+
+    def hand_over(self, client, mode, session_id, leftover):
+        # Send the connection to the worker that owns the session
+        index = self.owner(mode, session_id)
+        message = f"{mode} {session_id}\n".encode() + leftover
+        try:
+            socket.send_fds(self.channels[index], [message], [client.fileno()])
+        except OSError:
+            # The worker has died since we last looked - replace it now and try again
+            self.restart(index)
+            try:
+                socket.send_fds(self.channels[index], [message], [client.fileno()])
+            except OSError:
+                pass
+        client.close()
+
+    def run(self):
+        self.listener = socket.create_server((self.host, self.port), reuse_port=False)
+        self.listener.setblocking(False)
+        self.table = SessionTable.create(table_name(self.port), self.worker_count * SLOTS_PER_WORKER)
+        for index in range(self.worker_count):
+            self.spawn(index)
+        print(f"Crampton Estate open on {self.host}:{self.port} with {self.worker_count} workers")
+
+        selector = selectors.DefaultSelector()
+        selector.register(self.listener, selectors.EVENT_READ)
+        # Shut down properly on kill too, so the workers and shared table go with us
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        try:
+            while True:
+                for key, _ in selector.select(timeout=0.5):
+                    if key.fileobj is self.listener:
+                        try:
+                            client, _ = self.listener.accept()
+                        except BlockingIOError:
+                            continue
+                        client.setblocking(False)
+                        self.pending[client] = bytearray()
+                        selector.register(client, selectors.EVENT_READ)
+                    else:
+                        self.read_hello(key.fileobj, selector)
+                self.reap()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        for pid in self.pids.values():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in self.pids.values():
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self.listener.close()
+        self.table.close()
+
+
+def list_sessions(port=PORT):
+    # Print every live session on a running server, straight from its shared table
+    try:
+        table = SessionTable.attach(table_name(port))
+    except FileNotFoundError:
+        print(f"No server running on port {port}")
+        return
+    rooms = [room.name for room in house.all_rooms]
+    count = 0
+    memory = 0
+    print(f"{'session':32}  {'room':18} lives sanity  turns items rooms     KB  flags")
+    for slot, record in table.scan():
+        room = rooms[record["room"]] if 0 <= record["room"] < len(rooms) else "?"
+        flags = ",".join(name for bit, name in FLAG_NAMES.items() if record["flags"] & bit)
+        print(f"{record['session']:32}  {room:18} {record['lives']:5} {record['sanity']:6} "
+              f"{record['turn_count']:6} {bin(record['inventory']).count('1'):5} "
+              f"{bin(record['visited']).count('1'):5} {record['memory']:6}  {flags}")
+        count += 1
+        memory += record["memory"]
+    print(f"{count} live sessions, {table.slots} slots, {memory:,} KB held by sessions")
+    table.close()
+
+
+def watch(host=HOST, port=PORT, session_id=None):
+    # Follow somebody else's game
+    with socket.create_connection((host, port)) as sock:
+        stream = sock.makefile("rw", encoding="utf-8", newline="\n")
+        stream.write(f"WATCH {session_id}\n")
+        stream.flush()
+        for line in stream:
+            if not line.startswith(PROMPT_MARK):
+                print(line, end="")
+            elif not line[1:].strip():
+                return  # the game is over
+
+
+def play(host=HOST, port=PORT, session_id=None, house_id=None):
+    # Simple terminal client for a hosted game
+    with socket.create_connection((host, port)) as sock:
+        stream = sock.makefile("rw", encoding="utf-8", newline="\n")
+        if house_id:
+            stream.write(f"JOIN {house_id}\n")
+        else:
+            stream.write(f"SESSION {session_id}\n" if session_id else "NEW\n")
+        stream.flush()
+        first = stream.readline().split()
+        if len(first) == 3:
+            print(f"(House {first[1]} - friends can join with --house {first[1]})")
+        elif len(first) == 2:
+            print(f"(Session {first[1]} - reconnect with --session {first[1]})")
+        while True:
+            line = stream.readline()
+            if not line:
+                return
+            if not line.startswith(PROMPT_MARK):
+                print(line, end="")
+                continue
+            prompt = line[1:].rstrip("\n")
+            if not prompt:
+                return
+            try:
+                reply = input(prompt + " ")
+            except EOFError:
+                return
+            stream.write(reply + "\n")
+            stream.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Host the Crampton Estate for many players")
+    parser.add_argument("mode", choices=["serve", "play", "watch", "sessions"])
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--session", default=None, help="session id to reconnect to or watch")
+    parser.add_argument("--house", default=None, help="shared house to play in with friends")
+    parser.add_argument("--session-budget", type=int, default=None, metavar="KB",
+                        help="compact any session holding more memory than this")
+    parser.add_argument("--worker-budget", type=int, default=None, metavar="MB",
+                        help="memory all the sessions on one worker may hold")
+    parser.add_argument("--over-budget", choices=OVER_BUDGET_ACTIONS, default="compact",
+                        help="what a worker over its budget does: compact the biggest sessions, "
+                             "spill idle ones to disk, or refuse new games")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="run tracemalloc in the workers and report what it sees every minute (slows them down)")
+    args = parser.parse_args()
+
+    if args.mode == "serve":
+        memory = {
+            "session_budget": args.session_budget * 1024 if args.session_budget else None,
+            "worker_budget": args.worker_budget * 1024 * 1024 if args.worker_budget else None,
+            "action": args.over_budget,
+            "trace": args.trace_memory,
+        }
+        Supervisor(args.workers, args.host, args.port, memory).run()
+    elif args.mode == "sessions":
+        list_sessions(args.port)
+    elif args.mode == "watch":
+        if not args.session:
+            parser.error("watch needs --session")
+        watch(args.host, args.port, args.session)
+    else:
+        play(args.host, args.port, args.session, args.house)
+    sys.exit(0)
@@ -0,0 +1,207 @@
+import time
+
+import numpy as np
+
+import Haunted_house as house
+
+# Lockstep simulator - steps a huge number of games at once for balance testing.
+# Every game is one slot in a set of NumPy arrays (lives, sanity, turns, room,
+# inventory...) and each turn is a handful of whole-array operations, so there's
+# no Python loop over the games at all. The rules copy GameState exactly:
+# passive_sanity_drain, the cupboard/wardrobe/meditate encounter tables,
+# lose_life always calling lose_sanity(15), the crucifix going cold after
+# CRUCIFIX_TURNS and the dark figure - it wakes in the basement at
+# DARK_FIGURE_TURN and hunts the player down wherever they are, a step along
+# world.next_step every GHOSTS_MOVE_EVERY turns. The whispering shade isn't
+# simulated: it only wakes when the locked box is opened, and these games never
+# leave their three rooms. tests/test_sim.py plays the same games through
+# GameState and checks the two agree.
+
+MAX_LIVES = 5
+MAX_SANITY = 100
+
+# Actions a simulated game can take on a turn
+IDLE, CUPBOARD, WARDROBE, MEDITATE = range(4)
+
+# Kinds of effect an encounter outcome can have
+NOTHING, LOSE_LIFE, LOSE_SANITY, GAIN_SANITY, GAIN_LIFE, ADD_ITEM = range(6)
+
+# Which of the game's encounter tables each action rolls on, and the room it happens in
+ACTION_ENCOUNTERS = {
+    CUPBOARD: ("cupboard", house.kitchen),
+    WARDROBE: ("wardrobe", house.master_bedroom),
+    MEDITATE: ("meditate", house.kids_bedroom),
+}
+
+# GameState method each encounter effect calls -> effect kind here
+EFFECT_KINDS = {
+    "lose_life": LOSE_LIFE,
+    "lose_sanity": LOSE_SANITY,
+    "gain_sanity": GAIN_SANITY,
+    "gain_life": GAIN_LIFE,
+    "add_item": ADD_ITEM,
+}
+
+ITEMS = house.all_items
+ITEM_BITS = {item: 1 << i for i, item in enumerate(ITEMS)}
+ROOM_IDS = {room.name: i for i, room in enumerate(house.all_rooms)}
+
+# The dark figure - where it sleeps, and where it steps next: NEXT_STEP[player, room]
+LAIR = ROOM_IDS[house.GHOSTS["dark figure"]["lair"]]
+NEXT_STEP = np.array(house.world.next_step, dtype=np.int32)
+NO_GHOST = -1
+
+
+class LockstepSim:
+    def __init__(self, n, seed=None, start_room=house.grand_hall):
+        self.n = n
+        self.rng = np.random.default_rng(seed)
+
+        # One slot per game - the same fields GameState keeps
+        self.lives = np.full(n, 3, dtype=np.int16)
+        self.sanity = np.full(n, MAX_SANITY, dtype=np.int16)
+        self.turn_count = np.zeros(n, dtype=np.int32)
+        self.room = np.full(n, ROOM_IDS[start_room.name], dtype=np.int32)
+        self.inventory = np.zeros(n, dtype=np.int32)
+        self.bonus_rooms = np.zeros(n, dtype=np.int32)
+        self.protected = np.zeros(n, dtype=bool)
+        self.protected_until = np.zeros(n, dtype=np.int32)
+        self.ghost = np.full(n, NO_GHOST, dtype=np.int32)  # the dark figure's room, once it's awake
+        self.over = np.zeros(n, dtype=bool)
+
+        # Turn the game's encounter tables into flat alias-method arrays, so one
+        # fancy index looks up every game's roll. Row IDLE stays "nothing happens"
+        widest = max(len(house.ENCOUNTERS[name]) for name, _ in ACTION_ENCOUNTERS.values())
+        self.outcome_count = np.ones(MEDITATE + 1, dtype=np.int32)
+        self.prob_table = np.ones((MEDITATE + 1, widest))
+        self.alias_table = np.zeros((MEDITATE + 1, widest), dtype=np.int32)
+        self.kind_table = np.zeros((MEDITATE + 1, widest), dtype=np.int8)
+        self.amount_table = np.zeros((MEDITATE + 1, widest), dtype=np.int32)
+        self.action_room = np.full(MEDITATE + 1, -1, dtype=np.int32)
+        for action, (name, room) in ACTION_ENCOUNTERS.items():
+            table = house.encounter_tables[name]
+            if table.conditional:
+                raise ValueError(f"Encounter '{name}' has conditions, which the lockstep simulator can't model")
+            sampler = house.AliasTable([outcome["weight"] for outcome in table.outcomes])
+            self.outcome_count[action] = sampler.size
+            self.prob_table[action, :sampler.size] = sampler.prob
+            self.alias_table[action, :sampler.size] = sampler.alias
+            self.action_room[action] = ROOM_IDS[room.name]
+            for i, outcome in enumerate(table.outcomes):
+                effect, amount = outcome["effect"][:2]
+                self.kind_table[action, i] = EFFECT_KINDS[effect]
+                self.amount_table[action, i] = ITEM_BITS[amount] if effect == "add_item" else amount
+        self.crucifix_bit = ITEM_BITS["crucifix"]
+
+    def random_actions(self, choices=(CUPBOARD, WARDROBE, MEDITATE)):
+        # Default policy - every game picks one of the actions at random
+        return np.asarray(choices, dtype=np.int32)[self.rng.integers(0, len(choices), self.n)]
+
+    def step(self, actions=None):
+        # Advance every game by one turn. actions is one action per game (None = random)
+        if actions is None:
+            actions = self.random_actions()
+        alive = ~self.over
+
+        # passive_sanity_drain - every fifth turn costs 2 sanity, and the crucifix
+        # stops protecting you CRUCIFIX_TURNS after you found it
+        self.turn_count += alive
+        drain = alive & (self.turn_count % house.SANITY_DRAIN_EVERY == 0)
+        self.sanity -= drain * 2
+        self.over |= drain & (self.sanity <= 0)
+        alive &= ~self.over
+        self.protected &= ~(alive & (self.turn_count == self.protected_until))
+
+        # ghosts_move - the dark figure wakes in its lair, then every so often takes a
+        # step towards the player. If that brings it to them it's lose_life(1), and
+        # it goes back to the lair
+        woken = house.DARK_FIGURE_TURN
+        self.ghost = np.where(alive & (self.turn_count == woken), LAIR, self.ghost)
+        moving = (alive & (self.turn_count > woken)
+                  & ((self.turn_count - woken) % house.GHOSTS_MOVE_EVERY == 0))
+        self.ghost = np.where(moving, NEXT_STEP[self.room, np.maximum(self.ghost, 0)], self.ghost)
+        caught = moving & (self.ghost == self.room)
+        self.ghost = np.where(caught, LAIR, self.ghost)
+        saved = caught & self.protected
+        caught &= ~saved
+        self.protected &= ~saved
+        self.lives -= caught
+        self.sanity = np.minimum(self.sanity - caught * 15 + saved * 15, MAX_SANITY).astype(np.int16)
+        self.over |= caught & ((self.lives <= 0) | (self.sanity <= 0))
+        alive &= ~self.over
+
+        # Roll one outcome for every game from its action's table - the same
+        # alias-method draw as AliasTable.sample, for all the games at once
+        spot = self.rng.random(self.n) * self.outcome_count[actions]
+        column = spot.astype(np.int32)
+        keep = (spot - column) < self.prob_table[actions, column]
+        rolls = np.where(keep, column, self.alias_table[actions, column])
+        kind = np.where(alive, self.kind_table[actions, rolls], NOTHING)
+        amount = self.amount_table[actions, rolls]
+        moved = alive & (actions != IDLE)
+        self.room = np.where(moved, self.action_room[actions], self.room)
+
+        # lose_life - the crucifix takes the hit once and calms you instead,
+        # otherwise you lose the lives and lose_sanity(15) on top
+        hit = kind == LOSE_LIFE
+        saved = hit & self.protected
+        hit &= ~saved
+        self.protected &= ~saved
+        self.lives -= hit * amount
+        self.sanity -= hit * 15
+        calm = saved * 15 + (kind == GAIN_SANITY) * amount
+
+        # gain_life - only once per room, and it gives 10 sanity as well
+        room_bit = np.left_shift(1, self.room, dtype=np.int32)
+        fresh = (kind == GAIN_LIFE) & ((self.bonus_rooms & room_bit) == 0)
+        self.bonus_rooms |= fresh * room_bit
+        self.lives = np.minimum(self.lives + fresh, MAX_LIVES).astype(np.int16)
+        calm += fresh * 10
+
+        # add_item - 5 sanity the first time you pick something up, and the crucifix protects you
+        new_item = (kind == ADD_ITEM) & ((self.inventory & amount) == 0)
+        self.inventory |= new_item * amount
+        found_crucifix = new_item & (amount == self.crucifix_bit)
+        self.protected |= found_crucifix
+        self.protected_until = np.where(found_crucifix, self.turn_count + house.CRUCIFIX_TURNS, self.protected_until)
+        calm += new_item * 5
+
+        # lose_sanity and every sanity gain (gains are capped at 100)
+        self.sanity -= (kind == LOSE_SANITY) * amount
+        self.sanity = np.minimum(self.sanity + calm, MAX_SANITY).astype(np.int16)
+
+        # Same death check as the end of game_loop
+        self.over |= (self.lives <= 0) | (self.sanity <= 0)
+
+    def run(self, turns, policy=None):
+        # Step every game for a number of turns. policy(sim) returns the actions for a turn
+        for _ in range(turns):
+            self.step(policy(self) if policy else None)
+
+    def has_item(self, item):
+        # Which games are carrying an item, as a bool array
+        return (self.inventory & ITEM_BITS[item]) != 0
+
+    def stats(self):
+        # Summary numbers across every game
+        return {
+            "alive": float((~self.over).mean()),
+            "lives": float(self.lives.mean()),
+            "sanity": float(self.sanity.mean()),
+            "turns": float(self.turn_count.mean()),
+            "rusty key": float(self.has_item("rusty key").mean()),
+            "crucifix": float(self.has_item("crucifix").mean()),
+        }
+
+
+def benchmark(n=1_000_000, turns=50, seed=0):
+    # How many game-turns per second one core manages
+    sim = LockstepSim(n, seed=seed)
+    start = time.perf_counter()
+    sim.run(turns)
+    elapsed = time.perf_counter() - start
+    return n * turns / elapsed
+
+
+if __name__ == "__main__":
+    print(f"Simulated {benchmark():,.0f} game-turns per second")
@@ -0,0 +1,23 @@
+import pytest
+
+import Haunted_house as house
+
+
+def test_every_action_in_the_house_has_a_handler():
+    world = house.CompiledWorld(house.clone_world(house.all_rooms))
+    for menu in world.main_menu:
+        for _, code in menu:
+            assert code in house.ACTIONS or code in ("movement", "examine")
+    for opcode in world.object_action:
+        assert opcode == 0 or world.action_handlers[opcode]
+
+def test_a_room_action_nothing_handles_is_refused(monkeypatch):
+    monkeypatch.setitem(house.ROOM_ACTIONS, "Kitchen", ("Juggle knives", "juggle"))
+    with pytest.raises(ValueError, match="juggle"):
+        house.CompiledWorld(house.clone_world(house.all_rooms))
+
+def test_an_object_action_nothing_handles_is_refused():
+    rooms = house.clone_world(house.all_rooms)
+    next(iter(rooms[0].objects.values()))["action"] = "juggle"
+    with pytest.raises(ValueError, match="juggle"):
+        house.CompiledWorld(rooms)
@@ -0,0 +1,22 @@
+import pytest
+
+import Haunted_house as house
+
+
+def parse(text, room=house.grand_hall):
+    return house.command_index.parse(house.GameState(room), text)
+
+
+@pytest.mark.parametrize("text", ["go s", "go d", "s", "go south", "go down"])
+def test_a_direction_with_no_exit_goes_nowhere(text):
+    # The Grand Hall has no south or down - not the Second Floor Hall or the Dining Room
+    action, reason = parse(text)
+    assert action is None
+    assert "can't go" in reason
+
+@pytest.mark.parametrize("text, direction", [
+    ("go e", "east"), ("go ea", "east"), ("go nor", "north"), ("u", "up"),
+    ("go dining", "east"), ("dining room", "east"), ("go second floor", "up"),
+])
+def test_directions_and_neighbours(text, direction):
+    assert parse(text) == ("movement", direction)
@@ -0,0 +1,17 @@
+import pytest
+
+import Haunted_house as house
+
+
+def outcome(weight):
+    return {"text": "Nothing.", "effect": ("lose_sanity", 1), "weight": weight}
+
+
+@pytest.mark.parametrize("weight", [0, -1, float("nan"), float("inf"), None, "2", True])
+def test_bad_weights_are_refused(weight):
+    with pytest.raises(ValueError):
+        house.EncounterTable("test", [outcome(1), outcome(weight)])
+
+def test_the_game_tables_build():
+    for name, outcomes in house.ENCOUNTERS.items():
+        assert house.EncounterTable(name, outcomes).outcomes == outcomes
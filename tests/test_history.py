@@ -0,0 +1,45 @@
+import Haunted_house as house
+
+
+def play(lines):
+    # A fresh game with rewinding on, played through some lines without saving anything
+    rooms = house.clone_world(house.all_rooms)
+    game = house.GameState(rooms[0])
+    session = house.GameSession(game, history=house.TurnHistory(game, rooms))
+    with house.redirect_output(house.discard_output):
+        session.start(intro=False)
+        for line in lines:
+            session.send(line)
+    return session
+
+def walk(turns):
+    # Back and forth between the Grand Hall and the Dining Room - nothing random happens
+    return ["east" if turn % 2 == 0 else "west" for turn in range(turns)]
+
+
+def test_undo_across_a_drain_turn():
+    session = play(walk(14))
+    game = session.game
+    assert game.turn_count == house.SANITY_DRAIN_EVERY * 3
+    assert game.sanity == 94
+    with house.redirect_output(house.discard_output):
+        session.send("undo")
+    assert game.turn_count == house.SANITY_DRAIN_EVERY * 3 - 1
+    assert game.sanity == 96
+    assert game.timers[0][:3] == [house.SANITY_DRAIN_EVERY * 3, 4, "sanity_drain"]
+
+def test_undo_matches_the_turn_it_went_back_to():
+    before = play(walk(13)).game
+    after = play(walk(14) + ["undo"]).game
+    assert house.save_state(after) == house.save_state(before)
+
+def test_changing_the_game_in_place_leaves_the_history_alone():
+    session = play(walk(4) + ["undo"])
+    game = session.game
+    game.room_visited.add("Attic")
+    game.timers[0][0] += 100
+    game.room_death_count["Attic"] = 1
+    before = play(walk(2)).game
+    with house.redirect_output(house.discard_output):
+        session.send("undo")
+    assert house.save_state(game) == house.save_state(before)
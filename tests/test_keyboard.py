@@ -0,0 +1,46 @@
+import io
+
+import Haunted_house as house
+
+MENU = {"a", "b", "c", "e"}
+
+
+def answers(keyboard, keys=MENU):
+    # Every answer the keys waiting in the buffer give
+    found = []
+    while keyboard.buffer:
+        answer = keyboard.take_key(keys)
+        if answer is not None:
+            found.append(answer)
+    return found
+
+def keyboard(*reads, keys=MENU):
+    # A keyboard fed (bytes, seconds) reads one at a time, and the answers after each
+    board = house.TerminalInput(io.StringIO())
+    found = []
+    for data, now in reads:
+        board.feed(data, now)
+        found += answers(board, keys)
+    return found
+
+
+def test_a_key_held_down_counts_once():
+    assert keyboard((b"ccc", 0.0)) == ["c"]
+    assert keyboard((b"c", 0.0), (b"c", 0.03), (b"c", 0.06)) == ["c"]
+
+def test_a_key_pressed_twice_counts_twice():
+    assert keyboard((b"c", 0.0), (b"c", 0.2)) == ["c", "c"]
+
+def test_keys_pressed_while_printing_all_count():
+    assert keyboard((b"ca", 0.0)) == ["c", "a"]
+    assert keyboard((b"cac", 0.0)) == ["c", "a", "c"]
+
+def test_a_command_starts_with_a_slash():
+    assert keyboard((b"/examine wardrobe\r", 0.0)) == ["examine wardrobe"]
+    assert keyboard((b"/", 0.0), (b"h", 0.1), (b"a", 0.2), (b"l", 0.3), (b"l", 0.31), (b"\r", 0.4)) == ["hall"]
+
+def test_other_keys_do_nothing_at_a_menu():
+    assert keyboard((b"x", 0.0), (b"b", 0.1)) == ["b"]
+
+def test_any_key_starts_a_command_without_a_menu():
+    assert keyboard((b"hello\r", 0.0), keys=set()) == ["hello"]
@@ -0,0 +1,70 @@
+import random
+
+import pytest
+
+import Haunted_house as house
+import Haunted_sim as sim
+
+GAMES = 4000
+TURNS = 120  # well past DARK_FIGURE_TURN, so the dark figure gets to hunt
+SEED = 1
+
+
+def play_scalar_games(games, turns, actions, seed):
+    # The same random policy played through the real GameState code, one game at a time
+    rng = random.Random(seed)
+    results = []
+    with house.redirect_output(house.discard_output):
+        for _ in range(games):
+            game = house.GameState(house.grand_hall, rng=rng)
+            for _ in range(turns):
+                if game.game_over or game.passive_sanity_drain():
+                    break
+                action = rng.choice(actions)
+                game.current_room = sim.ACTION_ENCOUNTERS[action][1]
+                if action == sim.CUPBOARD:
+                    house.search_cupboard(game)
+                elif action == sim.WARDROBE:
+                    house.search_wardrobe(game)
+                else:
+                    house.handle_action(game, "meditate")
+                if game.lives <= 0 or game.sanity <= 0:
+                    game.game_over = True
+            results.append(game)
+
+    def mean(value):
+        return sum(value(game) for game in results) / games
+
+    return {
+        "alive": mean(lambda game: not game.game_over),
+        "lives": mean(lambda game: game.lives),
+        "sanity": mean(lambda game: game.sanity),
+        "turns": mean(lambda game: game.turn_count),
+        "rusty key": mean(lambda game: "rusty key" in game.inventory),
+        "crucifix": mean(lambda game: "crucifix" in game.inventory),
+    }
+
+
+def test_the_horizon_reaches_the_dark_figure():
+    assert TURNS > house.DARK_FIGURE_TURN + 2 * house.GHOSTS_MOVE_EVERY
+
+# Random searching dies young; meditating forever lives long enough for the dark figure
+@pytest.mark.parametrize("actions", [
+    (sim.CUPBOARD, sim.WARDROBE, sim.MEDITATE),
+    (sim.MEDITATE,),
+])
+def test_the_sim_matches_game_state(actions):
+    games = sim.LockstepSim(GAMES * 10, seed=SEED)
+    games.run(TURNS, lambda games: games.random_actions(actions))
+    simulated = games.stats()
+    scalar = play_scalar_games(GAMES, TURNS, list(actions), SEED)
+
+    # Within 5 standard errors, which the two should always manage if the rules agree
+    spreads = {
+        "alive": 1.0, "rusty key": 1.0, "crucifix": 1.0,
+        "lives": float(games.lives.std()), "sanity": float(games.sanity.std()),
+        "turns": float(games.turn_count.std()),
+    }
+    for name, value in simulated.items():
+        tolerance = 5 * max(spreads[name], 0.5) / GAMES ** 0.5
+        assert abs(value - scalar[name]) <= tolerance, (name, value, scalar[name])